@@ -86,6 +86,8 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    # Full text search lookups (SearchVector, SearchQuery, SearchRank)
+    'django.contrib.postgres',
     'corsheaders',
     'rest_framework',
     'djoser',
@@ -221,8 +223,20 @@ REST_FRAMEWORK = {
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     # # Apply pagination globally to all views. Pagination by Limit Offset
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination'
+    # JWTAuthentication with cached token claims and users (core/authentication.py)
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
+    ),
+    # orjson based JSON, same output as the DRF defaults.
+    # Plain DRF JSON if orjson is not installed (core/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated'
@@ -263,17 +277,39 @@ SIMPLE_JWT = {
 # you are telling Celery to connect to and use Redis database 1 instead of 
 # the default database 0.
 CELERY_BROKER_URL = 'redis://localhost:6379/1'
+# Chords (demo.tasks.notify_customers) need a result backend
+CELERY_RESULT_BACKEND = 'redis://localhost:6379/1'
 # To schedule automated tasks 
 CELERY_BEAT_SCHEDULE = {
     'notify_customers': {
         'task': 'demo.tasks.notify_customers',
-        'schedule': 5, # Every 5 seconds
+        # 'schedule': 5, # Every 5 seconds
         # 'schedule': 15 * 60 # For 15 minutes
-        # 'schedule': crontab(day_of_week='1', hour='7', minute='3') # Every monday at 7:03 a.m.
+        'schedule': crontab(day_of_week='1', hour='7', minute='3'), # Every monday at 7:03 a.m.
         # 'schedule': crontab(minute='*/15') # Every 15 minutes
         'args': ['Hello World'], # For arguments
         'kwargs': {} # For kwargs
-    }
+    },
+    'release_expired_stock': {
+        'task': 'store.tasks.release_expired_stock',
+        'schedule': 60, # Every minute
+    },
+    'drain_outbox': {
+        'task': 'store.tasks.drain_outbox',
+        'schedule': 60, # Every minute
+    },
+    'reconcile_products_count': {
+        'task': 'store.tasks.reconcile_products_count',
+        'schedule': crontab(minute='17'), # Every hour
+    },
+    'flush_like_counts': {
+        'task': 'likes.tasks.flush_like_counts',
+        'schedule': 10, # Every 10 seconds
+    },
+    'refresh_popularity': {
+        'task': 'store.tasks.refresh_popularity',
+        'schedule': 10 * 60, # Every 10 minutes
+    },
 }
 
 
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import threading
+import time
+from base64 import urlsafe_b64decode
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+
+from store.models import Customer
+
+
+# Cached JWT authentication -------------------------------------------
+# JWTAuthentication verifies the token and loads the user on every request,
+# the store views then load the customer of the user. Both are cached:
+#
+#   auth:token:<jti>   claims of a verified token, until it expires
+#   auth:user:<id>     user + customer fields, dropped on User/Customer
+#                      save and delete (core/signals/handlers.py)
+#
+# Two levels: a small LRU in the process, then Redis. The LRU of other
+# processes can't be invalidated, so its entries live LOCAL_TTL seconds.
+# That is how long a deactivated user can still be served by a worker
+# that just saw them, Redis entries are deleted right away.
+#
+# request.user is built from the cached fields with Model.from_db(), the
+# other fields are deferred (save() only writes the loaded ones). The
+# customer is attached to the user.customer_id accessor, reading it runs
+# no query.
+
+LOCAL_SIZE = 4096
+LOCAL_TTL = 5
+USER_TTL = 5 * 60
+
+USER_FIELDS = ['id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser']
+CUSTOMER_FIELDS = ['id', 'user_id', 'phone', 'birth_date', 'membership']
+
+
+class LocalLRU:
+    '''Thread safe LRU with a time to live, for one process.'''
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+local_cache = LocalLRU(LOCAL_SIZE, LOCAL_TTL)
+
+
+def cache_get(key):
+    value = local_cache.get(key)
+    if value is None:
+        value = cache.get(key)
+        if value is not None:
+            local_cache.set(key, value)
+    return value
+
+
+def cache_set(key, value, timeout):
+    local_cache.set(key, value, timeout)
+    cache.set(key, value, timeout)
+
+
+def token_key(jti):
+    return f'auth:token:{jti}'
+
+
+def user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def invalidate_user(user_id):
+    local_cache.delete(user_key(user_id))
+    cache.delete(user_key(user_id))
+
+
+def unverified_claims(raw_token):
+    '''Payload of the token without checking the signature, None if it
+    is not a JWT. Only used to find the cache entry of the token.'''
+    try:
+        payload = raw_token.split(b'.')[1]
+        return json.loads(urlsafe_b64decode(payload + b'=' * (-len(payload) % 4)))
+    except (IndexError, ValueError, TypeError):
+        return None
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_validated_token(self, raw_token):
+        claims = unverified_claims(raw_token)
+        jti = claims.get(api_settings.JTI_CLAIM) if isinstance(claims, dict) else None
+        if jti is None:
+            return super().get_validated_token(raw_token)
+
+        digest = hashlib.sha256(raw_token).hexdigest()
+        entry = cache_get(token_key(jti))
+        # Same bytes as the token verified before and not expired yet
+        if entry is not None and entry['digest'] == digest and entry['exp'] > time.time():
+            return UntypedToken(raw_token, verify=False)
+
+        token = super().get_validated_token(raw_token)
+        timeout = int(token['exp'] - time.time())
+        if timeout > 0:
+            cache_set(token_key(jti), {'digest': digest, 'exp': token['exp']}, timeout)
+        return token
+
+    def get_user(self, validated_token):
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            return super().get_user(validated_token)
+
+        projection = cache_get(user_key(user_id))
+        if projection is None:
+            projection = self.load_projection(user_id)
+            cache_set(user_key(user_id), projection, USER_TTL)
+        return self.build_user(projection)
+
+    def load_projection(self, user_id):
+        '''User and customer fields, with one query.'''
+        User = get_user_model()
+        row = User.objects \
+            .filter(**{api_settings.USER_ID_FIELD: user_id}) \
+            .values(*USER_FIELDS, *[f'customer_id__{name}' for name in CUSTOMER_FIELDS]) \
+            .first()
+        if row is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        customer = None
+        if row['customer_id__id'] is not None:
+            customer = [row[f'customer_id__{name}'] for name in CUSTOMER_FIELDS]
+        return {'user': [row[name] for name in USER_FIELDS], 'customer': customer}
+
+    def build_user(self, projection):
+        User = get_user_model()
+        user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, projection['user'])
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        customer = None
+        if projection['customer'] is not None:
+            customer = Customer.from_db(DEFAULT_DB_ALIAS, CUSTOMER_FIELDS, projection['customer'])
+        # user.customer_id (reverse one to one) and customer.user
+        user_field = Customer._meta.get_field('user')
+        user_field.remote_field.set_cached_value(user, customer)
+        if customer is not None:
+            user_field.set_cached_value(customer, user)
+        return user
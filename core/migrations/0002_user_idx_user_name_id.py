@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['first_name', 'last_name', 'id'], name='idx_user_name_id'),
+        ),
+    ]
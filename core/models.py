@@ -4,5 +4,11 @@ from django.contrib.auth.models import AbstractUser
 # Create your models here.
 
 class User(AbstractUser):
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # store.Customer is ordered by user__first_name, user__last_name
+            models.Index(fields=['first_name', 'last_name', 'id'], name='idx_user_name_id'),
+        ]
+    
     email = models.EmailField(unique=True)
  
\ No newline at end of file
@@ -0,0 +1,34 @@
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from .renderers import ORJSONRenderer, orjson
+
+
+# orjson reads integers over 64 bits as floats, json keeps them exact.
+# Bodies with a run of 19+ digits go to json (false positives are only
+# slower). translate() + "in" run in C, a regex would cost more than orjson.
+DIGITS = bytes(ord('0') if byte in b'0123456789' else ord(' ') for byte in range(256))
+LONG_NUMBER = b'0' * 19
+
+
+# JSON parser on orjson, falls back to DRF's JSONParser for non UTF-8
+# bodies, long numbers and everything orjson rejects (invalid JSON, NaN),
+# so error messages and edge cases stay the same.
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+    
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        
+        body = stream.read()
+        if LONG_NUMBER in body.translate(DIGITS):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
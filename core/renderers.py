@@ -0,0 +1,90 @@
+import csv
+import io
+import math
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+# Optional dependency: $ pip install orjson
+# Without it the renderer is the plain DRF JSONRenderer.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON renderer on orjson ---------------------------------------------
+# Renders the same bytes as DRF's JSONRenderer with the project settings
+# (COMPACT_JSON, UNICODE_JSON, STRICT_JSON, COERCE_DECIMAL_TO_STRING=False):
+#   - compact separators, UTF-8 instead of \uXXXX escapes
+#   - \u2028 and \u2029 escaped, like DRF does
+#   - Decimal as a JSON number with the digits of float(value)
+# except for floats, which orjson writes itself: the same shortest digits
+# as repr(), but its own exponent format (1e20 where json.dumps writes
+# 1e+20), and NaN/Infinity as null where STRICT_JSON raises. The values are the same for any JSON parser. orjson
+# has no hook for floats, matching repr() would mean copying every
+# response in Python, which costs more than JSONRenderer itself.
+#   - datetime and everything orjson doesn't know go through DRF's
+#     JSONEncoder.default (datetimes end with "Z", lazy strings, ...)
+# Anything else (indent=N, the browsable API, non compact settings,
+# integers over 64 bits) is rendered by JSONRenderer itself.
+class ORJSONRenderer(JSONRenderer):
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if indent is not None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        
+        encoder = self.encoder_class()
+        
+        def default(obj):
+            if isinstance(obj, Decimal):
+                # json.dumps writes floats with repr(), orjson has its own
+                # float formatting. A fragment keeps the bytes identical.
+                value = float(obj)
+                if not math.isfinite(value):
+                    raise ValueError('Out of range float values are not JSON compliant')
+                return orjson.Fragment(repr(value))
+            return encoder.default(obj)
+        
+        try:
+            ret = orjson.dumps(
+                data, default=default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+# Export renderers ----------------------------------------------------
+# The export endpoints stream their rows themselves (store/export.py),
+# these classes are only used for content negotiation (?format=csv,
+# Accept: text/csv) and to render error responses.
+class NDJSONRenderer(ORJSONRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(data.keys())
+        writer.writerow(data.values())
+        return buffer.getvalue().encode(self.charset)
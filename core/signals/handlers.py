@@ -1,11 +1,29 @@
 
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver 
 
+from core.authentication import invalidate_user
+from store.models import Customer
 from store.signals import order_created
 # from store.serializers import CreateOrderSerializer
 
 
 
+# Runs in the Celery worker after the order is committed (store/outbox.py)
 @receiver(order_created)
 def on_order_created(sender, **kwargs):
-    print(f'\n\nSIGNAL order_created received\n{kwargs['order'] = }\n\n') 
\ No newline at end of file
+    print(f'\n\nSIGNAL order_created received\n{kwargs['order'] = }\n\n')
+
+
+# Cached users of CachedJWTAuthentication (core/authentication.py)
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def invalidate_cached_customer(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
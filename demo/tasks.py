@@ -1,4 +1,19 @@
-from time import sleep
+import logging
+import time
+import uuid
+
+from django.core.cache import cache
+from django.core.mail import get_connection, send_mass_mail
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from celery import chord, shared_task
+
+from store.models import Customer
+
+
+logger = logging.getLogger(__name__)
+
 
 # # Common approach - High Coupling
 # from config.celery import celery
@@ -13,12 +28,207 @@ from time import sleep
     
 # Better approach with low coupling -------------
 
-from celery import shared_task 
+# Bulk notification pipeline:
+#
+#   notify_customers        takes the lock, splits customers into pk ranges
+#     -> send_batch x N     (celery group) one SMTP connection per batch
+#     -> finish_notification (chord callback) marks the run done, releases the lock
+#        notification_failed (errback of the callback) if the chord fails,
+#        marks the run failed and releases the lock
+#
+# All workers share one token bucket in Redis, so the SMTP server never
+# gets more than NOTIFY_RATE emails per second, however many workers run.
+# Progress of a run: get_progress(run_id)
+
+NOTIFY_BATCH_SIZE = 500
+# Emails per second and the biggest burst
+NOTIFY_RATE = 50
+NOTIFY_BURST = 100
+# Safety net, the lock expires even if the chord callback never runs
+NOTIFY_LOCK_TIMEOUT = 60 * 60
+PROGRESS_TIMEOUT = 24 * 60 * 60
+
+LOCK_KEY = 'demo:notify:lock'
+BUCKET_KEY = 'demo:notify:bucket'
+
+
+def progress_key(run_id, name):
+    return f'demo:notify:{run_id}:{name}'
+
+
+def get_progress(run_id):
+    names = ['status', 'total', 'batches', 'batches_done', 'sent', 'failed']
+    values = cache.get_many([progress_key(run_id, name) for name in names])
+    return {name: values.get(progress_key(run_id, name)) for name in names}
+
+
+def customer_ranges(batch_size):
+    '''Yields (after_pk, last_pk) ranges of at most batch_size customers.
+
+    Keyset walk over the primary key, only ids are loaded.'''
+    last_pk = 0
+    while True:
+        pks = list(
+            Customer.objects
+            .filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return
+        yield last_pk, pks[-1]
+        last_pk = pks[-1]
+
+
+# Token bucket ----------
+# Refill and take happen in one Lua script, so concurrent workers can't
+# take the same tokens. Redis TIME is used, worker clocks don't matter.
+TOKEN_BUCKET_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+'''
+
+
+def take_tokens(count):
+    '''Blocks until `count` emails may be sent (count <= NOTIFY_BURST).'''
+    redis = get_redis_connection('default')
+    while True:
+        wait = float(redis.eval(TOKEN_BUCKET_SCRIPT, 1, BUCKET_KEY, NOTIFY_RATE, NOTIFY_BURST, count))
+        if not wait:
+            return
+        time.sleep(wait)
+
+
+# Lock ----------
+# A plain Redis key holding the run id. Only the run that holds the lock may
+# release it, compare and delete happen in one Lua script, otherwise a run
+# whose lock expired could delete the lock of the next run.
+RELEASE_LOCK_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+
+
+def acquire_lock(run_id):
+    redis = get_redis_connection('default')
+    return bool(redis.set(LOCK_KEY, run_id, nx=True, ex=NOTIFY_LOCK_TIMEOUT))
+
+
+def release_lock(run_id):
+    redis = get_redis_connection('default')
+    return bool(redis.eval(RELEASE_LOCK_SCRIPT, 1, LOCK_KEY, run_id))
+
+
+def lock_holder():
+    holder = get_redis_connection('default').get(LOCK_KEY)
+    return holder.decode() if holder is not None else None
+
+
+# Tasks ----------
+
+@shared_task
+def notify_customers(message, subject='News from the store', batch_size=NOTIFY_BATCH_SIZE):
+    run_id = uuid.uuid4().hex
+    # Beat may fire again before the previous run is done
+    if not acquire_lock(run_id):
+        logger.info('notify_customers is already running (%s), skipped', lock_holder())
+        return None
+    
+    try:
+        batches = [
+            send_batch.s(run_id, subject, message, after_pk, last_pk)
+            for after_pk, last_pk in customer_ranges(batch_size)
+        ]
+        cache.set_many({
+            progress_key(run_id, 'status'): 'running',
+            progress_key(run_id, 'total'): Customer.objects.count(),
+            progress_key(run_id, 'batches'): len(batches),
+            progress_key(run_id, 'batches_done'): 0,
+            progress_key(run_id, 'sent'): 0,
+            progress_key(run_id, 'failed'): 0,
+        }, PROGRESS_TIMEOUT)
+        if not batches:
+            finish_notification([], run_id)
+            return run_id
+        chord(batches)(finish_notification.s(run_id).on_error(notification_failed.s(run_id)))
+    except Exception:
+        release_lock(run_id)
+        raise
+    return run_id
+
+
+@shared_task
+def send_batch(run_id, subject, message, after_pk, last_pk):
+    emails = list(
+        Customer.objects
+        .filter(pk__gt=after_pk, pk__lte=last_pk)
+        .exclude(user__email='')
+        .values_list('user__email', flat=True)
+    )
+    sent = 0
+    # One SMTP connection for the whole batch instead of one per email
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception:
+        # Like a failed chunk, the chord must go on
+        logger.exception('Could not connect to send %s notification emails', len(emails))
+        if emails:
+            cache.incr(progress_key(run_id, 'failed'), len(emails))
+        cache.incr(progress_key(run_id, 'batches_done'))
+        return 0
+    try:
+        for start in range(0, len(emails), NOTIFY_BURST):
+            chunk = emails[start:start + NOTIFY_BURST]
+            take_tokens(len(chunk))
+            datatuple = [(subject, message, settings.DEFAULT_FROM_EMAIL, [email]) for email in chunk]
+            try:
+                count = send_mass_mail(datatuple, connection=connection)
+            except Exception:
+                # A failed chunk must not stop the chord, it is only counted
+                logger.exception('Could not send %s notification emails', len(chunk))
+                cache.incr(progress_key(run_id, 'failed'), len(chunk))
+                continue
+            sent += count
+            cache.incr(progress_key(run_id, 'sent'), count)
+    finally:
+        connection.close()
+    
+    cache.incr(progress_key(run_id, 'batches_done'))
+    return sent
+
+
+@shared_task
+def finish_notification(results, run_id):
+    cache.set(progress_key(run_id, 'status'), 'done', PROGRESS_TIMEOUT)
+    release_lock(run_id)
+    logger.info('notify_customers %s sent %s emails', run_id, sum(results))
 
 
 @shared_task
-def notify_customers(message):
-    print(f'\nSending 10k emails...\n')
-    print(f'\n{message = }\n')
-    sleep(4)
-    print('Emails were successfully sent!')
\ No newline at end of file
+def notification_failed(request, exc, traceback, run_id):
+    # Errback of finish_notification, the chord failed and it never runs.
+    # Without it the lock would be held until NOTIFY_LOCK_TIMEOUT.
+    cache.set(progress_key(run_id, 'status'), 'failed', PROGRESS_TIMEOUT)
+    release_lock(run_id)
+    logger.error('notify_customers %s failed: %r', run_id, exc)
@@ -0,0 +1,176 @@
+import random
+from collections import defaultdict
+
+from django.db.models import Count
+from django_redis import get_redis_connection
+
+from .models import LikeCount, LikedItems
+
+
+# Like counters -------------------------------------------------------
+# A like is one row in LikedItems, which never contends with other likes.
+# The count of an object is not a COUNT(*) and not one hot row, it is
+#
+#   total + shard 0 + ... + shard N-1
+#
+#   likes:<ct>:<id>:total   count at the last flush (LikeCount.count)
+#   likes:<ct>:<id>:<n>     +1/-1 of the likes since then, a like goes to
+#                           a random shard, so a popular object is spread
+#                           over SHARDS keys (and over the nodes of a
+#                           Redis cluster) instead of one
+#   likes:dirty             set of "<ct>:<id>" changed since the last flush
+#   likes:user:<id>         version of the likes of a user, bumped by every
+#                           like and unlike (ETags of personalized responses)
+#
+# All keys of a page are read with one MGET. flush() (Celery beat,
+# likes.tasks.flush_like_counts) recounts the dirty objects from
+# LikedItems, writes LikeCount and moves the counted part of the shards
+# into the total. The recount makes it self healing: a lost Redis only
+# loses the shards, the next like of the object brings it back in sync.
+
+SHARDS = 8
+FLUSH_BATCH = 500
+DIRTY_KEY = 'likes:dirty'
+
+
+def redis():
+    return get_redis_connection('default')
+
+
+def shard_keys(content_type_id, object_id):
+    return [f'likes:{content_type_id}:{object_id}:{shard}' for shard in range(SHARDS)]
+
+
+def total_key(content_type_id, object_id):
+    return f'likes:{content_type_id}:{object_id}:total'
+
+
+def user_key(user_id):
+    return f'likes:user:{user_id}'
+
+
+def add(content_type_id, object_id, delta, user_id=None):
+    '''+1 for a like, -1 for an unlike. One round trip.'''
+    pipe = redis().pipeline(transaction=False)
+    pipe.incrby(random.choice(shard_keys(content_type_id, object_id)), delta)
+    pipe.sadd(DIRTY_KEY, f'{content_type_id}:{object_id}')
+    if user_id is not None:
+        pipe.incr(user_key(user_id))
+    pipe.execute()
+
+
+def user_version(user_id):
+    return int(redis().get(user_key(user_id)) or 0)
+
+
+def mark_dirty(content_type_id, object_ids):
+    '''Recount at the next flush, for likes removed without unlike().'''
+    if object_ids:
+        redis().sadd(DIRTY_KEY, *[f'{content_type_id}:{object_id}' for object_id in object_ids])
+
+
+def get_counts(content_type_id, object_ids):
+    '''{object id: likes} with one MGET. Totals not in Redis yet are read
+    from LikeCount with one query and kept for the next reads.'''
+    object_ids = list(dict.fromkeys(object_ids))
+    if not object_ids:
+        return {}
+
+    keys = []
+    for object_id in object_ids:
+        keys.append(total_key(content_type_id, object_id))
+        keys += shard_keys(content_type_id, object_id)
+    values = redis().mget(keys)
+
+    totals, deltas, missing = {}, {}, []
+    width = SHARDS + 1
+    for index, object_id in enumerate(object_ids):
+        total, *shards = values[index * width:(index + 1) * width]
+        deltas[object_id] = sum(int(value) for value in shards if value is not None)
+        if total is None:
+            missing.append(object_id)
+        else:
+            totals[object_id] = int(total)
+
+    if missing:
+        stored = dict(
+            LikeCount.objects
+            .filter(content_type_id=content_type_id, object_id__in=missing)
+            .values_list('object_id', 'count')
+        )
+        pipe = redis().pipeline(transaction=False)
+        for object_id in missing:
+            totals[object_id] = stored.get(object_id, 0)
+            # nx: a flush may have written a newer total meanwhile
+            pipe.set(total_key(content_type_id, object_id), totals[object_id], nx=True)
+        pipe.execute()
+
+    return {object_id: max(totals[object_id] + deltas[object_id], 0) for object_id in object_ids}
+
+
+def recount(objects):
+    '''{(content type id, object id): likes} from LikedItems, one query per content type.'''
+    ids_by_type = defaultdict(list)
+    for content_type_id, object_id in objects:
+        ids_by_type[content_type_id].append(object_id)
+
+    counts = {}
+    for content_type_id, object_ids in ids_by_type.items():
+        rows = LikedItems.objects \
+            .filter(content_type_id=content_type_id, object_id__in=object_ids) \
+            .values('object_id') \
+            .annotate(count=Count('id')) \
+            .values_list('object_id', 'count')
+        counts.update({(content_type_id, object_id): count for object_id, count in rows})
+    return counts
+
+
+def flush(batch_size=FLUSH_BATCH):
+    '''Writes the counts of the dirty objects to LikeCount. Returns how
+    many objects were flushed.'''
+    connection = redis()
+    flushed = 0
+    while True:
+        members = connection.spop(DIRTY_KEY, batch_size)
+        if not members:
+            return flushed
+        try:
+            flush_objects([tuple(map(int, member.decode().split(':'))) for member in members])
+        except Exception:
+            # Flushed again next time
+            connection.sadd(DIRTY_KEY, *members)
+            raise
+        flushed += len(members)
+        if len(members) < batch_size:
+            return flushed
+
+
+def flush_objects(objects):
+    connection = redis()
+    # Shards are read before the recount. A like counted by the recount
+    # but added to a shard after this read stays in the shard for one
+    # flush, it marked the object dirty again and the next flush fixes it.
+    pipe = connection.pipeline(transaction=False)
+    for content_type_id, object_id in objects:
+        pipe.mget(shard_keys(content_type_id, object_id))
+    shards = [[int(value or 0) for value in values] for values in pipe.execute()]
+
+    counts = recount(objects)
+    LikeCount.objects.bulk_create(
+        [
+            LikeCount(content_type_id=content_type_id, object_id=object_id,
+                      count=counts.get((content_type_id, object_id), 0))
+            for content_type_id, object_id in objects
+        ],
+        update_conflicts=True,
+        unique_fields=['content_type', 'object_id'],
+        update_fields=['count', 'updated_at'],
+    )
+
+    pipe = connection.pipeline(transaction=False)
+    for (content_type_id, object_id), values in zip(objects, shards):
+        pipe.set(total_key(content_type_id, object_id), counts.get((content_type_id, object_id), 0))
+        for key, value in zip(shard_keys(content_type_id, object_id), values):
+            if value:
+                pipe.decrby(key, value)
+    pipe.execute()
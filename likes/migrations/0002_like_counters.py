@@ -0,0 +1,58 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('likes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Duplicate likes have to go before the unique constraint
+        migrations.RunSQL(
+            sql='''
+                DELETE FROM likes_likeditems a
+                USING likes_likeditems b
+                WHERE a.user_id = b.user_id
+                  AND a.content_type_id = b.content_type_id
+                  AND a.object_id = b.object_id
+                  AND a.id > b.id
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='likeditems',
+            constraint=models.UniqueConstraint(fields=('user', 'content_type', 'object_id'), name='unique_liked_item'),
+        ),
+        migrations.AddIndex(
+            model_name='likeditems',
+            index=models.Index(fields=['content_type', 'object_id'], name='idx_likeditems_object'),
+        ),
+        migrations.CreateModel(
+            name='LikeCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id'), name='unique_like_count')],
+            },
+        ),
+        # Counts of the existing likes
+        migrations.RunSQL(
+            sql='''
+                INSERT INTO likes_likecount (content_type_id, object_id, count, updated_at)
+                SELECT content_type_id, object_id, COUNT(*), NOW()
+                FROM likes_likeditems
+                GROUP BY content_type_id, object_id
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
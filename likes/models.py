@@ -1,12 +1,74 @@
 from django.conf import settings
-from django.db import models
+from django.db import connection, models
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 
 # Create your models here.
 
+class LikedItemsManager(models.Manager):
+    def like(self, user_id: int, content_type: ContentType, object_id: int) -> bool:
+        '''Likes the object in one statement, True if the like is new.
+
+        Liking twice is a no-op thanks to the unique (user, content_type,
+        object_id) constraint, concurrent requests never create duplicates.'''
+        meta = self.model._meta
+        qn = connection.ops.quote_name
+        columns = [qn(meta.get_field(name).column) for name in ('user', 'content_type', 'object_id')]
+        sql = f'''
+            INSERT INTO {qn(meta.db_table)} ({', '.join(columns)})
+            VALUES (%s, %s, %s)
+            ON CONFLICT ({', '.join(columns)}) DO NOTHING
+            RETURNING {qn(meta.pk.column)}
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user_id, content_type.pk, object_id])
+            return cursor.fetchone() is not None
+
+    def unlike(self, user_id: int, content_type: ContentType, object_id: int) -> bool:
+        '''True if there was a like to remove.'''
+        deleted, _ = self.filter(user_id=user_id, content_type=content_type, object_id=object_id).delete()
+        return deleted > 0
+
+    def liked_ids(self, user_id: int, obj_type: models.Model, obj_ids) -> set:
+        '''Ids of the objects the user likes among obj_ids, one query on
+        the (user, content_type, object_id) unique index.'''
+        obj_ids = list(obj_ids)
+        if not obj_ids:
+            return set()
+        content_type = ContentType.objects.get_for_model(obj_type)
+        return set(
+            self.filter(user_id=user_id, content_type=content_type, object_id__in=obj_ids)
+            .values_list('object_id', flat=True)
+        )
+
+
 class LikedItems(models.Model):
+    objects = LikedItemsManager()
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
+
+    class Meta:
+        constraints = [
+            # One like per user and object, LikedItemsManager.like() relies on it
+            models.UniqueConstraint(fields=['user', 'content_type', 'object_id'], name='unique_liked_item'),
+        ]
+        indexes = [
+            # Recount of an object by likes.counters.flush()
+            models.Index(fields=['content_type', 'object_id'], name='idx_likeditems_object'),
+        ]
+
+
+class LikeCount(models.Model):
+    '''Likes of an object, written by likes.counters.flush() only.'''
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'], name='unique_like_count'),
+        ]
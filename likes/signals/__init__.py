@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after the commit of a like (delta=1) or an unlike (delta=-1),
+# with content_type_id and object_id
+like_changed = Signal()
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from likes import counters
+from likes.models import LikedItems
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def recount_likes_of_deleted_user(sender, instance, **kwargs):
+    # Likes deleted by CASCADE never go through unlike(), the liked objects
+    # are recounted by the next flush instead
+    liked = LikedItems.objects \
+        .filter(user_id=instance.pk) \
+        .values_list('content_type_id', 'object_id')
+    object_ids = {}
+    for content_type_id, object_id in liked:
+        object_ids.setdefault(content_type_id, []).append(object_id)
+
+    def mark_dirty():
+        for content_type_id, ids in object_ids.items():
+            counters.mark_dirty(content_type_id, ids)
+
+    if object_ids:
+        transaction.on_commit(mark_dirty)
@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from . import counters
+
+
+@shared_task
+def flush_like_counts():
+    # Redis like counters into LikeCount (likes/counters.py)
+    return counters.flush()
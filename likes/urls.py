@@ -1,4 +1,9 @@
 from django.urls import path, include
 
+from . import views
 
-urlpatterns = []
+# <model> is "<app_label>.<model>", e.g. /likes/store.product/1/
+urlpatterns = [
+    path('<str:model>/', views.LikeCountsView.as_view(), name='like-counts'),
+    path('<str:model>/<int:object_id>/', views.LikeView.as_view(), name='like'),
+]
@@ -1,3 +1,85 @@
-from django.shortcuts import render
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.http import Http404
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from . import counters
+from .models import LikedItems
+from .signals import like_changed
+
+
+# Likes of any model --------------------------------------------------
+#   GET    /likes/store.product/?ids=1,2,3   counts of many objects
+#   GET    /likes/store.product/1/           count, liked by the user
+#   POST   /likes/store.product/1/           like, 201 or 200 if liked already
+#   DELETE /likes/store.product/1/           unlike
+#
+# Counts come from Redis (likes/counters.py), a like or unlike is one
+# statement on LikedItems plus one Redis round trip after the commit.
+
+MAX_IDS = 100
+
+
+def get_content_type(model):
+    try:
+        app_label, model_name = model.lower().split('.')
+        return ContentType.objects.get_by_natural_key(app_label, model_name)
+    except (ValueError, ContentType.DoesNotExist):
+        raise Http404
+
+
+class LikeCountsView(APIView):
+
+    def get(self, request, model):
+        content_type = get_content_type(model)
+        try:
+            ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            raise ValidationError({'ids': 'Comma separated object ids.'})
+        if len(ids) > MAX_IDS:
+            raise ValidationError({'ids': f'At most {MAX_IDS} ids.'})
+        counts = counters.get_counts(content_type.pk, ids)
+        return Response([{'object_id': object_id, 'count': count} for object_id, count in counts.items()])
+
+
+class LikeView(APIView):
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get(self, request, model, object_id):
+        content_type = get_content_type(model)
+        liked = request.user.is_authenticated and LikedItems.objects \
+            .filter(user_id=request.user.id, content_type=content_type, object_id=object_id) \
+            .exists()
+        return Response(self.get_data(content_type, object_id, liked))
+
+    def post(self, request, model, object_id):
+        content_type = get_content_type(model)
+        model_class = content_type.model_class()
+        if model_class is None or not model_class._default_manager.filter(pk=object_id).exists():
+            raise Http404
+        created = LikedItems.objects.like(request.user.id, content_type, object_id)
+        if created:
+            transaction.on_commit(lambda: self.count(request, content_type, object_id, 1))
+        return Response(
+            self.get_data(content_type, object_id, True),
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    def delete(self, request, model, object_id):
+        content_type = get_content_type(model)
+        if LikedItems.objects.unlike(request.user.id, content_type, object_id):
+            transaction.on_commit(lambda: self.count(request, content_type, object_id, -1))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def count(self, request, content_type, object_id, delta):
+        counters.add(content_type.pk, object_id, delta, request.user.id)
+        like_changed.send(type(self), content_type_id=content_type.pk, object_id=object_id, delta=delta)
+
+    @staticmethod
+    def get_data(content_type, object_id, liked):
+        count = counters.get_counts(content_type.pk, [object_id])[object_id]
+        return {'object_id': object_id, 'count': count, 'liked': liked}
@@ -7,6 +7,7 @@ from django.utils.http import urlencode
 from django.urls import reverse
 
 from . import models
+from .cache import invalidate_products
 from tags.models import TaggedItem
 
 # Filters 
@@ -51,14 +52,8 @@ class CollectionAdmin(admin.ModelAdmin):
     list_display = ['id', 'title', 'products_count']
     search_fields = ['title']
     
-    # Override parent class method
-    # to get needed results
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        queryset = queryset.annotate(
-            products_count = Count('products')
-        )
-        return queryset
+    # products_count is a column maintained by triggers,
+    # get_queryset doesn't need Count('products') anymore
     
     @admin.display(ordering='products_count')
     def products_count(self, collection):
@@ -119,7 +114,13 @@ class ProductAdmin(admin.ModelAdmin):
     
     @admin.action(description='Clear inventory')
     def clear_inventory(self, request, queryset):
+        # .update() does not send post_save, so the product cache is invalidated here
+        rows = list(queryset.values_list('id', 'collection_id'))
         updated_count = queryset.update(inventory=0)
+        invalidate_products(
+            product_ids=[product_id for product_id, _ in rows],
+            collection_ids=[collection_id for _, collection_id in rows]
+        )
         self.message_user(
             request,
             f'{updated_count} products were successfully updated.',
@@ -201,7 +202,7 @@ class OrderAdmin(admin.ModelAdmin):
         queryset = super().get_queryset(request)
         queryset = queryset.annotate(
             total_price=Sum(
-                F('orderitem__unit_price') * F('orderitem__quantity'),
+                F('items__unit_price') * F('items__quantity'),
                 output_field=DecimalField()
             )
         )
@@ -0,0 +1,174 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+
+# Bulk writes ---------------------------------------------------------
+#   POST   <list url>/bulk/   [{...}, {...}]             create
+#   PATCH  <list url>/bulk/   [{"id": 1, ...}, {...}]    partial update
+#   DELETE <list url>/bulk/   [1, 2, 3]                  delete
+#
+# All items are validated together. Related objects are loaded with one
+# IN query per field instead of one query per item. If any item fails,
+# nothing is written and the 400 response holds one error object per
+# item, in the order of the request ({} for the valid ones). Otherwise
+# everything is written with bulk_create/bulk_update in one transaction.
+
+MAX_BULK_ITEMS = 1000
+
+
+def parse_pk(model, value):
+    '''Primary key in its Python type, None if value is not a valid one.'''
+    if isinstance(value, bool):
+        return None
+    try:
+        return model._meta.pk.to_python(value)
+    except (DjangoValidationError, TypeError, ValueError):
+        return None
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    '''Reads the related object from the ones BulkListSerializer loaded
+    in advance. Single object requests run the usual query.'''
+
+    def to_internal_value(self, data):
+        loaded = getattr(self.root, 'related_objects', {}).get(self.field_name)
+        if loaded is None:
+            return super().to_internal_value(data)
+        pk = parse_pk(self.get_queryset().model, data)
+        if pk is None:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return loaded[pk]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class BulkListSerializer(serializers.ListSerializer):
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('allow_empty', False)
+        kwargs.setdefault('max_length', MAX_BULK_ITEMS)
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.related_objects = self.load_related_objects(data)
+        return super().to_internal_value(data)
+
+    def load_related_objects(self, data):
+        related_objects = {}
+        for name, field in self.child.fields.items():
+            if not isinstance(field, BulkPrimaryKeyRelatedField) or field.read_only:
+                continue
+            queryset = field.get_queryset()
+            pks = {parse_pk(queryset.model, item[name]) for item in data if isinstance(item, dict) and name in item}
+            pks.discard(None)
+            related_objects[name] = queryset.in_bulk(pks)
+        return related_objects
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        return model._default_manager.bulk_create([model(**attrs) for attrs in validated_data])
+
+    def update(self, instances, validated_data):
+        model = self.child.Meta.model
+        fields = set()
+        for instance, attrs in zip(instances, validated_data):
+            for name, value in attrs.items():
+                setattr(instance, name, value)
+            fields.update(attrs)
+        if not fields:
+            return instances
+        # auto_now fields are set by save(), bulk_update doesn't call it
+        now = timezone.now()
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False):
+                fields.add(field.name)
+                for instance in instances:
+                    setattr(instance, field.attname, now)
+        model._default_manager.bulk_update(instances, fields)
+        return instances
+
+
+class BulkModelMixin:
+    '''View mixin, adds POST/PATCH/DELETE <list url>/bulk/. The serializer
+    needs Meta.list_serializer_class = BulkListSerializer (or a subclass).'''
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        if request.method == 'POST':
+            return self.bulk_create(request)
+        if request.method == 'PATCH':
+            return self.bulk_update(request)
+        return self.bulk_destroy(request)
+
+    def bulk_create(self, request):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            self.perform_bulk_save(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, request):
+        data = self.check_list(request.data)
+        pks = [item.get('id') if isinstance(item, dict) else None for item in data]
+        instances = self.get_bulk_instances(pks)
+        serializer = self.get_serializer(instances, data=data, many=True, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            self.perform_bulk_save(serializer)
+        return Response(serializer.data)
+
+    def bulk_destroy(self, request):
+        instances = self.get_bulk_instances(self.check_list(request.data))
+        errors = self.get_bulk_destroy_errors(instances)
+        if errors:
+            raise serializers.ValidationError([
+                {'id': [errors[instance.pk]]} if instance.pk in errors else {}
+                for instance in instances
+            ])
+        with transaction.atomic():
+            self.get_queryset().filter(pk__in=[instance.pk for instance in instances]).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def check_list(self, data):
+        if not isinstance(data, list) or not data:
+            raise serializers.ValidationError({'non_field_errors': ['Expected a non empty list of items.']})
+        if len(data) > MAX_BULK_ITEMS:
+            raise serializers.ValidationError(
+                {'non_field_errors': [f'Ensure this field has no more than {MAX_BULK_ITEMS} elements.']}
+            )
+        return data
+
+    def get_bulk_instances(self, pks):
+        '''Instances in the order of pks, loaded with one query from the
+        queryset of the view, so the usual scoping applies.'''
+        model = self.get_queryset().model
+        parsed = [parse_pk(model, pk) for pk in pks]
+        found = self.get_queryset().in_bulk({pk for pk in parsed if pk is not None})
+
+        errors, seen = [], set()
+        for pk in parsed:
+            if pk is None:
+                errors.append({'id': ['A valid id is required.']})
+            elif pk not in found:
+                errors.append({'id': [f'Invalid pk "{pk}" - object does not exist.']})
+            elif pk in seen:
+                errors.append({'id': ['Duplicate id.']})
+            else:
+                errors.append({})
+            seen.add(pk)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return [found[pk] for pk in parsed]
+
+    def perform_bulk_save(self, serializer):
+        serializer.save()
+
+    def get_bulk_destroy_errors(self, instances):
+        '''{pk: message} for the instances that can not be deleted.'''
+        return {}
@@ -0,0 +1,133 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+
+# Versioned read-through cache for the product endpoints --------------
+# Cached responses are never deleted. Every key contains a version number,
+# and writes simply bump the version, so the old entries become unreachable
+# and expire on their own. Nothing has to be scanned or deleted.
+#
+# Versions:
+#   global                 - any product change (unfiltered product lists)
+#   collection:<id>        - product changes inside one collection (?collection_id=<id>)
+#   product:<id>           - one product (detail endpoint)
+
+PRODUCT_CACHE_TIMEOUT = 10 * 60
+# After this many seconds an entry is "stale". One request recomputes it
+# while the others keep serving the stale value.
+PRODUCT_CACHE_FRESH = 60
+# How long a recomputation may hold the lock
+LOCK_TIMEOUT = 10
+# How long a request waits for another one to fill a missing key
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.05
+
+VERSION_PREFIX = 'store:version'
+
+
+def version_key(scope):
+    return f'{VERSION_PREFIX}:{scope}'
+
+
+def get_versions(*scopes):
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    return [versions.get(key, 0) for key in keys]
+
+
+def bump_version(*scopes):
+    for scope in scopes:
+        key = version_key(scope)
+        # Version keys never expire, otherwise an old entry could become
+        # reachable again once the counter restarts from zero.
+        if cache.add(key, 1, timeout=None):
+            continue
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Key was evicted between add() and incr()
+            cache.add(key, 1, timeout=None)
+
+
+def invalidate_products(product_ids=(), collection_ids=()):
+    scopes = ['global']
+    scopes += [f'collection:{collection_id}' for collection_id in set(collection_ids) if collection_id]
+    scopes += [f'product:{product_id}' for product_id in set(product_ids) if product_id]
+    bump_version(*scopes)
+
+
+# Keys ----------
+
+def params_signature(request):
+    # Same query in a different parameter order must hit the same entry
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    )
+    # Pagination links are absolute URLs, so the host is part of the response
+    raw = f'{request.get_host()}|{params}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def product_list_scope(request):
+    collection_id = request.query_params.get('collection_id')
+    return f'collection:{collection_id}' if collection_id else 'global'
+
+
+def product_detail_scope(pk):
+    return f'product:{pk}'
+
+
+def product_list_key(request):
+    scope = product_list_scope(request)
+    version, = get_versions(scope)
+    return f'store:products:list:{scope}:{version}:{params_signature(request)}'
+
+
+def product_detail_key(request, pk):
+    version, = get_versions(product_detail_scope(pk))
+    return f'store:products:detail:{pk}:{version}:{params_signature(request)}'
+
+
+# Read through with stampede protection ----------
+
+def get_or_compute(key, compute, timeout=PRODUCT_CACHE_TIMEOUT, fresh_for=PRODUCT_CACHE_FRESH):
+    '''Returns cached data for the key or calls compute() and caches its result.
+
+    Only one process recomputes a key at a time (single flight),
+    the others serve the stale value or wait for it.'''
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+
+    if entry is not None:
+        data, fresh_until = entry
+        if time.time() < fresh_until or not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            # Fresh, or somebody else is already refreshing it
+            return data
+        return _compute_and_store(key, lock_key, compute, timeout, fresh_for)
+
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        return _compute_and_store(key, lock_key, compute, timeout, fresh_for)
+
+    # Hot key is being computed by another request. Wait for it instead of
+    # sending one more identical query to the database.
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    # The other request is too slow or died, compute it ourselves
+    return compute()
+
+
+def _compute_and_store(key, lock_key, compute, timeout, fresh_for):
+    try:
+        data = compute()
+        cache.set(key, (data, time.time() + fresh_for), timeout)
+        return data
+    finally:
+        cache.delete(lock_key)
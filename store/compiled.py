@@ -0,0 +1,236 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.response import Response
+
+
+# Compiled read-only serializers --------------------------------------
+# A list response normally builds one model instance per row and then
+# walks every serializer field of every instance. For list endpoints the
+# serializer definition is "compiled" instead:
+#
+#   - the columns the fields need are read with .values()
+#   - nested many=True serializers (product images, order items) are one
+#     more .values() query, like prefetch_related
+#   - one Python function is generated per serializer, it builds the
+#     output dict of a row with a single dict literal
+#
+# Every value still goes through the to_representation() of its field
+# (Decimal quantizing, dates, image URLs), fields whose output is the
+# database value itself (CharField, IntegerField, ...) are copied as is.
+# SerializerMethodFields get an object with the row values as attributes,
+# the columns they read are listed in Meta.field_dependencies.
+#
+# Anything the compiler doesn't understand makes compile_serializer()
+# return None and the view uses the normal serializer. Writes never
+# use compiled serializers.
+
+# Fields whose to_representation() returns the database value unchanged
+PASS_THROUGH = (
+    serializers.CharField, serializers.SlugField, serializers.EmailField,
+    serializers.IntegerField, serializers.BooleanField, serializers.ReadOnlyField,
+)
+
+
+class NotCompilable(Exception):
+    pass
+
+
+class Row:
+    '''Attribute access to a .values() row, row.product.unit_price
+    reads row['product__unit_price'].'''
+    __slots__ = ('_data', '_prefix', '_nested')
+
+    def __init__(self, data, prefix, nested):
+        self._data = data
+        self._prefix = prefix
+        # Prefixes of the joined relations, known when compiling
+        self._nested = nested
+
+    def __getattr__(self, name):
+        key = self._prefix + name
+        # "product" is the id, "product__..." columns make it an object
+        if key in self._nested:
+            return Row(self._data, f'{key}__', self._nested)
+        try:
+            return self._data[key]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def nested_prefixes(columns):
+    prefixes = set()
+    for column in columns:
+        parts = column.split('__')[:-1]
+        prefixes.update('__'.join(parts[:end]) for end in range(1, len(parts) + 1))
+    return frozenset(prefixes)
+
+
+@lru_cache(maxsize=64)
+def compile_source(source):
+    return compile(source, '<compiled serializer>', 'exec')
+
+
+class CompiledSerializer:
+
+    def __init__(self, serializer, queryset, prefix='', top_level=True):
+        self.model = queryset.model
+        self.columns = [f'{prefix}{self.model._meta.pk.name}'] if top_level else []
+        self.children = []      # (name, fk name, CompiledSerializer, queryset)
+        namespace = {'Row': Row}
+        entries = []
+        annotations = set(queryset.query.annotations) if top_level else set()
+        dependencies = getattr(getattr(serializer, 'Meta', None), 'field_dependencies', {})
+
+        for index, (name, field) in enumerate(serializer.fields.items()):
+            if field.write_only:
+                continue
+
+            if isinstance(field, serializers.SerializerMethodField):
+                if name not in dependencies and name not in annotations:
+                    raise NotCompilable(name)
+                self.columns += [f'{prefix}{column}' for column in dependencies.get(name, [])]
+                if name in annotations:
+                    self.columns.append(name)
+                namespace[f'm{index}'] = getattr(serializer, field.method_name)
+                entries.append(f'{name!r}: m{index}(Row(row, {prefix!r}, nested))')
+                continue
+
+            source = field.source
+            if source == '*' or '.' in source:
+                raise NotCompilable(name)
+
+            if isinstance(field, serializers.ListSerializer):
+                # Reverse foreign key, loaded by one more query
+                relation = self.get_model_field(source)
+                if not top_level or not relation.one_to_many:
+                    raise NotCompilable(name)
+                child_queryset = self.child_queryset(queryset, source, relation)
+                child = CompiledSerializer(field.child, child_queryset)
+                if child.children:
+                    raise NotCompilable(name)
+                self.children.append((name, relation.field.name, child, child_queryset))
+                namespace[f'c{index}'] = len(self.children) - 1
+                entries.append(f'{name!r}: children[c{index}].get(row[{self.columns[0]!r}], [])')
+                continue
+
+            column = f'{prefix}{source}'
+            if isinstance(field, serializers.Serializer):
+                # Forward foreign key, read through the join: product__title
+                relation = self.get_model_field(source)
+                if not (relation.many_to_one or relation.one_to_one) or not relation.concrete:
+                    raise NotCompilable(name)
+                child = CompiledSerializer(
+                    field, relation.related_model._default_manager.all(),
+                    prefix=f'{column}__', top_level=False
+                )
+                self.columns.append(column)
+                self.columns += child.columns
+                namespace[f'n{index}'] = child.render_row
+                entries.append(f'{name!r}: None if row[{column!r}] is None else n{index}(row, ())')
+                continue
+
+            if source in annotations:
+                self.columns.append(column)
+            else:
+                model_field = self.get_model_field(source)
+                if not model_field.concrete or model_field.many_to_many:
+                    raise NotCompilable(name)
+                if model_field.is_relation:
+                    # PrimaryKeyRelatedField or the "<fk>_id" attribute, values() returns the id
+                    if isinstance(field, serializers.RelatedField) and not (
+                        isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None
+                    ):
+                        raise NotCompilable(name)
+                    self.columns.append(column)
+                    entries.append(f'{name!r}: row[{column!r}]')
+                    continue
+                self.columns.append(column)
+                if hasattr(model_field, 'attr_class'):
+                    # FileField/ImageField, the serializer field needs a FieldFile for .url
+                    namespace[f'f{index}'] = model_field
+                    namespace[f'a{index}'] = model_field.attr_class
+                    namespace[f'r{index}'] = field.to_representation
+                    entries.append(
+                        f'{name!r}: None if not row[{column!r}] '
+                        f'else r{index}(a{index}(None, f{index}, row[{column!r}]))'
+                    )
+                    continue
+
+            if type(field) in PASS_THROUGH:
+                entries.append(f'{name!r}: row[{column!r}]')
+            else:
+                namespace[f'r{index}'] = field.to_representation
+                entries.append(f'{name!r}: None if row[{column!r}] is None else r{index}(row[{column!r}])')
+
+        source = 'def render_row(row, children):\n    return {\n%s\n    }\n' % ',\n'.join(
+            f'        {entry}' for entry in entries
+        )
+        namespace['nested'] = nested_prefixes(self.columns)
+        exec(compile_source(source), namespace)
+        self.render_row = namespace['render_row']
+
+    def get_model_field(self, name):
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise NotCompilable(name)
+
+    @staticmethod
+    def child_queryset(queryset, source, relation):
+        # Reuse the queryset of the view's Prefetch (annotations, ordering)
+        for lookup in queryset._prefetch_related_lookups:
+            if isinstance(lookup, Prefetch) and lookup.prefetch_to == source and lookup.queryset is not None:
+                return lookup.queryset
+        return relation.related_model._default_manager.all()
+
+    def values(self, queryset, extra=()):
+        columns = list(dict.fromkeys([*self.columns, *extra]))
+        return queryset.prefetch_related(None).values(*columns)
+
+    def render(self, rows):
+        rows = list(rows)
+        children = []
+        if self.children:
+            pk = self.columns[0]
+            ids = [row[pk] for row in rows]
+            for name, fk, child, child_queryset in self.children:
+                grouped = {}
+                for row in child.values(child_queryset.filter(**{f'{fk}__in': ids}), [fk]):
+                    grouped.setdefault(row[fk], []).append(child.render_row(row, ()))
+                children.append(grouped)
+        render_row = self.render_row
+        return [render_row(row, children) for row in rows]
+
+
+def compile_serializer(serializer, queryset):
+    '''Returns a CompiledSerializer or None if the serializer has fields
+    that can't be read from .values() rows.'''
+    try:
+        return CompiledSerializer(serializer, queryset)
+    except NotCompilable:
+        return None
+
+
+def ordering_columns(queryset):
+    # The keyset paginator reads the ordering values from the rows
+    ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+    return [term.lstrip('-') for term in ordering if isinstance(term, str)]
+
+
+class CompiledListMixin:
+    '''View mixin, list() uses the compiled serializer when possible.'''
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        compiled = compile_serializer(self.get_serializer(), queryset)
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = compiled.values(queryset, ordering_columns(queryset))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.render(page))
+        return Response(compiled.render(rows))
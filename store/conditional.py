@@ -0,0 +1,128 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_versions, params_signature
+
+
+# Conditional GET -----------------------------------------------------
+# list and retrieve answer If-None-Match / If-Modified-Since with a
+# 304 Not Modified. The validators are computed in initial(), after
+# authentication and content negotiation but before the response cache
+# and the serializer:
+#   - views with cache versions (get_version_scopes(), store/cache.py)
+#     build the ETag from the versions, the same ones as the response
+#     cache keys. No database query, a 304 costs one cache round trip.
+#     The versions carry no time, so there is no Last-Modified.
+#   - other views run one aggregate query over the filtered queryset:
+#       SELECT MAX(last_update), COUNT(id) FROM store_product WHERE ...
+#     COUNT catches deleted rows, which don't move MAX(last_update).
+# Requests without If-None-Match / If-Modified-Since only get the headers.
+#
+# The ETag also covers the query parameters, the host (absolute pagination
+# links) and the media type, so every representation has its own ETag.
+
+class ConditionalResponse(Exception):
+    '''Raised by initial() to return a 304 (or 412) right away.'''
+
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    '''View mixin, ETag and Last-Modified for list and retrieve.'''
+    conditional_actions = ('list', 'retrieve')
+    # Column the validators are computed from, can span relations
+    last_modified_field = 'last_update'
+    # Last-Modified is only sent if last_modified_field changes with
+    # everything in the response, otherwise clients get the ETag only
+    send_last_modified = True
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.conditional_validators = None
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return
+        self.conditional_validators = self.get_validators(request)
+        if self.conditional_validators is None:
+            return
+        if not self.is_conditional(request):
+            return
+        etag, last_modified = self.conditional_validators
+        response = get_conditional_response(
+            request._request,
+            etag=etag,
+            last_modified=last_modified and int(last_modified.timestamp()),
+        )
+        if response is not None:
+            raise ConditionalResponse(response)
+
+    @staticmethod
+    def is_conditional(request):
+        return 'if-none-match' in request.headers or 'if-modified-since' in request.headers
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ConditionalResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, 'conditional_validators', None)
+        if validators is not None and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+    def get_validators(self, request):
+        '''(etag, last_modified) or None to answer without validators.'''
+        scopes = self.get_version_scopes(request)
+        if scopes is not None:
+            raw = '|'.join([
+                *[f'{scope}:{version}' for scope, version in zip(scopes, get_versions(*scopes))],
+                self.get_etag_extra(request),
+                params_signature(request),
+                request.accepted_media_type or '',
+            ])
+            return quote_etag(hashlib.sha1(raw.encode()).hexdigest()), None
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            try:
+                queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            except (TypeError, ValueError, ValidationError):
+                # Invalid id, the usual 404 path handles it
+                return None
+
+        state = queryset.order_by().aggregate(
+            last_modified=Max(self.last_modified_field),
+            count=Count('pk', distinct=True),
+        )
+        if self.action == 'retrieve' and not state['count']:
+            return None
+
+        last_modified = state['last_modified']
+        raw = '|'.join([
+            str(state['count']),
+            last_modified.isoformat() if last_modified else '',
+            self.get_etag_extra(request),
+            params_signature(request),
+            request.accepted_media_type or '',
+        ])
+        etag = quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+        return etag, last_modified if self.send_last_modified else None
+
+    def get_version_scopes(self, request):
+        '''Cache version scopes the response depends on, None to compute
+        the validators from the database.'''
+        return None
+
+    def get_etag_extra(self, request):
+        '''More state the response depends on, not covered by last_modified_field.'''
+        return ''
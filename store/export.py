@@ -0,0 +1,96 @@
+import csv
+import io
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+
+from core.renderers import CSVRenderer, NDJSONRenderer, ORJSONRenderer
+
+from .compiled import compile_serializer
+
+
+# Streaming exports ---------------------------------------------------
+#   GET /store/products/export/                 one JSON object per line
+#   GET /store/products/export/?format=csv      header + one row per object
+#
+# Filters, ordering and ?fields= work like on the list endpoint. Rows are
+# read through a server side cursor (.iterator(chunk_size=...)) and every
+# chunk is sent as soon as it is rendered, so memory doesn't grow with the
+# number of rows and the response starts after the first chunk.
+#
+# When the serializer compiles (store/compiled.py) the rows are .values()
+# dicts and nested lists cost one query per chunk. Otherwise the model
+# instances are serialized, prefetch_related() also runs once per chunk.
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def export_objects(serializer, queryset, chunk_size):
+    '''Yields the serialized objects, one list per chunk.'''
+    compiled = compile_serializer(serializer, queryset)
+    if compiled is not None:
+        rows = compiled.values(queryset).iterator(chunk_size=chunk_size)
+        for chunk in chunked(rows, chunk_size):
+            yield compiled.render(chunk)
+        return
+    for chunk in chunked(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        yield [serializer.to_representation(instance) for instance in chunk]
+
+
+def ndjson_content(chunks, renderer):
+    for objects in chunks:
+        yield b''.join(renderer.render(obj) + b'\n' for obj in objects)
+
+
+def csv_content(chunks, names, charset):
+    # Nested objects and lists are written as JSON inside the cell
+    json_renderer = ORJSONRenderer()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        content = buffer.getvalue().encode(charset)
+        buffer.seek(0)
+        buffer.truncate()
+        return content
+
+    writer.writerow(names)
+    yield flush()
+    for objects in chunks:
+        for obj in objects:
+            writer.writerow([
+                json_renderer.render(value).decode() if isinstance(value, (dict, list)) else value
+                for value in (obj[name] for name in names)
+            ])
+        yield flush()
+
+
+class ExportMixin:
+    '''View mixin, adds GET <list url>/export/ (NDJSON or CSV).'''
+    export_chunk_size = EXPORT_CHUNK_SIZE
+
+    @action(detail=False, renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        chunks = export_objects(serializer, queryset, self.export_chunk_size)
+
+        renderer = request.accepted_renderer
+        if renderer.format == 'csv':
+            names = [name for name, field in serializer.fields.items() if not field.write_only]
+            content = csv_content(chunks, names, renderer.charset)
+            content_type = f'{renderer.media_type}; charset={renderer.charset}'
+        else:
+            content = ndjson_content(chunks, renderer)
+            content_type = renderer.media_type
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{self.basename}s.{renderer.format}"'
+        return response
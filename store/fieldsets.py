@@ -0,0 +1,122 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+# Sparse fieldsets ----------------------------------------------------
+#   ?fields=id,title,unit_price   only these fields
+#   ?exclude=description          everything except these fields
+#   ?expand=images                with ?fields=, adds expandable fields
+#
+# Expandable fields (Meta.expandable_fields, usually nested lists) are in
+# the default output, so responses without the parameters don't change.
+# With ?fields= they are returned only when listed in ?fields= or ?expand=.
+#
+# SparseFieldsetMixin trims the queryset of the view the same way: columns
+# of the dropped fields are deferred with .only() and prefetches of the
+# dropped nested fields are not executed at all.
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+EXPAND_PARAM = 'expand'
+
+
+def parse_names(request, param):
+    value = request.query_params.get(param, '')
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def is_shaped(request):
+    '''True if the response of this request is shaped by the parameters.'''
+    return (
+        request is not None
+        and request.method in SAFE_METHODS
+        and bool(request.query_params.get(FIELDS_PARAM) or request.query_params.get(EXCLUDE_PARAM))
+    )
+
+
+def select_names(names, expandable, request):
+    fields = parse_names(request, FIELDS_PARAM)
+    exclude = parse_names(request, EXCLUDE_PARAM)
+    expand = parse_names(request, EXPAND_PARAM) & set(expandable)
+    if fields:
+        names = [name for name in names if name in fields or name in expand]
+    return [name for name in names if name not in exclude]
+
+
+class DynamicFieldsMixin:
+    '''Serializer mixin. Only the top level serializer of a safe request
+    is shaped, nested serializers and writes keep all their fields.'''
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if not is_shaped(request) or not self.is_root():
+            return fields
+        expandable = getattr(self.Meta, 'expandable_fields', [])
+        names = select_names(fields.keys(), expandable, request)
+        return {name: fields[name] for name in names}
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+
+class SparseFieldsetMixin:
+    '''View mixin, loads only what the shaped serializer will render.'''
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not is_shaped(self.request):
+            return queryset
+
+        serializer = self.get_serializer()
+        if not isinstance(serializer, DynamicFieldsMixin):
+            return queryset
+
+        model = queryset.model
+        dependencies = getattr(serializer.Meta, 'field_dependencies', {})
+        columns, relations = {model._meta.pk.name}, set()
+        defer_columns = True
+
+        for name, field in serializer.fields.items():
+            if name in dependencies:
+                columns.update(dependencies[name])
+                continue
+            source = field.source.split('.')[0]
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                # Property or annotation, it may need any column
+                defer_columns = False
+                continue
+            if model_field.many_to_many or model_field.one_to_many:
+                relations.add(source)
+            elif model_field.concrete:
+                columns.add(model_field.name)
+            else:
+                defer_columns = False
+
+        # Prefetches of the dropped nested fields are skipped
+        lookups = [
+            lookup for lookup in queryset._prefetch_related_lookups
+            if (lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup).split('__')[0] in relations
+        ]
+        queryset = queryset.prefetch_related(None).prefetch_related(*lookups)
+
+        if not defer_columns:
+            return queryset
+        # Ordering columns are read by the (keyset) paginator
+        for ordering in queryset.query.order_by or model._meta.ordering:
+            if isinstance(ordering, str):
+                name = ordering.lstrip('-').split('__')[0]
+                try:
+                    model_field = model._meta.get_field(name)
+                except FieldDoesNotExist:
+                    continue
+                if model_field.concrete:
+                    columns.add(model_field.name)
+        return queryset.only(*columns)
@@ -1,4 +1,9 @@
-from django_filters.rest_framework import FilterSet
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+from django_filters.rest_framework import CharFilter, ChoiceFilter, FilterSet
+from rest_framework.filters import SearchFilter
+from tags.models import TaggedItem
 from .models import Product
 
 
@@ -6,11 +11,61 @@ from .models import Product
 # Add 'django_filters' to INSTALLED_APPS. The name of the app is different
 # from the name of the module - 'django-filter'
 # Use 'pip install django-filter' to install the module
+#
+# Tags: ?tags=bread,fresh&tag_mode=all (default) or tag_mode=any
+# Each tag is an EXISTS subquery on idx_taggeditem_tag_object, Postgres
+# runs them as semi joins, so an intersection reads only the index
+# entries of the requested tags, not the tagged items of every product.
 class ProductFilter(FilterSet):
+    tags = CharFilter(method='filter_tags')
+    tag_mode = ChoiceFilter(choices=[('all', 'all'), ('any', 'any')], method='filter_tag_mode')
+    
     class Meta:
         model = Product 
         fields = {
             'collection_id': ['exact'],
             'unit_price': ['gt', 'lt'],
             'inventory': ['gt', 'lt'] 
-        }
\ No newline at end of file
+        }
+    
+    def filter_tags(self, queryset, name, value):
+        labels = list(dict.fromkeys(label.strip() for label in value.split(',') if label.strip()))
+        if not labels:
+            return queryset
+        if self.form.cleaned_data.get('tag_mode') == 'any':
+            return queryset.filter(TaggedItem.objects.tagged_with(Product, labels))
+        return queryset.filter(*[TaggedItem.objects.tagged_with(Product, [label]) for label in labels])
+    
+    def filter_tag_mode(self, queryset, name, value):
+        # Read by filter_tags()
+        return queryset
+
+
+# Full text search ----------------------------------------------------
+# DRF SearchFilter turns ?search=term into
+#   UPPER(title) LIKE '%TERM%' OR UPPER(description) LIKE '%TERM%'
+# which can not use an index and scans the whole table on every request.
+# ProductSearchFilter matches the indexed Product.search_vector instead and
+# orders the results by ts_rank, unless the client asked for ?ordering=...
+# Same ?search= parameter, so it is a drop-in replacement in filter_backends.
+class ProductSearchFilter(SearchFilter):
+    search_config = 'english'
+    # websearch syntax: "exact phrase", -exclude, or
+    search_type = 'websearch'
+
+    def filter_queryset(self, request, queryset, view):
+        if connection.vendor != 'postgresql':
+            # Other databases have no tsvector, keep the LIKE based search
+            return super().filter_queryset(request, queryset, view)
+
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+        return self.search(queryset, terms)
+
+    def search(self, queryset, terms):
+        query = SearchQuery(terms, config=self.search_config, search_type=self.search_type)
+        return queryset \
+            .filter(search_vector=query) \
+            .annotate(rank=SearchRank(F('search_vector'), query)) \
+            .order_by('-rank', 'id')
@@ -0,0 +1,141 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import InventoryReservation, Order, Product
+from .cache import invalidate_products
+
+
+# Inventory -----------------------------------------------------------
+# Checkout takes the stock of every line in ONE conditional UPDATE:
+#
+#   UPDATE store_product
+#   SET inventory = inventory - CASE id WHEN 1 THEN 2 WHEN 7 THEN 1 END
+#   WHERE (id = 1 AND inventory >= 2) OR (id = 7 AND inventory >= 1)
+#   RETURNING id
+#
+# Postgres locks only the rows it updates, so two checkouts wait for each
+# other only when they share a product, and the WHERE is re-checked after
+# the wait. The products missing from RETURNING are short, they are
+# reported with their inventory and the surrounding transaction is rolled
+# back.
+#
+# The taken stock is recorded as reservations of the order. Paying the
+# order consumes them, failing, deleting or not paying it in time
+# (RESERVATION_TTL) returns the stock.
+
+RESERVATION_TTL = timedelta(minutes=15)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, available):
+        # {product id: inventory} of the short products
+        self.available = dict(sorted(available.items()))
+        self.product_ids = list(self.available)
+        super().__init__(f'Not enough stock for product(s): {self.product_ids}')
+
+
+def _adjust_inventory(quantities: dict[int, int], sign: int, check_stock: bool) -> set[int]:
+    '''Returns the ids of the updated products.'''
+    if not quantities:
+        return set()
+    meta = Product._meta
+    qn = connection.ops.quote_name
+    pk = qn(meta.pk.column)
+    inventory = qn(meta.get_field('inventory').column)
+    change = ' '.join(['WHEN %s THEN %s'] * len(quantities))
+    change_params = [value for pair in quantities.items() for value in pair]
+    if check_stock:
+        condition = ' OR '.join([f'({pk} = %s AND {inventory} >= %s)'] * len(quantities))
+        condition_params = change_params
+    else:
+        condition = f'{pk} IN ({", ".join(["%s"] * len(quantities))})'
+        condition_params = list(quantities)
+    # last_update is auto_now, which a raw UPDATE doesn't apply. It is set here
+    # so the ETag/Last-Modified of the product pages change (store/conditional.py).
+    # RETURNING tells which lines were filled when some product is short.
+    sql = f'''
+        UPDATE {qn(meta.db_table)}
+        SET {inventory} = {inventory} + %s * (CASE {pk} {change} END),
+            {qn(meta.get_field('last_update').column)} = NOW()
+        WHERE {condition}
+        RETURNING {pk}
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [sign, *change_params, *condition_params])
+        updated = {row[0] for row in cursor.fetchall()}
+    # A raw UPDATE sends no post_save, cached product pages show the inventory
+    product_ids = list(quantities)
+    transaction.on_commit(lambda: _invalidate_stock(product_ids))
+    return updated
+
+
+def _invalidate_stock(product_ids):
+    collection_ids = Product.objects.filter(pk__in=product_ids).values_list('collection_id', flat=True)
+    invalidate_products(product_ids=product_ids, collection_ids=list(collection_ids))
+
+
+def reserve_stock(order: Order, lines) -> list[InventoryReservation]:
+    '''Takes stock for (product_id, quantity) lines of the order.
+
+    Must run inside transaction.atomic(), raises InsufficientStock
+    without changing anything visible if a product is short.'''
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+
+    updated = _adjust_inventory(quantities, -1, check_stock=True)
+    short = [pk for pk in quantities if pk not in updated]
+    if short:
+        # Error path only. The lines that could be filled were taken and are
+        # rolled back when the exception leaves the caller's atomic() block,
+        # the short products were not touched, their inventory is current.
+        available = dict(Product.objects.filter(pk__in=short).values_list('id', 'inventory'))
+        raise InsufficientStock({pk: available.get(pk, 0) for pk in short})
+
+    expires_at = timezone.now() + RESERVATION_TTL
+    return InventoryReservation.objects.bulk_create([
+        InventoryReservation(order=order, product_id=pk, quantity=qty, expires_at=expires_at)
+        for pk, qty in quantities.items()
+    ])
+
+
+def confirm_reservations(order: Order) -> None:
+    '''Order was paid, the stock is sold for good.'''
+    InventoryReservation.objects.filter(order=order).delete()
+
+
+def release_reservations(reservations) -> int:
+    '''Returns the reserved stock to the products and deletes the reservations.'''
+    with transaction.atomic():
+        # Lock the reservations, so a concurrent release can't return them twice
+        rows = list(
+            reservations
+            .select_for_update(skip_locked=True)
+            .values_list('id', 'product_id', 'quantity')
+        )
+        if not rows:
+            return 0
+        quantities = Counter()
+        for _, product_id, quantity in rows:
+            quantities[product_id] += quantity
+        _adjust_inventory(quantities, +1, check_stock=False)
+        InventoryReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        return len(rows)
+
+
+def release_expired_reservations() -> int:
+    '''Gives back the stock of pending orders that were not paid in time.'''
+    expired = InventoryReservation.objects.filter(
+        expires_at__lte=timezone.now(),
+        order__payment_status=Order.PAYMENT_STATUS_PENDING
+    )
+    order_ids = set(expired.values_list('order_id', flat=True))
+    released = release_reservations(expired)
+    if order_ids:
+        Order.objects \
+            .filter(pk__in=order_ids, payment_status=Order.PAYMENT_STATUS_PENDING) \
+            .update(payment_status=Order.PAYMENT_STATUS_FAILED)
+    return released
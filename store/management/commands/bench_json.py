@@ -0,0 +1,83 @@
+import io
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer, orjson
+from store.models import Cart
+
+
+# Usage:
+#   python manage.py bench_json
+#   python manage.py bench_json --repeat 1000
+class Command(BaseCommand):
+    help = 'Compares DRF JSONRenderer/JSONParser with the orjson ones on real store responses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson is not installed: pip install orjson')
+
+        payloads = self.payloads()
+        if not payloads:
+            raise CommandError('No data to render. Add some products, carts or orders first.')
+
+        repeat = options['repeat']
+        self.stdout.write(f'CPU time per request, median of {repeat} runs.\n')
+        self.stdout.write(
+            f'{"endpoint":<28}{"bytes":>10}{"render drf":>13}{"orjson":>10}'
+            f'{"parse drf":>12}{"orjson":>10}{"saved":>10}'
+        )
+        for name, data in payloads:
+            expected = JSONRenderer().render(data)
+            # Same bytes, except the exponent format of floats (core/renderers.py)
+            if json.loads(ORJSONRenderer().render(data)) != json.loads(expected):
+                raise CommandError(f'{name}: ORJSONRenderer output differs from JSONRenderer')
+
+            render_drf = self.measure(lambda: JSONRenderer().render(data), repeat)
+            render_fast = self.measure(lambda: ORJSONRenderer().render(data), repeat)
+            parse_drf = self.measure(lambda: JSONParser().parse(io.BytesIO(expected)), repeat)
+            parse_fast = self.measure(lambda: ORJSONParser().parse(io.BytesIO(expected)), repeat)
+            saved = render_drf - render_fast
+            self.stdout.write(
+                f'{name:<28}{len(expected):>10}{render_drf:>11.0f}us{render_fast:>8.0f}us'
+                f'{parse_drf:>10.0f}us{parse_fast:>8.0f}us{saved:>8.0f}us'
+            )
+
+    def payloads(self):
+        '''response.data of the endpoints, before rendering.'''
+        client = APIClient(SERVER_NAME='localhost')
+        payloads = [
+            ('GET /store/products/', client.get('/store/products/').data),
+        ]
+
+        cart = Cart.objects.annotate(items_count=Count('items')).order_by('-items_count').first()
+        if cart is not None:
+            payloads.append(('GET /store/carts/<id>/', client.get(f'/store/carts/{cart.id}/').data))
+
+        staff = get_user_model().objects.filter(is_staff=True).first()
+        if staff is not None:
+            client.force_authenticate(user=staff)
+            payloads.append(('GET /store/orders/ (staff)', client.get('/store/orders/').data))
+
+        return [(name, data) for name, data in payloads if data]
+
+    @staticmethod
+    def measure(func, repeat):
+        func()  # warm up
+        timings = []
+        for _ in range(repeat):
+            start = time.process_time_ns()
+            func()
+            timings.append((time.process_time_ns() - start) / 1000)
+        return statistics.median(timings)
@@ -0,0 +1,130 @@
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from store.filters import ProductSearchFilter
+from store.models import Collection, Product
+
+
+BENCHMARK_COLLECTION = 'Search benchmark'
+FALLBACK_WORDS = [
+    'bread', 'cheese', 'chicken', 'breast', 'shrimp', 'salmon', 'wine', 'red',
+    'white', 'sauce', 'tomato', 'pepper', 'frozen', 'fresh', 'organic', 'beef',
+    'pork', 'lamb', 'rice', 'pasta', 'juice', 'orange', 'apple', 'lemon',
+    'coffee', 'tea', 'sugar', 'flour', 'butter', 'cream', 'yogurt', 'bacon',
+]
+
+
+# Usage:
+#   python manage.py bench_search --seed 1000000
+#   python manage.py bench_search --terms bread "chicken breast" --repeat 10
+#   python manage.py bench_search --cleanup
+class Command(BaseCommand):
+    help = 'Compares LIKE based SearchFilter with the full text ProductSearchFilter.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Insert this many synthetic products before measuring')
+        parser.add_argument('--terms', nargs='+', default=['bread', 'chicken breast', 'frozen shrimp'])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the synthetic products and exit')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The full text backend requires PostgreSQL.')
+
+        if options['cleanup']:
+            deleted = self.cleanup()
+            self.stdout.write(f'Deleted {deleted} synthetic products.')
+            return
+
+        if options['seed']:
+            self.seed(options['seed'])
+
+        total = Product.objects.count()
+        self.stdout.write(f'Catalog size: {total} products, {options["repeat"]} runs per term.\n')
+        self.stdout.write(f'{"term":<24}{"icontains ms":>14}{"fulltext ms":>14}{"speedup":>10}')
+
+        for term in options['terms']:
+            like = self.measure(lambda: self.like_page(term), options['repeat'])
+            fulltext = self.measure(lambda: self.fulltext_page(term), options['repeat'])
+            speedup = like / fulltext if fulltext else float('inf')
+            self.stdout.write(f'{term:<24}{like:>14.1f}{fulltext:>14.1f}{speedup:>9.1f}x')
+
+    # What one /store/products/?search=... request does: COUNT(*) + first page
+
+    def like_page(self, term):
+        # Same predicate DRF SearchFilter builds for search_fields
+        condition = Q()
+        for word in term.split():
+            condition &= Q(title__icontains=word) | Q(description__icontains=word)
+        queryset = Product.objects.filter(condition)
+        queryset.count()
+        list(queryset.values_list('id', flat=True)[:10])
+
+    def fulltext_page(self, term):
+        queryset = ProductSearchFilter().search(Product.objects.all(), term)
+        queryset.count()
+        list(queryset.values_list('id', flat=True)[:10])
+
+    @staticmethod
+    def measure(func, repeat):
+        func()  # warm up caches
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    # Synthetic catalog ----------
+
+    def vocabulary(self):
+        words = set()
+        for title, description in Product.objects.values_list('title', 'description')[:2000]:
+            words.update(re.findall(r'[a-z]{3,}', f'{title} {description or ""}'.lower()))
+        return sorted(words) or FALLBACK_WORDS
+
+    def seed(self, count):
+        words = self.vocabulary()
+        collection, _ = Collection.objects.get_or_create(title=BENCHMARK_COLLECTION)
+        self.stdout.write(f'Inserting {count} products ({len(words)} words vocabulary)...')
+        start = time.perf_counter()
+        # Generated on the database side in one statement. The search_vector
+        # trigger fires for every row, exactly as for real inserts.
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('''
+                WITH vocabulary AS (SELECT %s::text[] AS w, cardinality(%s::text[]) AS n)
+                INSERT INTO store_product
+                    (title, slug, description, unit_price, inventory, last_update, collection_id)
+                SELECT
+                    initcap(w[1 + floor(random() * n)::int] || ' ' || w[1 + floor(random() * n)::int]),
+                    'bench-' || g,
+                    array_to_string(ARRAY(
+                        SELECT w[1 + floor(random() * n)::int]
+                        FROM generate_series(1, 12)
+                        WHERE g > 0  -- correlated, so every row gets its own words
+                    ), ' '),
+                    round((1 + random() * 99)::numeric, 2),
+                    floor(random() * 100)::int,
+                    now(),
+                    %s
+                FROM vocabulary, generate_series(1, %s) AS g
+            ''', [words, words, collection.id, count])
+            cursor.execute('ANALYZE store_product')
+        self.stdout.write(f'Done in {time.perf_counter() - start:.1f}s.\n')
+
+    def cleanup(self):
+        with connection.cursor() as cursor:
+            cursor.execute('''
+                DELETE FROM store_product
+                WHERE collection_id IN (SELECT id FROM store_collection WHERE title = %s)
+            ''', [BENCHMARK_COLLECTION])
+            deleted = cursor.rowcount
+        Collection.objects.filter(title=BENCHMARK_COLLECTION).delete()
+        return deleted
@@ -0,0 +1,130 @@
+import json
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from store.filters import ProductFilter, ProductSearchFilter
+from store.models import Collection, Customer, Order, OutboxEvent, Product
+from tags.models import Tag, TaggedItem
+
+
+# Usage:
+#   python manage.py explain_indexes
+#   python manage.py explain_indexes --no-seqscan --check
+#
+# Runs EXPLAIN ANALYZE for the queries the store really sends and reports
+# which indexes the plans use. The querysets are built with the same
+# filters and orderings as the views and the admin.
+#
+# On a small database the planner rightly prefers a sequential scan.
+# --no-seqscan turns sequential scans off for the session, so the report
+# shows whether the expected index can serve the query at all.
+# --check exits with an error if an expected index is not used.
+class Command(BaseCommand):
+    help = 'EXPLAIN ANALYZE of the store query patterns and the indexes they use.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-seqscan', action='store_true',
+                            help='SET enable_seqscan = off while explaining')
+        parser.add_argument('--check', action='store_true',
+                            help='Fail if an expected index is not used')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Print the full plans')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN ANALYZE reports require PostgreSQL.')
+
+        missing = []
+        self.stdout.write(f'{"query":<28}{"expected index":<30}{"ms":>9}  used indexes')
+        for name, expected, queryset in self.scenarios():
+            plan = self.explain(queryset, options['no_seqscan'])
+            used = sorted(set(self.index_names(plan['Plan'])))
+            ok = expected in used
+            if not ok:
+                missing.append(name)
+            mark = '' if ok else '  <-- not used'
+            self.stdout.write(
+                f'{name:<28}{expected:<30}{plan["Execution Time"]:>9.2f}  {", ".join(used) or "-"}{mark}'
+            )
+            if options['verbose_plans']:
+                self.stdout.write(json.dumps(plan['Plan'], indent=2))
+
+        if missing and options['check']:
+            raise CommandError(f'Expected indexes not used by: {", ".join(missing)}')
+
+    def scenarios(self):
+        '''(name, expected index, queryset) for every query pattern.'''
+        collection_id = Collection.objects.values_list('id', flat=True).first() or 0
+        customer_id = Customer.objects.values_list('id', flat=True).first() or 0
+        products = Product.objects.all()
+        product_ids = list(products.values_list('id', flat=True)[:10])
+        tag_labels = list(Tag.objects.values_list('label', flat=True)[:2]) or ['none']
+
+        def product_filter(**params):
+            return ProductFilter(data=params, queryset=products).qs
+
+        return [
+            # /store/products/ (Product.Meta.ordering)
+            ('products', 'idx_product_title_id', products[:10]),
+            ('products-by-price', 'idx_product_unit_price_id',
+                products.order_by('unit_price', 'id')[:10]),
+            ('products-by-update', 'idx_product_last_update_id',
+                products.order_by('-last_update', '-id')[:10]),
+            ('products-by-popularity', 'idx_product_popularity_id',
+                products.order_by('-popularity', '-id')[:10]),
+            ('products-price-range', 'idx_product_unit_price_id',
+                product_filter(unit_price__gt='10', unit_price__lt='20').order_by('unit_price', 'id')[:10]),
+            ('products-inventory-range', 'idx_product_inventory_id',
+                product_filter(inventory__lt='5').order_by('inventory', 'id')[:10]),
+            ('collection', 'idx_product_coll_title_id',
+                product_filter(collection_id=str(collection_id))[:10]),
+            ('collection-by-price', 'idx_product_coll_price_id',
+                product_filter(collection_id=str(collection_id)).order_by('unit_price', 'id')[:10]),
+            ('collection-by-update', 'idx_product_coll_update_id',
+                product_filter(collection_id=str(collection_id)).order_by('-last_update', '-id')[:10]),
+            ('products-by-tags', 'idx_taggeditem_tag_object',
+                product_filter(tags=','.join(tag_labels))[:10]),
+            ('collection-by-popularity', 'idx_product_coll_popular_id',
+                product_filter(collection_id=str(collection_id)).order_by('-popularity', '-id')[:10]),
+            ('search', 'idx_product_search_vector',
+                ProductSearchFilter().search(products, 'bread')[:10]),
+            # Admin "Low" inventory filter
+            ('admin-low-stock', 'idx_product_low_stock_title',
+                products.filter(inventory__lt=10)[:100]),
+            # /store/orders/ for a customer and for staff (Order.Meta.ordering)
+            ('orders-of-customer', 'idx_order_customer_placed',
+                Order.objects.filter(customer_id=customer_id)[:10]),
+            ('orders', 'idx_order_placed_id', Order.objects.all()[:10]),
+            # /store/customers/ (Customer.Meta.ordering joins core_user)
+            ('customers', 'idx_user_name_id', Customer.objects.all()[:10]),
+            # ?include=tags, TaggedItem.objects.get_tags_for_many()
+            ('product-tags', 'idx_taggeditem_object',
+                TaggedItem.objects.filter(
+                    content_type=ContentType.objects.get_for_model(Product), object_id__in=product_ids
+                ).select_related('tag')),
+            ('outbox-pending', 'idx_outbox_pending',
+                OutboxEvent.objects.filter(processed_at__isnull=True).order_by('created_at')[:100]),
+        ]
+
+    @staticmethod
+    def explain(queryset, no_seqscan):
+        sql, params = queryset.query.sql_with_params()
+        # Rolled back, EXPLAIN ANALYZE really runs the query
+        with transaction.atomic(), connection.cursor() as cursor:
+            if no_seqscan:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            transaction.set_rollback(True)
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]
+
+    @classmethod
+    def index_names(cls, node):
+        if 'Index Name' in node:
+            yield node['Index Name']
+        for child in node.get('Plans', []):
+            yield from cls.index_names(child)
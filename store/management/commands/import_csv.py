@@ -0,0 +1,214 @@
+import csv
+import hashlib
+import io
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import NOT_PROVIDED
+
+from store.models import CsvImport, Product
+from store.cache import invalidate_products
+
+
+# Streaming CSV loader ------------------------------------------------
+# The file is read in chunks of --chunk-size rows. Every chunk goes to
+# Postgres with one COPY FROM STDIN and is committed together with the
+# import checkpoint (store.CsvImport), so:
+#   - memory does not depend on the file size, only on the chunk size
+#   - an interrupted import continues after the last committed chunk
+#
+# With --upsert every chunk is copied into a temporary staging table first
+# and merged with INSERT ... ON CONFLICT (id) DO UPDATE.
+#
+# Usage:
+#   python manage.py import_csv product.csv store.Product
+#   python manage.py import_csv product.csv store.Product --upsert --chunk-size 100000
+#   python manage.py import_csv product.csv store.Product --restart
+class Command(BaseCommand):
+    help = 'Streams a CSV file into the table of a Django model using COPY.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path to the *.csv file, the first row is the header')
+        parser.add_argument('model', help='app_label.ModelName, for example store.Product')
+        parser.add_argument('--chunk-size', type=int, default=50_000)
+        parser.add_argument('--upsert', action='store_true',
+                            help='Update existing rows instead of failing on duplicates')
+        parser.add_argument('--conflict-on', nargs='+', default=None,
+                            help='Unique columns for --upsert (default: primary key)')
+        parser.add_argument('--skip-unknown', action='store_true',
+                            help='Ignore CSV columns the model does not have')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the saved progress and start from the first row')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('COPY FROM STDIN requires PostgreSQL.')
+
+        path = options['file']
+        if not os.path.exists(path):
+            raise CommandError(f'File "{path}" does not exist.')
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError):
+            raise CommandError(f'Unknown model "{options["model"]}".')
+
+        table = model._meta.db_table
+        chunk_size = options['chunk_size']
+
+        with open(path, newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
+            if not header:
+                raise CommandError('The file is empty.')
+
+            keep, columns = self.validate_columns(model, header, options['skip_unknown'])
+            conflict_on = options['conflict_on'] or [model._meta.pk.column]
+
+            checkpoint = self.get_checkpoint(path, model, options['restart'])
+            if checkpoint.finished:
+                self.stdout.write(f'"{path}" was already imported. Use --restart to import it again.')
+                return
+            skipped = self.skip_rows(reader, checkpoint.rows_committed)
+            if skipped:
+                self.stdout.write(f'Resuming after {skipped} already committed rows.')
+
+            copy_sql = f'COPY {{table}} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+            merge_sql = self.merge_sql(table, columns, conflict_on) if options['upsert'] else None
+
+            total = skipped
+            start = time.perf_counter()
+            for buffer, count in self.chunks(reader, keep, len(header), chunk_size):
+                with transaction.atomic(), connection.cursor() as cursor:
+                    if merge_sql:
+                        cursor.execute(
+                            f'CREATE TEMP TABLE import_staging ON COMMIT DROP AS '
+                            f'SELECT {", ".join(columns)} FROM {table} WITH NO DATA'
+                        )
+                        cursor.copy_expert(copy_sql.format(table='import_staging'), buffer)
+                        cursor.execute(merge_sql)
+                    else:
+                        cursor.copy_expert(copy_sql.format(table=table), buffer)
+                    total += count
+                    CsvImport.objects.filter(pk=checkpoint.pk).update(rows_committed=total)
+
+                elapsed = time.perf_counter() - start
+                rate = (total - skipped) / elapsed if elapsed else 0
+                self.stdout.write(f'{total} rows committed ({rate:,.0f} rows/s)')
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Explicit ids were inserted, move the id sequence past them
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                cursor.execute(sql)
+            CsvImport.objects.filter(pk=checkpoint.pk).update(finished=True)
+
+        if model is Product:
+            # COPY does not send post_save, drop all cached product pages
+            invalidate_products()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} rows have been imported into "{table}" in {time.perf_counter() - start:.1f}s.'
+        ))
+
+    # Validation ----------
+
+    def validate_columns(self, model, header, skip_unknown):
+        '''Returns indexes of the CSV columns to load and their db column names.'''
+        fields = {}
+        for field in model._meta.concrete_fields:
+            # Both "collection" and "collection_id" are accepted
+            fields[field.name] = field
+            fields[field.column] = field
+
+        keep, columns, unknown = [], [], []
+        for index, name in enumerate(header):
+            field = fields.get(name.strip())
+            if field is None:
+                unknown.append(name)
+                continue
+            keep.append(index)
+            columns.append(connection.ops.quote_name(field.column))
+
+        if unknown and not skip_unknown:
+            raise CommandError(
+                f'{model.__name__} has no column(s): {", ".join(unknown)}. '
+                f'Use --skip-unknown to ignore them.'
+            )
+
+        loaded = {fields[header[index].strip()].column for index in keep}
+        missing = [
+            field.column for field in model._meta.concrete_fields
+            if not field.null
+            and not field.has_default()
+            and field.db_default is NOT_PROVIDED
+            and not field.primary_key
+            and field.column not in loaded
+        ]
+        if missing:
+            raise CommandError(f'Required column(s) missing in the file: {", ".join(missing)}.')
+        return keep, columns
+
+    # Checkpoints ----------
+
+    def get_checkpoint(self, path, model, restart):
+        source = f'{model._meta.label}:{os.path.abspath(path)}:{os.path.getsize(path)}'
+        if len(source) > 255:
+            source = hashlib.sha1(source.encode()).hexdigest()
+        checkpoint, _ = CsvImport.objects.get_or_create(source=source)
+        if restart:
+            checkpoint.rows_committed = 0
+            checkpoint.finished = False
+            checkpoint.save()
+        return checkpoint
+
+    @staticmethod
+    def skip_rows(reader, count):
+        skipped = 0
+        if not count:
+            return skipped
+        for _ in reader:
+            skipped += 1
+            if skipped == count:
+                break
+        return skipped
+
+    # Streaming ----------
+
+    @staticmethod
+    def chunks(reader, keep, width, chunk_size):
+        '''Yields (buffer, row_count) with at most chunk_size rows each.'''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        count = 0
+        for row in reader:
+            if len(row) < width:
+                # The chunks before this one stay committed
+                raise CommandError(
+                    f'Line {reader.line_num}: {len(row)} value(s), the header has {width}.'
+                )
+            writer.writerow([row[index] for index in keep])
+            count += 1
+            if count == chunk_size:
+                buffer.seek(0)
+                yield buffer, count
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                count = 0
+        if count:
+            buffer.seek(0)
+            yield buffer, count
+
+    @staticmethod
+    def merge_sql(table, columns, conflict_on):
+        conflict = ', '.join(connection.ops.quote_name(column) for column in conflict_on)
+        conflict_columns = {connection.ops.quote_name(column) for column in conflict_on}
+        updates = [f'{column} = EXCLUDED.{column}' for column in columns if column not in conflict_columns]
+        action = f'DO UPDATE SET {", ".join(updates)}' if updates else 'DO NOTHING'
+        return (
+            f'INSERT INTO {table} ({", ".join(columns)}) '
+            f'SELECT {", ".join(columns)} FROM import_staging '
+            f'ON CONFLICT ({conflict}) {action}'
+        )
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:20
+
+import django.core.validators
+import store.validators
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_alter_customer_user_alter_orderitem_order_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='product',
+            options={'ordering': ['title', 'id']},
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=16, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))]),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(upload_to='store/images', validators=[store.validators.valiodate_file_size]),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['title', 'id'], name='idx_product_title_id'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['unit_price', 'id'], name='idx_product_unit_price_id'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['last_update', 'id'], name='idx_product_last_update_id'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['collection', 'title', 'id'], name='idx_product_coll_title_id'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:22
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Keeps store_product.search_vector in sync with title and description.
+# Title words rank higher (weight A) than description words (weight B).
+CREATE_TRIGGER = '''
+CREATE FUNCTION store_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description ON store_product
+    FOR EACH ROW EXECUTE FUNCTION store_product_search_vector_update();
+
+-- Backfill existing rows (fires the trigger)
+UPDATE store_product SET title = title;
+'''
+
+DROP_TRIGGER = '''
+DROP TRIGGER IF EXISTS store_product_search_vector_trigger ON store_product;
+DROP FUNCTION IF EXISTS store_product_search_vector_update();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0025_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='idx_product_search_vector'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
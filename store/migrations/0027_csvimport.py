@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0026_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CsvImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('rows_committed', models.PositiveBigIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
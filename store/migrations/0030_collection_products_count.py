@@ -0,0 +1,92 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+# Keeps store_collection.products_count in sync with store_product.
+# Statement level triggers with transition tables: one UPDATE per collection
+# and statement, so bulk_create, update() and COPY (manage.py import_csv)
+# are counted too, without a row by row update of the same collection.
+# TRUNCATE is not counted, store.tasks.reconcile_products_count repairs it.
+CREATE_TRIGGERS = '''
+CREATE FUNCTION store_product_count_insert() RETURNS trigger AS $$
+BEGIN
+    UPDATE store_collection c SET products_count = c.products_count + d.n
+    FROM (SELECT collection_id, count(*) AS n FROM new_rows GROUP BY collection_id) d
+    WHERE c.id = d.collection_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION store_product_count_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE store_collection c SET products_count = c.products_count - d.n
+    FROM (SELECT collection_id, count(*) AS n FROM old_rows GROUP BY collection_id) d
+    WHERE c.id = d.collection_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION store_product_count_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE store_collection c SET products_count = c.products_count + d.n
+    FROM (
+        SELECT collection_id, sum(n) AS n FROM (
+            SELECT o.collection_id, -1 AS n
+            FROM old_rows o JOIN new_rows nw ON nw.id = o.id
+            WHERE nw.collection_id IS DISTINCT FROM o.collection_id
+            UNION ALL
+            SELECT nw.collection_id, 1 AS n
+            FROM old_rows o JOIN new_rows nw ON nw.id = o.id
+            WHERE nw.collection_id IS DISTINCT FROM o.collection_id
+        ) moves
+        GROUP BY collection_id
+    ) d
+    WHERE c.id = d.collection_id AND d.n <> 0;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_product_count_insert_trigger
+    AFTER INSERT ON store_product REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION store_product_count_insert();
+
+CREATE TRIGGER store_product_count_delete_trigger
+    AFTER DELETE ON store_product REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION store_product_count_delete();
+
+-- Transition tables don't allow UPDATE OF <column>, the function
+-- ignores rows whose collection didn't change
+CREATE TRIGGER store_product_count_update_trigger
+    AFTER UPDATE ON store_product REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION store_product_count_update();
+
+-- Backfill
+UPDATE store_collection c
+SET products_count = (SELECT count(*) FROM store_product p WHERE p.collection_id = c.id);
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER IF EXISTS store_product_count_insert_trigger ON store_product;
+DROP TRIGGER IF EXISTS store_product_count_delete_trigger ON store_product;
+DROP TRIGGER IF EXISTS store_product_count_update_trigger ON store_product;
+DROP FUNCTION IF EXISTS store_product_count_insert();
+DROP FUNCTION IF EXISTS store_product_count_delete();
+DROP FUNCTION IF EXISTS store_product_count_update();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0029_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='products_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
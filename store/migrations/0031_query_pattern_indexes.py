@@ -0,0 +1,41 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0030_collection_products_count'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='order',
+            options={'ordering': ['-placed_at', '-id'], 'permissions': [('cancel_order', 'Can cancel order')]},
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['collection', 'unit_price', 'id'], name='idx_product_coll_price_id'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['collection', 'last_update', 'id'], name='idx_product_coll_update_id'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['inventory', 'id'], name='idx_product_inventory_id'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('inventory__lt', 10)), fields=['title', 'id'], name='idx_product_low_stock_title'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'placed_at', 'id'], name='idx_order_customer_placed'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['placed_at', 'id'], name='idx_order_placed_id'),
+        ),
+    ]
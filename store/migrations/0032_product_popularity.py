@@ -0,0 +1,36 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0031_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='popularity',
+            field=models.FloatField(default=0, db_default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['popularity', 'id'], name='idx_product_popularity_id'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['collection', 'popularity', 'id'], name='idx_product_coll_popular_id'),
+        ),
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='store.product')),
+                ('sales', models.FloatField(default=0)),
+                ('likes', models.PositiveIntegerField(default=0)),
+                ('reviews', models.PositiveIntegerField(default=0)),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
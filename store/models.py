@@ -1,8 +1,10 @@
 from decimal import Decimal
 
 from django.contrib import admin
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from config.settings import common
-from django.db import models
+from django.db import models, connection
 from django.core.validators import MinValueValidator, FileExtensionValidator
 
 from uuid6 import uuid7
@@ -31,15 +33,56 @@ class Collection(models.Model):
         
     title = models.CharField(max_length=255)
     featured_product = models.ForeignKey('Product', on_delete=models.SET_NULL, null=True, related_name='+')
+    # Maintained by database triggers on store_product (migration 0030),
+    # repaired by store.tasks.reconcile_products_count
+    products_count = models.PositiveIntegerField(default=0, db_default=0, editable=False)
     
     def __str__(self):
         return self.title
     
+    def save(self, *args, **kwargs):
+        # Never write back products_count, the value loaded with the object
+        # would overwrite what the triggers counted meanwhile
+        if not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+            kwargs['update_fields'] = [name for name in update_fields if name != 'products_count']
+        super().save(*args, **kwargs)
+    
 
 class Product(models.Model):
     
     class Meta:
-        ordering = ['title']
+        # 'id' makes the ordering unique, so pages never overlap
+        ordering = ['title', 'id']
+        # Composite (sort_key, id) indexes for keyset pagination.
+        # See store.pagination.KeysetPagination
+        # Check the plans with: python manage.py explain_indexes
+        indexes = [
+            models.Index(fields=['title', 'id'], name='idx_product_title_id'),
+            models.Index(fields=['unit_price', 'id'], name='idx_product_unit_price_id'),
+            models.Index(fields=['last_update', 'id'], name='idx_product_last_update_id'),
+            models.Index(fields=['collection', 'title', 'id'], name='idx_product_coll_title_id'),
+            # ?collection_id= with ?ordering=unit_price / last_update (ProductFilter,
+            # OrderingFilter), price ranges inside a collection
+            models.Index(fields=['collection', 'unit_price', 'id'], name='idx_product_coll_price_id'),
+            models.Index(fields=['collection', 'last_update', 'id'], name='idx_product_coll_update_id'),
+            # ?inventory__gt= / ?inventory__lt=
+            models.Index(fields=['inventory', 'id'], name='idx_product_inventory_id'),
+            # ?ordering=-popularity, with and without ?collection_id=
+            models.Index(fields=['popularity', 'id'], name='idx_product_popularity_id'),
+            models.Index(fields=['collection', 'popularity', 'id'], name='idx_product_coll_popular_id'),
+            # Admin "Low" inventory filter (store.admin.InventoryFilter), only
+            # the few low stock rows are in this index
+            models.Index(
+                fields=['title', 'id'],
+                name='idx_product_low_stock_title',
+                condition=models.Q(inventory__lt=10)
+            ),
+            # Full text search. See store.filters.ProductSearchFilter
+            GinIndex(fields=['search_vector'], name='idx_product_search_vector'),
+        ]
         
     title = models.CharField(max_length=255)
     slug = models.SlugField()
@@ -61,6 +104,14 @@ class Product(models.Model):
     collection = models.ForeignKey(Collection, on_delete=models.PROTECT, related_name='products')
     # FK Many To Many. Django will create maby to many table on its own
     promotion = models.ManyToManyField(Promotion, blank=True)
+    # Weighted tsvector of title (A) and description (B). It is filled by a
+    # database trigger (see migration 0026), so bulk inserts, COPY and raw SQL
+    # keep it up to date too. Never set it from Python.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # ProductPopularity.score, copied by store.popularity.refresh() so the
+    # ordering can use the (popularity, id) indexes. Never set it from Python.
+    # db_default: COPY (manage.py import_csv) and raw INSERTs leave it out.
+    popularity = models.FloatField(default=0, db_default=0, editable=False)
     
     def __str__(self):
         return f"{self.title}"
@@ -85,9 +136,8 @@ class ProductImage(models.Model):
 
 class Customer(models.Model):
     class Meta:
-        # indexes = [
-        #     models.Index(fields=['last_name', 'first_name'], name='idx_last_name_first_name')
-        # ]
+        # Names are columns of core_user, the index for this ordering
+        # is on core.User (idx_user_name_id)
         ordering = ['user__first_name', 'user__last_name']
         permissions = [
             ('view_history', 'Can view history')
@@ -127,6 +177,14 @@ class Order(models.Model):
     
     # Customer permission
     class Meta:
+        # Newest first, the API and the admin list orders this way
+        ordering = ['-placed_at', '-id']
+        indexes = [
+            # Orders of one customer (OrderViewSet.get_queryset)
+            models.Index(fields=['customer', 'placed_at', 'id'], name='idx_order_customer_placed'),
+            # All orders, staff and admin
+            models.Index(fields=['placed_at', 'id'], name='idx_order_placed_id'),
+        ]
         permissions = [
             ('cancel_order', 'Can cancel order')
         ]
@@ -147,6 +205,15 @@ class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT)
     
 
+# Stock taken by a pending order. See store/inventory.py
+class InventoryReservation(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    # Pending orders give the stock back after this moment
+    expires_at = models.DateTimeField(db_index=True)
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='orderitems')
@@ -171,9 +238,84 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
 
+# Custom manager
+class CartItemManager(models.Manager):
+    def add(self, cart_id, product_id: int, quantity: int):
+        '''Adds quantity of the product to the cart in one statement.
+        
+        The row is inserted, or if the product is already in the cart, its
+        quantity is incremented by the database, so concurrent adds never
+        lose an update or hit the unique (cart, product) constraint.
+        The cart and the product are joined in the SELECT, so nothing is
+        inserted when one of them does not exist, and None is returned.'''
+        meta = self.model._meta
+        qn = connection.ops.quote_name
+        table = qn(meta.db_table)
+        cart = meta.get_field('cart')
+        product = meta.get_field('product')
+        sql = f'''
+            INSERT INTO {table} ({qn(cart.column)}, {qn(product.column)}, {qn('quantity')})
+            SELECT c.{qn(Cart._meta.pk.column)}, p.{qn(Product._meta.pk.column)}, %s
+            FROM {qn(Cart._meta.db_table)} c, {qn(Product._meta.db_table)} p
+            WHERE c.{qn(Cart._meta.pk.column)} = %s AND p.{qn(Product._meta.pk.column)} = %s
+            ON CONFLICT ({qn(cart.column)}, {qn(product.column)})
+            DO UPDATE SET {qn('quantity')} = {table}.{qn('quantity')} + EXCLUDED.{qn('quantity')}
+            RETURNING {qn(meta.pk.column)}, {qn('quantity')}
+        '''
+        params = [quantity, cart.get_db_prep_value(cart_id, connection), product_id]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return self.model(id=row[0], cart_id=cart_id, product_id=product_id, quantity=row[1])
+
+    def add_many(self, cart_id, items):
+        '''add() for many (product_id, quantity) pairs in one statement.
+
+        Quantities of the same product are summed first, one INSERT can
+        not update a row twice. Products that do not exist are skipped,
+        nothing is inserted if the cart does not exist. Returns the
+        inserted or updated items.'''
+        quantities = {}
+        for product_id, quantity in items:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        if not quantities:
+            return []
+
+        meta = self.model._meta
+        qn = connection.ops.quote_name
+        table = qn(meta.db_table)
+        cart = meta.get_field('cart')
+        product = meta.get_field('product')
+        values = ', '.join(['(%s, %s)'] * len(quantities))
+        sql = f'''
+            INSERT INTO {table} ({qn(cart.column)}, {qn(product.column)}, {qn('quantity')})
+            SELECT c.{qn(Cart._meta.pk.column)}, p.{qn(Product._meta.pk.column)}, v.quantity
+            FROM {qn(Cart._meta.db_table)} c,
+                 (VALUES {values}) AS v (product_id, quantity)
+                 JOIN {qn(Product._meta.db_table)} p ON p.{qn(Product._meta.pk.column)} = v.product_id
+            WHERE c.{qn(Cart._meta.pk.column)} = %s
+            ON CONFLICT ({qn(cart.column)}, {qn(product.column)})
+            DO UPDATE SET {qn('quantity')} = {table}.{qn('quantity')} + EXCLUDED.{qn('quantity')}
+            RETURNING {qn(meta.pk.column)}, {qn(product.column)}, {qn('quantity')}
+        '''
+        params = [value for pair in quantities.items() for value in pair]
+        params.append(cart.get_db_prep_value(cart_id, connection))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [
+            self.model(id=pk, cart_id=cart_id, product_id=product_id, quantity=quantity)
+            for pk, product_id, quantity in rows
+        ]
+
+
 class CartItem(models.Model):
     class Meta:
         unique_together = [['cart', 'product']]
+    
+    objects = CartItemManager()
         
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -187,4 +329,51 @@ class Review(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
     date = models.DateField(auto_now_add=True)
-    
\ No newline at end of file
+
+
+# Popularity of a product at the last store.popularity.refresh(),
+# score = time decayed sales + likes + reviews, with their weights.
+class ProductPopularity(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='ranking')
+    sales = models.FloatField(default=0)
+    likes = models.PositiveIntegerField(default=0)
+    reviews = models.PositiveIntegerField(default=0)
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+
+# Progress of manage.py import_csv. Updated in the same transaction
+# as every imported chunk, so an interrupted import resumes exactly
+# after the last committed row.
+class CsvImport(models.Model):
+    source = models.CharField(max_length=255, unique=True)
+    rows_committed = models.PositiveBigIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f'{self.source} ({self.rows_committed} rows)'
+
+
+# Events written in the same transaction as the change they describe.
+# Delivered to the listeners by Celery after the commit. See store/outbox.py
+class OutboxEvent(models.Model):
+    topic = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    
+    class Meta:
+        indexes = [
+            # The drain task only looks for undelivered events
+            models.Index(
+                fields=['created_at'], 
+                name='idx_outbox_pending', 
+                condition=models.Q(processed_at__isnull=True)
+            ),
+        ]
+    
+    def __str__(self):
+        return f'{self.topic} #{self.pk}'
@@ -0,0 +1,101 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEvent, Order
+from .signals import order_created
+
+
+logger = logging.getLogger(__name__)
+
+
+# Transactional outbox ------------------------------------------------
+# Listeners of store events don't run in the request anymore. The request
+# only inserts an OutboxEvent row inside its own transaction, so the event
+# exists if and only if the change was committed. After the commit the
+# event is handed to Celery (store.tasks.deliver_event), and the worker
+# sends the Django signal to the listeners.
+#
+# If the broker is down or the worker fails, the event stays undelivered
+# and store.tasks.drain_outbox picks it up again. Delivery is therefore
+# "at least once": listeners should tolerate receiving an event twice.
+
+MAX_ATTEMPTS = 10
+# Events younger than this are still on their way from on_commit()
+DRAIN_DELAY = timedelta(seconds=30)
+DRAIN_BATCH_SIZE = 100
+# Delivered events are kept this long for debugging, then deleted
+RETENTION = timedelta(days=7)
+
+ORDER_CREATED = 'order.created'
+
+
+def publish(topic: str, payload: dict) -> OutboxEvent:
+    '''Records the event, it is delivered after the current transaction commits.'''
+    event = OutboxEvent.objects.create(topic=topic, payload=payload)
+    transaction.on_commit(lambda: _enqueue(event.pk))
+    return event
+
+
+def _enqueue(event_id):
+    # Imported here, store.tasks imports this module
+    from .tasks import deliver_event
+    try:
+        deliver_event.delay(event_id)
+    except Exception:
+        # The order is already committed, never fail the request here
+        logger.exception('Could not enqueue outbox event %s, drain_outbox will retry it', event_id)
+
+
+# Delivery ----------
+
+def _send_order_created(payload):
+    order = Order.objects.get(pk=payload['order_id'])
+    order_created.send(Order, order=order)
+
+
+HANDLERS = {
+    ORDER_CREATED: _send_order_created,
+}
+
+
+def deliver(event_id: int) -> bool:
+    '''Runs the listeners of one event. Returns True once the event is delivered.'''
+    with transaction.atomic():
+        # A worker and the drain task may pick the same event, only one wins
+        event = OutboxEvent.objects \
+            .select_for_update(skip_locked=True) \
+            .filter(pk=event_id, processed_at__isnull=True) \
+            .first()
+        if event is None:
+            return False
+        
+        try:
+            # Savepoint: a failing listener must not break the bookkeeping below
+            with transaction.atomic():
+                HANDLERS[event.topic](event.payload)
+        except Exception as ex:
+            logger.exception('Outbox event %s failed', event)
+            OutboxEvent.objects \
+                .filter(pk=event.pk) \
+                .update(attempts=F('attempts') + 1, last_error=repr(ex))
+            return False
+        
+        OutboxEvent.objects.filter(pk=event.pk).update(processed_at=timezone.now())
+        return True
+
+
+def drain() -> int:
+    '''Delivers the events that were lost or failed. Returns the number delivered.'''
+    now = timezone.now()
+    event_ids = OutboxEvent.objects \
+        .filter(processed_at__isnull=True, created_at__lte=now - DRAIN_DELAY, attempts__lt=MAX_ATTEMPTS) \
+        .order_by('created_at') \
+        .values_list('id', flat=True)[:DRAIN_BATCH_SIZE]
+    delivered = sum(deliver(event_id) for event_id in event_ids)
+    
+    OutboxEvent.objects.filter(processed_at__lte=now - RETENTION).delete()
+    return delivered
@@ -1,6 +1,369 @@
-from rest_framework.pagination import PageNumberPagination, LimitOffsetPagination
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import partial
 
-class ProductPagination(PageNumberPagination):
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, Page, Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import get_versions
+
+
+# Count strategies ----------------------------------------------------
+# PageNumberPagination runs an exact COUNT(*) with all the filters on every
+# page, on a big table that costs as much as the page itself.
+#   exact      - COUNT(*)
+#   cached     - COUNT(*) kept in the cache for count_cache_timeout seconds,
+#                per SQL of the filtered query (and count_cache_version())
+#   estimated  - COUNT(*) of at most estimate_threshold + 1 rows. Above the
+#                threshold the Postgres planner estimate is used instead:
+#                pg_class.reltuples for the whole table, the row estimate
+#                of EXPLAIN for filtered queries.
+#   auto       - cached, on a miss estimated
+# The response says which one was used in "count_strategy" ("cached" only
+# when the count came from the cache). Estimated and cached counts may be
+# off, so the count is not trusted for navigation: every page fetches
+# page_size + 1 rows and "next" comes from the extra row, a page beyond
+# the counted pages falls back to an exact count instead of a 404. When
+# the count is too high, the last pages may be empty.
+COUNT_EXACT = 'exact'
+COUNT_CACHED = 'cached'
+COUNT_ESTIMATED = 'estimated'
+COUNT_AUTO = 'auto'
+
+
+def estimate_count(queryset):
+    '''Row estimate of the Postgres planner, None on other databases.'''
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [connection.ops.quote_name(queryset.model._meta.db_table)]
+            )
+            row = cursor.fetchone()
+            # -1 until the table is analyzed for the first time
+            if row is not None and row[0] >= 0:
+                return int(row[0])
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CountingPage(Page):
+    '''Page that knows from the extra row whether a next page exists.'''
+
+    def __init__(self, object_list, number, paginator, more):
+        super().__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        return self.more
+
+    def next_page_number(self):
+        # Not validated against num_pages, the count may be an estimate
+        return self.number + 1
+
+
+class CountingPaginator(DjangoPaginator):
+    '''Django paginator that asks the pagination class for the count.'''
+
+    def __init__(self, object_list, per_page, pagination, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.pagination = pagination
+
+    @cached_property
+    def count(self):
+        return self.pagination.count_rows(self.object_list)
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if self.pagination.used_count_strategy == COUNT_EXACT or int(number) < 1:
+                raise
+        # Beyond the counted pages, the count may be too low
+        self.count = self.pagination.recount_rows(self.object_list)
+        self.__dict__.pop('num_pages', None)
+        return super().validate_number(number)
+
+    def page(self, number):
+        # orphans are not supported, PageNumberPagination doesn't use them
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        return CountingPage(rows[:self.per_page], number, self, more=len(rows) > self.per_page)
+
+
+class CountStrategyPagination(PageNumberPagination):
+    count_strategy = COUNT_AUTO
+    count_cache_timeout = 60
+    estimate_threshold = 10_000
+
+    @property
+    def django_paginator_class(self):
+        return partial(CountingPaginator, pagination=self)
+
+    def count_rows(self, queryset):
+        strategy = self.count_strategy
+        self.used_count_strategy = COUNT_EXACT
+        if strategy == COUNT_EXACT:
+            return queryset.count()
+
+        key = self.count_cache_key(queryset)
+        count = cache.get(key)
+        if count is not None:
+            self.used_count_strategy = COUNT_CACHED
+            return count
+
+        if strategy == COUNT_CACHED:
+            count = queryset.count()
+        else:
+            count = self.estimate_rows(queryset)
+        if strategy != COUNT_ESTIMATED:
+            cache.set(key, count, self.count_cache_timeout)
+        return count
+
+    def recount_rows(self, queryset):
+        '''Exact count, for a page beyond an estimated or cached count.'''
+        self.used_count_strategy = COUNT_EXACT
+        count = queryset.count()
+        if self.count_strategy != COUNT_ESTIMATED:
+            cache.set(self.count_cache_key(queryset), count, self.count_cache_timeout)
+        return count
+
+    def estimate_rows(self, queryset):
+        # Small results are counted exactly, the scan stops after threshold + 1 rows
+        threshold = self.estimate_threshold
+        count = queryset.order_by()[:threshold + 1].count()
+        if count <= threshold:
+            return count
+        estimate = estimate_count(queryset)
+        if estimate is None:
+            return queryset.count()
+        self.used_count_strategy = COUNT_ESTIMATED
+        return max(estimate, threshold + 1)
+
+    def count_cache_key(self, queryset):
+        # Without ORDER BY, every ordering of the same filters shares the count
+        sql, params = queryset.order_by().query.sql_with_params()
+        raw = f'{sql}|{params}|{self.count_cache_version()}'
+        return f'store:count:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+    def count_cache_version(self):
+        '''Part of the cache key, change it to drop the cached counts.'''
+        return ''
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'count_strategy': self.used_count_strategy,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_strategy'] = {
+            'type': 'string',
+            'enum': [COUNT_EXACT, COUNT_CACHED, COUNT_ESTIMATED],
+        }
+        return response_schema
+
+
+class ProductPagination(CountStrategyPagination):
     # For Limit Offset
     # default_limit = 3
-    page_size = 10
\ No newline at end of file
+    page_size = 10
+    
+    def count_cache_version(self):
+        # Bumped by every product change (store/cache.py)
+        version, = get_versions('global')
+        return version
+
+
+# Keyset (seek) pagination ----------------------------------------------
+# PageNumberPagination runs COUNT(*) and OFFSET N on every page, so deep pages
+# get slower as the table grows. Keyset pagination remembers the sort key of the
+# last row it returned and asks for rows "after" it:
+#   WHERE (unit_price, id) > (12.50, 731) ORDER BY unit_price, id LIMIT 11
+# With a (unit_price, id) index every page costs the same as the first one.
+# The primary key is always appended to the ordering, so the sort key is unique
+# and no row is skipped or repeated between pages.
+class KeysetPagination(BasePagination):
+    page_size = 10
+    cursor_query_param = 'cursor'
+    # ?count=true adds the exact total to the response. It is off by default,
+    # because the count is the expensive part we are trying to avoid.
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+    PK_ALIASES = {'pk': 'id', '-pk': '-id'}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(queryset)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+
+        values, reverse = self.decode_cursor(request, queryset)
+        self.has_cursor = values is not None
+
+        ordering = self.ordering
+        if reverse:
+            # Walk backwards from the cursor and flip the rows afterwards
+            ordering = [self.invert(term) for term in ordering]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.seek_filter(ordering, values))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.has_cursor
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    # Ordering helpers ----------
+
+    def get_ordering(self, queryset):
+        # OrderingFilter has already called .order_by() on the queryset,
+        # otherwise fall back to Meta.ordering of the model.
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        ordering = [self.PK_ALIASES.get(term, term) for term in ordering if isinstance(term, str)]
+        if not any(term.lstrip('-') == 'id' for term in ordering):
+            # Tie breaker follows the direction of the main key, so a single
+            # (key, id) index can be scanned in both directions.
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append('-id' if descending else 'id')
+        return ordering
+
+    @staticmethod
+    def invert(term):
+        return term[1:] if term.startswith('-') else f'-{term}'
+
+    @staticmethod
+    def seek_filter(ordering, values):
+        # Lexicographic "row after the cursor" condition:
+        # k1 > v1 OR (k1 = v1 AND k2 > v2) OR (k1 = v1 AND k2 = v2 AND k3 > v3) ...
+        # The leading k1 >= v1 lets the database start an index range scan at v1.
+        condition = Q()
+        equal = Q()
+        for term, value in zip(ordering, values):
+            field = term.lstrip('-')
+            lookup = 'lt' if term.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        first = ordering[0]
+        first_lookup = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{first_lookup}': values[0]}) & condition
+
+    # Cursor encoding ----------
+    # The cursor is opaque for the client: base64 of the sort key values
+    # of the boundary row plus the direction.
+
+    def encode_cursor(self, instance, reverse):
+        values = [self.get_value(instance, term.lstrip('-')) for term in self.ordering]
+        payload = json.dumps({'v': values, 'r': int(reverse)}, default=str, separators=(',', ':'))
+        cursor = urlsafe_b64encode(payload.encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            values = payload['v']
+            reverse = bool(payload.get('r'))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                # Cursor was built for another ordering
+                raise ValueError
+            # A tampered value would otherwise fail in the database
+            values = [
+                self.get_field(queryset, term.lstrip('-')).to_python(value)
+                for term, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    @staticmethod
+    def get_field(queryset, path):
+        # Annotations (the search rank) by their output field, model fields
+        # through the relations, e.g. collection__title
+        annotation = queryset.query.annotations.get(path)
+        if annotation is not None:
+            return annotation.output_field
+        model = queryset.model
+        *relations, name = path.split(LOOKUP_SEP)
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+    @staticmethod
+    def get_value(instance, field):
+        if isinstance(instance, dict):
+            return instance[field]
+        return getattr(instance, field)
+
+
+class ProductKeysetPagination(KeysetPagination):
+    page_size = 10
@@ -0,0 +1,64 @@
+from django.utils.cache import patch_vary_headers
+
+from likes import counters
+from likes.models import LikedItems
+from .fieldsets import select_names
+
+
+# Liked by me ---------------------------------------------------------
+# Every product of list and retrieve gets "liked_by_me": true/false.
+#
+# The product responses are cached for everyone (store/cache.py), so the
+# flag is added in finalize_response(), after the cache and per request.
+# The likes of the user among the ids of the page are one IN query on the
+# (user, content_type, object_id) unique index of LikedItems, anonymous
+# users cost nothing. As with ?include=tags, rows are matched by id.
+# Sparse fieldsets apply: ?fields=id,title leaves the flag out,
+# ?fields=id,title&expand=liked_by_me or ?exclude=liked_by_me work as usual.
+#
+# The ETag covers the likes version of the user (likes/counters.py), a
+# like or unlike changes the ETag of every page for that user only.
+
+class LikedByMeMixin:
+    '''View mixin, adds liked_by_me to the serialized objects.'''
+    liked_by_me_actions = ('list', 'retrieve')
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'action', None) not in self.liked_by_me_actions:
+            return response
+        # Shared caches must not serve the page of a user to someone else
+        patch_vary_headers(response, ['Authorization'])
+        if response.status_code == 200 and response.data is not None and self.wants_liked_by_me(request):
+            response.data = self.add_liked_by_me(request, response.data)
+        return response
+
+    @staticmethod
+    def wants_liked_by_me(request):
+        return bool(select_names(['liked_by_me'], ['liked_by_me'], request))
+
+    def add_liked_by_me(self, request, data):
+        paginated = isinstance(data, dict) and 'results' in data
+        if paginated:
+            items = data['results']
+        elif isinstance(data, dict):
+            items = [data]
+        else:
+            items = data
+
+        liked = set()
+        if request.user.is_authenticated:
+            ids = [item['id'] for item in items if 'id' in item]
+            liked = LikedItems.objects.liked_ids(request.user.id, self.get_queryset().model, ids)
+        # New dicts, the data can be the object of the response cache
+        items = [{**item, 'liked_by_me': item['id'] in liked} if 'id' in item else item for item in items]
+
+        if paginated:
+            return {**data, 'results': items}
+        return items[0] if isinstance(data, dict) else items
+
+    def get_etag_extra(self, request):
+        extra = super().get_etag_extra(request)
+        if request.user.is_authenticated:
+            extra += f'|likes:{request.user.id}:{counters.user_version(request.user.id)}'
+        return extra
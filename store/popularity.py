@@ -0,0 +1,212 @@
+import time
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from likes.models import LikeCount
+from .cache import bump_version, invalidate_products
+from .models import Order, OrderItem, Product, ProductPopularity, Review
+
+
+# Popularity ranking --------------------------------------------------
+#   score = SALE_WEIGHT * sales + LIKE_WEIGHT * likes + REVIEW_WEIGHT * reviews
+#
+# sales are the ordered quantities, each halved every HALF_LIFE seconds
+# since the order was placed, so last week's best sellers fade out.
+#
+# refresh() (Celery beat, store.tasks.refresh_popularity) computes the
+# exact scores with one query and writes them to
+#   ProductPopularity          the summary, one row per product
+#   Product.popularity         ?ordering=-popularity on the (popularity, id) indexes
+#   store:popularity:global    Redis sorted sets, /store/products/top/
+#   store:popularity:collection:<id>
+#
+# Between two refreshes orders, likes and reviews are added to the sorted
+# sets right away with ZINCRBY (signal handlers, store/signals/handlers.py).
+# The sets use forward decay: scores are kept in the units of the last
+# refresh (store:popularity:epoch), a new event at time t is added as
+# points * 2 ** ((t - epoch) / HALF_LIFE) and top() scales the scores back
+# to now. Old events never have to be rewritten, the next refresh makes
+# everything exact again, events that arrive during a refresh may only
+# count from the next one. Reads are ZREVRANGE, O(log n + limit).
+
+HALF_LIFE = 7 * 24 * 60 * 60
+# Older sales weigh less than 1/256 and are left out
+SALES_WINDOW = 8 * HALF_LIFE
+SALE_WEIGHT = 1.0
+LIKE_WEIGHT = 0.5
+REVIEW_WEIGHT = 2.0
+
+EPOCH_KEY = 'store:popularity:epoch'
+# Version of the popularity ordering, part of its ETags and cache keys
+VERSION_SCOPE = 'popularity'
+REFRESH_BATCH = 2000
+# /store/products/top/?limit=
+TOP_LIMIT = 10
+MAX_TOP_LIMIT = 100
+
+
+def redis():
+    return get_redis_connection('default')
+
+
+def ranking_key(collection_id=None):
+    if collection_id is None:
+        return 'store:popularity:global'
+    return f'store:popularity:collection:{collection_id}'
+
+
+def add(points_by_product, now=None):
+    '''Adds {product id: points} to the sorted sets.'''
+    if not points_by_product:
+        return
+    connection = redis()
+    epoch = connection.get(EPOCH_KEY)
+    if epoch is None:
+        # Never refreshed, the first refresh() counts everything
+        return
+    now = time.time() if now is None else now
+    scale = 2 ** ((now - float(epoch)) / HALF_LIFE)
+    collections = dict(
+        Product.objects
+        .filter(pk__in=list(points_by_product))
+        .values_list('id', 'collection_id')
+    )
+    pipe = connection.pipeline(transaction=False)
+    for product_id, collection_id in collections.items():
+        points = points_by_product[product_id] * scale
+        pipe.zincrby(ranking_key(), points, product_id)
+        pipe.zincrby(ranking_key(collection_id), points, product_id)
+    pipe.execute()
+
+
+def add_order(order_id):
+    quantities = {}
+    for product_id, quantity in OrderItem.objects.filter(order_id=order_id).values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity * SALE_WEIGHT
+    add(quantities)
+
+
+def top(limit, collection_id=None, now=None):
+    '''[(product id, score now)], the most popular first.'''
+    pipe = redis().pipeline(transaction=False)
+    pipe.get(EPOCH_KEY)
+    pipe.zrevrange(ranking_key(collection_id), 0, limit - 1, withscores=True)
+    epoch, ranking = pipe.execute()
+    if epoch is None:
+        return []
+    now = time.time() if now is None else now
+    scale = 2 ** (-(now - float(epoch)) / HALF_LIFE)
+    return [(int(member), score * scale) for member, score in ranking]
+
+
+def compute_scores(now):
+    '''(product id, collection id, sales, likes, reviews) of every product.'''
+    qn = connection.ops.quote_name
+    sql = f'''
+        SELECT p.id, p.collection_id, COALESCE(s.sales, 0), COALESCE(l.likes, 0), COALESCE(r.reviews, 0)
+        FROM {qn(Product._meta.db_table)} p
+        LEFT JOIN (
+            SELECT oi.product_id,
+                   SUM(oi.quantity * POWER(0.5, EXTRACT(EPOCH FROM (%s - o.placed_at)) / %s)) AS sales
+            FROM {qn(OrderItem._meta.db_table)} oi
+            JOIN {qn(Order._meta.db_table)} o ON o.id = oi.order_id
+            WHERE o.placed_at >= %s AND o.payment_status <> %s
+            GROUP BY oi.product_id
+        ) s ON s.product_id = p.id
+        LEFT JOIN (
+            SELECT object_id, count AS likes
+            FROM {qn(LikeCount._meta.db_table)}
+            WHERE content_type_id = %s
+        ) l ON l.object_id = p.id
+        LEFT JOIN (
+            SELECT product_id, COUNT(*) AS reviews
+            FROM {qn(Review._meta.db_table)}
+            GROUP BY product_id
+        ) r ON r.product_id = p.id
+    '''
+    params = [
+        now, HALF_LIFE,
+        now - timedelta(seconds=SALES_WINDOW), Order.PAYMENT_STATUS_FAILED,
+        ContentType.objects.get_for_model(Product).id,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def score(sales, likes, reviews):
+    return SALE_WEIGHT * sales + LIKE_WEIGHT * likes + REVIEW_WEIGHT * reviews
+
+
+def refresh(now=None):
+    '''Recomputes all the scores. Returns the number of products whose
+    score changed.'''
+    now = timezone.now() if now is None else now
+    rows = compute_scores(now)
+    previous = dict(ProductPopularity.objects.values_list('product_id', 'score'))
+
+    rankings = []
+    changed_collections = set()
+    for product_id, collection_id, sales, likes, reviews in rows:
+        ranking = ProductPopularity(
+            product_id=product_id, sales=float(sales), likes=likes, reviews=reviews,
+            score=score(float(sales), likes, reviews)
+        )
+        rankings.append((ranking, collection_id))
+        if previous.get(product_id) != ranking.score:
+            changed_collections.add(collection_id)
+
+    ProductPopularity.objects.bulk_create(
+        [ranking for ranking, _ in rankings],
+        batch_size=REFRESH_BATCH,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['sales', 'likes', 'reviews', 'score', 'updated_at'],
+    )
+    # One UPDATE copies the scores, rows whose score didn't move are not written
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            UPDATE {qn(Product._meta.db_table)} p SET popularity = r.score
+            FROM {qn(ProductPopularity._meta.db_table)} r
+            WHERE r.product_id = p.id AND p.popularity IS DISTINCT FROM r.score
+        ''')
+        changed = cursor.rowcount
+
+    rebuild_rankings(rankings, now.timestamp())
+    if changed:
+        bump_version(VERSION_SCOPE)
+        # Cached product lists ordered by popularity
+        invalidate_products(collection_ids=changed_collections)
+    return changed
+
+
+def rebuild_rankings(rankings, epoch):
+    '''Replaces the sorted sets. Each one is built under a temporary key and
+    renamed, readers never see a half built ranking.'''
+    members = {ranking_key(): {}}
+    for ranking, collection_id in rankings:
+        members[ranking_key()][ranking.product_id] = ranking.score
+        members.setdefault(ranking_key(collection_id), {})[ranking.product_id] = ranking.score
+
+    connection = redis()
+    stale = set(key.decode() for key in connection.scan_iter(ranking_key('*'))) - set(members)
+    pipe = connection.pipeline(transaction=False)
+    for key, scores in members.items():
+        temporary = f'{key}:building'
+        pipe.delete(temporary)
+        items = list(scores.items())
+        for start in range(0, len(items), REFRESH_BATCH):
+            pipe.zadd(temporary, dict(items[start:start + REFRESH_BATCH]))
+        if items:
+            pipe.rename(temporary, key)
+        else:
+            pipe.delete(key)
+    if stale:
+        pipe.delete(*stale)
+    pipe.set(EPOCH_KEY, epoch)
+    pipe.execute()
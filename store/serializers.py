@@ -1,17 +1,21 @@
 from __future__ import annotations
 from decimal import Decimal
 
-from django.db.models import Count
+from django.db.models import Count, Exists, OuterRef
 from django.db import transaction
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
 
 from .models import Product, Collection, Review, Cart, CartItem
 from .models import Customer,  Order, OrderItem, ProductImage
 
-from .signals import order_created
+from . import outbox
+from .bulk import BulkListSerializer, BulkPrimaryKeyRelatedField
+from .fieldsets import DynamicFieldsMixin
+from .inventory import InsufficientStock, reserve_stock, confirm_reservations, release_reservations
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Review 
         fields = ['id', 'date', 'name', 'description']
@@ -22,7 +26,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         
     
 
-class CollectionSerializer(serializers.ModelSerializer):
+class CollectionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Collection 
         fields = ['id', 'title', 'products_count']
@@ -77,11 +81,19 @@ class ProductImageSerializer(serializers.ModelSerializer):
         return product_image
     
         
-class ProductSerializer(serializers.ModelSerializer):
+# ?fields=, ?exclude= and ?expand= are handled by DynamicFieldsMixin (store/fieldsets.py)
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product 
         fields = ['id', 'title', 'slug', 'description', 'unit_price', 'price_with_tax', 'inventory', 'collection', 'images']
+        expandable_fields = ['images']
+        # Model fields the method fields read, for the .only() of the view
+        # and the compiled list (store/compiled.py)
+        field_dependencies = {'price_with_tax': ['unit_price']}
+        # Bulk endpoint, collections are loaded with one IN query (store/bulk.py)
+        list_serializer_class = BulkListSerializer
     
+    serializer_related_field = BulkPrimaryKeyRelatedField
     # price = serializers.DecimalField(max_digits=16, decimal_places=2, source='unit_price')
     price_with_tax = serializers.SerializerMethodField(method_name='calculate_price_with_tax')
     # collection = CollectionSerializer()
@@ -128,6 +140,9 @@ class CartItemSerializer(serializers.ModelSerializer):
     total_price = serializers.SerializerMethodField(method_name='get_total_cart_item_price')
     
     def get_total_cart_item_price(self, cart_item: CartItem):
+        # Annotated by CartViewSet/CartItemViewSet querysets
+        if hasattr(cart_item, 'total_price'):
+            return cart_item.total_price # type: ignore
         return cart_item.quantity * cart_item.product.unit_price
 
 
@@ -143,41 +158,69 @@ class CartSerializer(serializers.ModelSerializer):
     
     # Name of the method should atart with get_ it is convention
     def get_cart_total_price(self, cart: Cart) -> int:
+        # Calculated by the database in CartViewSet.queryset,
+        # SUM() of an empty cart is NULL
+        if hasattr(cart, 'total_price'):
+            return cart.total_price or 0 # type: ignore
         total_price = 0
         for cart_item in cart.items.all(): # type: ignore
             total_price += cart_item.quantity * cart_item.product.unit_price
         return total_price
     
 
+class AddCartItemListSerializer(BulkListSerializer):
+    
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        # Existence of all the products in one IN query
+        product_ids = {item['product_id'] for item in items}
+        existing = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+        errors = [
+            {} if item['product_id'] in existing
+            else {'product_id': ['No product with the given ID was found']}
+            for item in items
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+    
+    # Same upsert as AddCartItemSerializer.save(), for all items at once
+    def save(self, **kwargs):
+        cart_id = self.context['cart_id']
+        items = [(item['product_id'], item['quantity']) for item in self.validated_data] # type: ignore
+        
+        cart_items = CartItem.objects.add_many(cart_id, items) # type: ignore
+        if not cart_items and not Cart.objects.filter(pk=cart_id).exists():
+            raise NotFound('No cart with the given ID was found')
+        
+        self.instance = cart_items
+        return self.instance
+
+
 class AddCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem 
         fields = ['id', 'product_id', 'quantity']
+        list_serializer_class = AddCartItemListSerializer
     
     product_id = serializers.IntegerField()
     
-    # All validation methids start from validate_ (Convention)
-    # Otherwise will not work.
-    def validate_product_id(self, value):
-        if not Product.objects.filter(pk=value).exists():
-            raise serializers.ValidationError('No product with the given ID was found')
-        return value
-    
+    # Product existence is not validated here with a separate query.
+    # CartItem.objects.add() joins the product (and the cart) in the
+    # INSERT itself and inserts nothing if one of them does not exist.
     def save(self, **kwargs):
         cart_id = self.context['cart_id']
         product_id = self.validated_data['product_id'] # type: ignore
         quantity = self.validated_data['quantity'] # type: ignore
-        try:
-            # Updating existing Item
-            cart_item = CartItem.objects.get(cart_id=cart_id, product_id=product_id)
-            cart_item.quantity += quantity
-        except CartItem.DoesNotExist:
-            # Creating a new Item
-            cart_item = CartItem.objects.create(cart_id=cart_id, **self.validated_data) # type: ignore
-
-        cart_item.save()
-        self.instance = cart_item
         
+        cart_item = CartItem.objects.add(cart_id, product_id, quantity) # type: ignore
+        if cart_item is None:
+            # Rare error path, find out what was missing
+            if not Cart.objects.filter(pk=cart_id).exists():
+                raise NotFound('No cart with the given ID was found')
+            raise serializers.ValidationError({'product_id': ['No product with the given ID was found']})
+        
+        self.instance = cart_item
         return self.instance
     
 
@@ -187,7 +230,15 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
         fields = ['quantity']
         
 
-class CustomerSerializer(serializers.ModelSerializer):
+# PATCH of the bulk endpoint, the response has to tell the items apart
+class BulkUpdateCartItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CartItem 
+        fields = ['id', 'quantity']
+        list_serializer_class = BulkListSerializer
+        
+
+class CustomerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer 
         fields = ['id', 'user_id', 'phone', 'birth_date', 'membership']
@@ -201,6 +252,8 @@ class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'unit_price', 'quantity', 'total_price']
+        # Columns the method fields read, for the compiled list (store/compiled.py)
+        field_dependencies = {'unit_price': ['product__unit_price']}
     
     product = SimpleProductSerializer()
     unit_price = serializers.SerializerMethodField(method_name='get_unit_price')
@@ -210,18 +263,26 @@ class OrderItemSerializer(serializers.ModelSerializer):
         return order_item.product.unit_price
     
     def get_total_price(self, order_item: OrderItem):
+        if hasattr(order_item, 'total_price'):
+            return order_item.total_price # type: ignore
         return order_item.product.unit_price * order_item.quantity
     
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     
     class Meta:
         model = Order 
         fields = ['id', 'customer', 'placed_at', 'payment_status', 'items', 'total_price']
+        expandable_fields = ['items']
+        # Annotated by OrderViewSet.get_queryset
+        field_dependencies = {'total_price': []}
     
     items = OrderItemSerializer(many=True, read_only=True)
     total_price = serializers.SerializerMethodField(method_name='get_total_price')
     
     def get_total_price(self, order: Order):
+        # Calculated by the database in OrderViewSet.get_queryset
+        if hasattr(order, 'total_price'):
+            return order.total_price or 0 # type: ignore
         total_price = 0 
         item: OrderItem
         for item in order.items.all(): # type: ignore
@@ -234,6 +295,16 @@ class UpdateOrderSerializer(serializers.ModelSerializer):
         model = Order 
         fields = ['payment_status']
     
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            order = super().update(instance, validated_data)
+            # Paid orders keep the stock, failed ones give it back
+            if order.payment_status == Order.PAYMENT_STATUS_COMPLETE:
+                confirm_reservations(order)
+            elif order.payment_status == Order.PAYMENT_STATUS_FAILED:
+                release_reservations(order.reservations.all()) # type: ignore
+            return order
+    
     
 
 class CreateOrderSerializer(serializers.Serializer):
@@ -242,9 +313,14 @@ class CreateOrderSerializer(serializers.Serializer):
     
     # Validate + Field name will be executed automatically on .is_valid() method
     def validate_cart_id(self, cart_id):
-        if not Cart.objects.filter(pk=cart_id).exists():
+        # One query: None if there is no such cart, False if it is empty
+        has_items = Cart.objects \
+            .filter(pk=cart_id) \
+            .values_list(Exists(CartItem.objects.filter(cart_id=OuterRef('pk'))), flat=True) \
+            .first()
+        if has_items is None:
             raise serializers.ValidationError('The cart with provided id does not exist.')
-        if CartItem.objects.filter(cart_id=cart_id).count() == 0:
+        if not has_items:
             raise serializers.ValidationError('The cart is empty')
         return cart_id
         
@@ -270,11 +346,22 @@ class CreateOrderSerializer(serializers.Serializer):
             
             OrderItem.objects.bulk_create(order_items)
             
+            # One conditional UPDATE for all lines, fails if any product is short
+            try:
+                reserve_stock(order, [(item.product_id, item.quantity) for item in cart_items])
+            except InsufficientStock as ex:
+                raise serializers.ValidationError({
+                    'cart_id': [
+                        f'Not enough stock for product {pk}, {available} available.'
+                        for pk, available in ex.available.items()
+                    ]
+                })
+            
             Cart.objects.filter(pk=cart_id).delete()
             
-            # Signal created in store/signals/__init__.py
-            # First attribute is the SENDER then **kwargs
-            order_created.send_robust(self.__class__, order=order)
+            # Listeners of the order_created signal (store/signals/__init__.py)
+            # run in a Celery worker after the commit, see store/outbox.py
+            outbox.publish(outbox.ORDER_CREATED, {'order_id': order.pk})
             
             return order
        
@@ -1,13 +1,131 @@
-
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.functions import Now
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
 from django.dispatch import receiver
 from django.conf import settings
 
-from store.models import Customer 
+from store.models import Customer, Product, ProductImage, Collection, Order, Review
+from store.signals import order_created
+from store import popularity
+from likes.signals import like_changed
+from store.cache import invalidate_products
+from store.inventory import release_reservations
+from tags.models import Tag, TaggedItem
 
 
 # Signal handler
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_for_new_user(sender, **kwargs):
     if kwargs['created']:
-        Customer.objects.create(user=kwargs['instance']) 
\ No newline at end of file
+        Customer.objects.create(user=kwargs['instance']) 
+
+
+@receiver(pre_delete, sender=Order)
+def release_order_stock(sender, instance, **kwargs):
+    # Reservations would be deleted by CASCADE without giving the stock back
+    release_reservations(instance.reservations.all())
+
+
+# Product cache invalidation ------------------------------------------
+# Versions are bumped right away and once more after the transaction commits.
+# Without the second bump a concurrent request could read the new version,
+# still see the old (uncommitted) rows and cache them under the new version.
+
+def invalidate_now_and_on_commit(**kwargs):
+    invalidate_products(**kwargs)
+    transaction.on_commit(lambda: invalidate_products(**kwargs))
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_collection(sender, instance, **kwargs):
+    # Product can be moved to another collection, both have to be invalidated
+    instance._previous_collection_id = None
+    if instance.pk:
+        instance._previous_collection_id = Product.objects \
+            .filter(pk=instance.pk) \
+            .values_list('collection_id', flat=True) \
+            .first()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    product_ids = [instance.pk]
+    collection_ids = [instance.collection_id, getattr(instance, '_previous_collection_id', None)]
+    invalidate_now_and_on_commit(product_ids=product_ids, collection_ids=collection_ids)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_image_cache(sender, instance, **kwargs):
+    product_id = instance.product_id
+    # Images are part of the product, its ETag/Last-Modified has to change
+    Product.objects.filter(pk=product_id).update(last_update=Now())
+    collection_id = Product.objects \
+        .filter(pk=product_id) \
+        .values_list('collection_id', flat=True) \
+        .first()
+    invalidate_now_and_on_commit(product_ids=[product_id], collection_ids=[collection_id])
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_collection_cache(sender, instance, **kwargs):
+    invalidate_now_and_on_commit(collection_ids=[instance.pk])
+
+
+# Tags are part of the product with ?include=tags (store/tagging.py)
+def touch_products(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    Product.objects.filter(pk__in=product_ids).update(last_update=Now())
+    collection_ids = Product.objects \
+        .filter(pk__in=product_ids) \
+        .values_list('collection_id', flat=True) \
+        .distinct()
+    invalidate_now_and_on_commit(product_ids=product_ids, collection_ids=list(collection_ids))
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def invalidate_tagged_product_cache(sender, instance, **kwargs):
+    if instance.content_type_id == ContentType.objects.get_for_model(Product).id:
+        touch_products([instance.object_id])
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_relabeled_tag_cache(sender, instance, created, **kwargs):
+    if created:
+        return
+    touch_products(
+        TaggedItem.objects
+        .filter(tag=instance, content_type=ContentType.objects.get_for_model(Product))
+        .values_list('object_id', flat=True)
+    )
+
+
+# Popularity between two refreshes (store/popularity.py) ---------------
+
+@receiver(order_created)
+def add_order_popularity(sender, order, **kwargs):
+    # Sent by the outbox, after the commit of the order
+    popularity.add_order(order.pk)
+
+
+@receiver(post_save, sender=Review)
+def add_review_popularity(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: popularity.add({instance.product_id: popularity.REVIEW_WEIGHT}))
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_popularity(sender, instance, **kwargs):
+    transaction.on_commit(lambda: popularity.add({instance.product_id: -popularity.REVIEW_WEIGHT}))
+
+
+@receiver(like_changed)
+def add_like_popularity(sender, content_type_id, object_id, delta, **kwargs):
+    if content_type_id == ContentType.objects.get_for_model(Product).id:
+        popularity.add({object_id: delta * popularity.LIKE_WEIGHT})
@@ -0,0 +1,55 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from celery import shared_task
+
+from . import outbox, popularity
+from .inventory import release_expired_reservations
+from .models import Collection, Product
+
+
+@shared_task
+def release_expired_stock():
+    # Pending orders that were not paid in time give their stock back
+    return release_expired_reservations()
+
+
+@shared_task
+def deliver_event(event_id):
+    return outbox.deliver(event_id)
+
+
+@shared_task
+def drain_outbox():
+    # Retries the events that were not delivered right after the commit
+    return outbox.drain()
+
+
+@shared_task
+def refresh_popularity():
+    # Exact popularity scores, the sorted sets drift between two refreshes
+    return popularity.refresh()
+
+
+@shared_task
+def reconcile_products_count():
+    # Triggers keep Collection.products_count up to date, this repairs
+    # what they can't see (TRUNCATE, disabled triggers, manual fixes)
+    actual_count = Coalesce(Subquery(
+        Product.objects
+        .filter(collection=OuterRef('pk'))
+        .order_by()
+        .values('collection')
+        .annotate(count=Count('id'))
+        .values('count')
+    ), 0)
+    drifted = list(
+        Collection.objects
+        .annotate(actual_count=actual_count)
+        .exclude(products_count=F('actual_count'))
+        .values_list('id', flat=True)
+    )
+    if drifted:
+        # Recounted by the UPDATE itself, not with the numbers read above
+        Collection.objects.filter(pk__in=drifted).update(products_count=actual_count)
+    return len(drifted)
@@ -1,9 +1,17 @@
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from rest_framework.test import APIClient 
 
 import pytest 
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # The cache (Redis) is not rolled back with the test database, cached
+    # responses and versions of an earlier test would leak into this one
+    cache.clear()
+
+
 @pytest.fixture
 def api_client() -> APIClient:
     return APIClient()
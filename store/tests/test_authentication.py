@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+
+import pytest
+from model_bakery import baker
+
+from core.authentication import invalidate_user
+from store.models import Customer
+
+
+@pytest.fixture
+def user():
+    user = baker.make(settings.AUTH_USER_MODEL)
+    yield user
+    invalidate_user(user.id)
+
+
+@pytest.fixture
+def jwt_client(api_client, user):
+    api_client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(user)}')
+    return api_client
+
+
+@pytest.mark.django_db
+class TestCachedJWTAuthentication:
+
+    def test_cached_user_and_customer_need_no_query(self, jwt_client, user):
+        first = jwt_client.get('/store/customers/me/')
+
+        with CaptureQueriesContext(connection) as context:
+            second = jwt_client.get('/store/customers/me/')
+
+        assert first.status_code == second.status_code == status.HTTP_200_OK
+        assert second.data == first.data
+        assert second.data['user_id'] == user.id
+        assert len(context) == 0
+
+    def test_customer_save_invalidates_cached_user(self, jwt_client, user):
+        jwt_client.get('/store/customers/me/')
+
+        customer = Customer.objects.get(user=user)
+        customer.phone = '555-0100'
+        customer.save()
+
+        assert jwt_client.get('/store/customers/me/').data['phone'] == '555-0100'
+
+    def test_deactivated_user_is_rejected(self, jwt_client, user):
+        jwt_client.get('/store/customers/me/')
+
+        user.is_active = False
+        user.save()
+
+        assert jwt_client.get('/store/customers/me/').status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_tampered_token_is_rejected(self, api_client, user):
+        token = str(AccessToken.for_user(user))
+        api_client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+        api_client.get('/store/customers/me/')
+
+        api_client.credentials(HTTP_AUTHORIZATION=f'JWT {token[:-2]}xx')
+
+        assert api_client.get('/store/customers/me/').status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+import pytest
+from model_bakery import baker
+
+from store.models import Cart, CartItem, Collection, Customer, Order, OrderItem, Product
+
+
+def product(collection, **kwargs):
+    return {
+        'title': 'Test',
+        'slug': 'test',
+        'unit_price': 10,
+        'inventory': 5,
+        'collection': collection.id,
+        **kwargs,
+    }
+
+
+@pytest.mark.django_db
+class TestBulkProducts:
+
+    def test_if_user_not_admin_return_403(self, authenticate, api_client):
+        authenticate(is_staff=False)
+
+        response = api_client.post('/store/products/bulk/', [], format='json')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_create_loads_collections_with_one_query(self, authenticate, api_client):
+        authenticate(is_staff=True)
+        collections = baker.make(Collection, _quantity=3)
+        data = [product(collection, title=f'Product {index}') for index, collection in enumerate(collections * 5)]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.post('/store/products/bulk/', data, format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert [item['title'] for item in response.data] == [item['title'] for item in data]
+        assert Product.objects.count() == 15
+        assert len([query for query in queries if 'store_collection' in query['sql']]) == 1
+
+    def test_invalid_items_are_reported_and_nothing_is_written(self, authenticate, api_client):
+        authenticate(is_staff=True)
+        collection = baker.make(Collection)
+        data = [product(collection), product(collection, unit_price=0), product(collection, collection=0)]
+
+        response = api_client.post('/store/products/bulk/', data, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0] == {}
+        assert 'unit_price' in response.data[1]
+        assert 'collection' in response.data[2]
+        assert not Product.objects.exists()
+
+    def test_update(self, authenticate, api_client):
+        authenticate(is_staff=True)
+        first, second = baker.make(Product, unit_price=1, _quantity=2)
+
+        response = api_client.patch('/store/products/bulk/', [
+            {'id': first.id, 'unit_price': 2},
+            {'id': second.id, 'inventory': 7},
+        ], format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert first.unit_price == 2
+        assert second.inventory == 7
+
+    def test_delete_refuses_products_with_order_items(self, authenticate, api_client):
+        authenticate(is_staff=True)
+        free, ordered = baker.make(Product, _quantity=2)
+        customer = Customer.objects.get(user=baker.make(settings.AUTH_USER_MODEL))
+        baker.make(OrderItem, order=baker.make(Order, customer=customer), product=ordered, quantity=1, unit_price=1)
+
+        response = api_client.delete('/store/products/bulk/', [free.id, ordered.id], format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0] == {}
+        assert 'id' in response.data[1]
+        assert Product.objects.count() == 2
+
+
+@pytest.mark.django_db
+class TestBulkCartItems:
+
+    def test_add_increments_existing_items(self, api_client):
+        cart = baker.make(Cart)
+        first, second = baker.make(Product, _quantity=2)
+        baker.make(CartItem, cart=cart, product=first, quantity=2)
+
+        response = api_client.post(f'/store/carts/{cart.id}/items/bulk/', [
+            {'product_id': first.id, 'quantity': 3},
+            {'product_id': second.id, 'quantity': 1},
+            {'product_id': second.id, 'quantity': 1},
+        ], format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert CartItem.objects.get(cart=cart, product=first).quantity == 5
+        assert CartItem.objects.get(cart=cart, product=second).quantity == 2
+
+    def test_missing_products_are_reported_per_item(self, api_client):
+        cart = baker.make(Cart)
+        product = baker.make(Product)
+
+        response = api_client.post(f'/store/carts/{cart.id}/items/bulk/', [
+            {'product_id': product.id, 'quantity': 1},
+            {'product_id': 0, 'quantity': 1},
+        ], format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0] == {}
+        assert 'product_id' in response.data[1]
+        assert not CartItem.objects.exists()
+
+    def test_update_and_delete(self, api_client):
+        cart = baker.make(Cart)
+        first, second = baker.make(CartItem, cart=cart, quantity=1, _quantity=2)
+
+        response = api_client.patch(f'/store/carts/{cart.id}/items/bulk/', [
+            {'id': first.id, 'quantity': 4},
+        ], format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [{'id': first.id, 'quantity': 4}]
+
+        response = api_client.delete(f'/store/carts/{cart.id}/items/bulk/', [first.id, second.id], format='json')
+
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert not CartItem.objects.filter(cart=cart).exists()
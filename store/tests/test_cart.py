@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+from rest_framework import status 
+
+import pytest 
+from model_bakery import baker
+
+from store.models import Cart, CartItem, Product
+
+
+@pytest.mark.django_db
+class TestRetrieveCart:
+    
+    def test_if_cart_is_empty_total_price_is_0(self, api_client):
+        cart = baker.make(Cart)
+        
+        response = api_client.get(f'/store/carts/{cart.id}/')
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['items'] == []
+        assert response.data['total_price'] == 0
+    
+    def test_total_price_is_calculated_from_items(self, api_client):
+        cart = baker.make(Cart)
+        first = baker.make(Product, unit_price=Decimal('2.50'))
+        second = baker.make(Product, unit_price=Decimal('10.00'))
+        baker.make(CartItem, cart=cart, product=first, quantity=2)
+        baker.make(CartItem, cart=cart, product=second, quantity=3)
+        
+        response = api_client.get(f'/store/carts/{cart.id}/')
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert sorted(item['total_price'] for item in response.data['items']) == [Decimal('5.00'), Decimal('30.00')]
+        assert response.data['total_price'] == Decimal('35.00')
+
+
+@pytest.mark.django_db
+class TestAddCartItem:
+    
+    def test_adding_the_same_product_twice_increments_quantity(self, api_client):
+        cart = baker.make(Cart)
+        product = baker.make(Product)
+        
+        first = api_client.post(f'/store/carts/{cart.id}/items/', {'product_id': product.id, 'quantity': 2})
+        second = api_client.post(f'/store/carts/{cart.id}/items/', {'product_id': product.id, 'quantity': 3})
+        
+        assert first.status_code == status.HTTP_201_CREATED
+        assert second.status_code == status.HTTP_201_CREATED
+        assert second.data['id'] == first.data['id']
+        assert second.data['quantity'] == 5
+        assert CartItem.objects.get(cart=cart, product=product).quantity == 5
+    
+    def test_if_product_does_not_exist_returns_400(self, api_client):
+        cart = baker.make(Cart)
+        
+        response = api_client.post(f'/store/carts/{cart.id}/items/', {'product_id': 0, 'quantity': 1})
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['product_id'] is not None # type: ignore
+        assert not CartItem.objects.filter(cart=cart).exists()
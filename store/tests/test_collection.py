@@ -9,6 +9,7 @@ import pytest
 from model_bakery import baker
 
 from store.models import Collection, Product
+from store.tasks import reconcile_products_count
 
 
 
@@ -93,4 +94,61 @@ class TestRetriveCollection:
     def test_if_collection_does_not_exist_return_404(self, api_client):
         response = api_client.get(f'/store/collection/0/')
         
-        assert response.status_code == status.HTTP_404_NOT_FOUND
\ No newline at end of file
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+@pytest.mark.django_db
+class TestReconcileProductsCount:
+    
+    def test_drifted_count_is_repaired(self, api_client):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, _quantity=3)
+        Collection.objects.filter(pk=collection.id).update(products_count=7)
+        
+        assert reconcile_products_count() == 1
+        
+        response = api_client.get(f'/store/collections/{collection.id}/')
+        assert response.data['products_count'] == 3
+
+
+@pytest.mark.django_db
+class TestProductsCount:
+    
+    def test_saving_a_loaded_collection_keeps_the_count(self):
+        collection = Collection.objects.get(pk=baker.make(Collection).id)
+        baker.make(Product, collection=collection)
+        
+        collection.title = 'Renamed'
+        collection.save()
+        
+        collection.refresh_from_db()
+        assert (collection.title, collection.products_count) == ('Renamed', 1)
+    
+    def test_update_fields_can_not_write_the_count(self):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, _quantity=2)
+        
+        collection.save(update_fields=['title', 'products_count'])
+        
+        collection.refresh_from_db()
+        assert collection.products_count == 2
+
+
+@pytest.mark.django_db
+class TestCollectionConditionalGet:
+    
+    def test_etag_changes_with_products_and_title(self, api_client):
+        collection = baker.make(Collection)
+        url = f'/store/collections/{collection.id}/'
+        etag = api_client.get(url)['ETag']
+        
+        assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+        
+        baker.make(Product, collection=collection)
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert not response.has_header('Last-Modified')
+        
+        etag = response['ETag']
+        collection.title = 'Renamed'
+        collection.save()
+        assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
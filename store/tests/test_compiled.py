@@ -0,0 +1,45 @@
+from django.conf import settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+import pytest
+from model_bakery import baker
+
+from store.compiled import compile_serializer
+from store.models import Collection, Customer, Order, OrderItem, Product, ProductImage
+from store.serializers import OrderSerializer, ProductSerializer
+from store.views import items_total_price, prefetch_items_with_total
+
+
+def context():
+    return {'request': Request(APIRequestFactory().get('/store/products/'))}
+
+
+@pytest.mark.django_db
+class TestCompiledSerializer:
+    
+    def test_product_list_is_the_same_as_serializer_output(self):
+        collection = baker.make(Collection)
+        for product in baker.make(Product, collection=collection, _quantity=3):
+            baker.make(ProductImage, product=product, image='store/images/test.jpg', _quantity=2)
+        queryset = Product.objects.prefetch_related('images').order_by('id')
+        
+        compiled = compile_serializer(ProductSerializer(context=context()), queryset)
+        
+        expected = ProductSerializer(queryset, many=True, context=context()).data
+        assert compiled.render(compiled.values(queryset)) == expected
+    
+    def test_order_list_is_the_same_as_serializer_output(self):
+        customer = Customer.objects.get(user=baker.make(settings.AUTH_USER_MODEL))
+        products = baker.make(Product, _quantity=2)
+        for order in baker.make(Order, customer=customer, _quantity=2):
+            for product in products:
+                baker.make(OrderItem, order=order, product=product, quantity=2, unit_price=product.unit_price)
+        queryset = Order.objects \
+            .prefetch_related(prefetch_items_with_total(OrderItem)) \
+            .annotate(total_price=items_total_price('items__')) \
+            .order_by('id')
+        
+        compiled = compile_serializer(OrderSerializer(), queryset)
+        
+        assert compiled.render(compiled.values(queryset)) == OrderSerializer(queryset, many=True).data
@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+
+from rest_framework import status
+
+import pytest
+from model_bakery import baker
+
+from store.models import Collection, Product, ProductImage
+
+
+def content(response):
+    return b''.join(response.streaming_content).decode()
+
+
+@pytest.mark.django_db
+class TestExportProducts:
+
+    def test_ndjson_honors_product_filter(self, api_client):
+        collection, other = baker.make(Collection, _quantity=2)
+        products = baker.make(Product, collection=collection, _quantity=3)
+        baker.make(Product, collection=other, _quantity=2)
+        baker.make(ProductImage, product=products[0], image='store/images/test.jpg')
+
+        response = api_client.get('/store/products/export/', {'collection_id': collection.id})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/x-ndjson'
+        rows = [json.loads(line) for line in content(response).splitlines()]
+        assert sorted(row['id'] for row in rows) == sorted(product.id for product in products)
+        assert sum(len(row['images']) for row in rows) == 1
+
+    def test_csv_has_header_and_one_row_per_product(self, api_client):
+        baker.make(Product, _quantity=3)
+
+        response = api_client.get('/store/products/export/', {'format': 'csv', 'fields': 'id,title'})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'].startswith('text/csv')
+        rows = list(csv.reader(io.StringIO(content(response))))
+        assert rows[0] == ['id', 'title']
+        assert len(rows) == 4
+
+    def test_rows_are_streamed_in_chunks(self, api_client, monkeypatch):
+        from store.views import ProductViewSet
+        monkeypatch.setattr(ProductViewSet, 'export_chunk_size', 2)
+        baker.make(Product, _quantity=5)
+
+        response = api_client.get('/store/products/export/')
+
+        chunks = [chunk for chunk in response.streaming_content if chunk]
+        assert len(chunks) == 3
+        assert sum(chunk.count(b'\n') for chunk in chunks) == 5
+
+
+@pytest.mark.django_db
+class TestExportCustomers:
+
+    def test_if_user_not_admin_return_403(self, authenticate, api_client):
+        authenticate(is_staff=False)
+
+        response = api_client.get('/store/customers/export/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
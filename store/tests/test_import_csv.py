@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+import psycopg2
+import pytest
+from model_bakery import baker
+
+from store.models import Collection, Product
+
+
+PRODUCT_CSV = Path(__file__).resolve().parents[2] / 'product.csv'
+HEADER = 'id,title,description,unit_price,inventory,last_update,collection_id,slug'
+
+
+@pytest.fixture
+def write_csv(tmp_path):
+    def do_write_csv(*rows):
+        path = tmp_path / 'products.csv'
+        path.write_text('\n'.join([HEADER, *rows]) + '\n')
+        return str(path)
+    return do_write_csv
+
+
+def row(id, collection):
+    return f'{id},Product {id},Description,1.50,10,2024-01-01 00:00:00+00,{collection.id},product-{id}'
+
+
+@pytest.mark.django_db
+class TestImportCsv:
+
+    def test_product_csv_imports_without_the_columns_added_later(self):
+        # product.csv predates Product.popularity, the database default fills it
+        for collection_id in range(2, 7):
+            baker.make(Collection, id=collection_id)
+
+        call_command('import_csv', str(PRODUCT_CSV), 'store.Product', '--restart')
+
+        assert Product.objects.count() == 1001
+        assert not Product.objects.exclude(popularity=0).exists()
+
+    def test_short_row_reports_its_line(self, write_csv):
+        collection = baker.make(Collection)
+        path = write_csv(row(1, collection), '2,Too short')
+
+        with pytest.raises(CommandError, match='Line 3'):
+            call_command('import_csv', path, 'store.Product', '--chunk-size', '1')
+
+        # The chunk before the bad line is committed
+        assert list(Product.objects.values_list('id', flat=True)) == [1]
+
+    def test_interrupted_import_resumes_after_the_last_chunk(self, write_csv):
+        collection = baker.make(Collection)
+        path = write_csv(*[row(id, collection) for id in range(1, 5)])
+        # The second chunk fails on an existing id
+        blocking = baker.make(Product, id=3, collection=collection)
+
+        with pytest.raises(psycopg2.IntegrityError):
+            call_command('import_csv', path, 'store.Product', '--chunk-size', '2')
+        assert Product.objects.filter(id__in=[1, 2]).count() == 2
+
+        blocking.delete()
+        call_command('import_csv', path, 'store.Product', '--chunk-size', '2')
+
+        assert sorted(Product.objects.values_list('id', flat=True)) == [1, 2, 3, 4]
@@ -0,0 +1,53 @@
+import json
+import uuid
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+import io
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.serializer_helpers import ReturnDict
+
+import pytest
+
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer
+
+orjson = pytest.importorskip('orjson')
+
+
+PAYLOAD = ReturnDict({
+    'id': uuid.UUID('0192a4f5-1c2b-7d3e-8f40-5a6b7c8d9e0f'),
+    'title': 'Crème brûlée \u2028 \u2029',
+    'unit_price': Decimal('19.90'),
+    'price_with_tax': Decimal('24.676000000000000000000'),
+    'big': Decimal('12345678901234.99'),
+    'tiny': Decimal('0.00001'),
+    'placed_at': datetime(2024, 11, 5, 9, 30, 15, 123456, tzinfo=dt_timezone.utc),
+    'birth_date': date(1990, 1, 2),
+    'items': [{'quantity': 2, 'total_price': Decimal('5.00')}, None, True],
+}, serializer=None)
+
+
+class TestORJSON:
+    
+    def test_renders_the_same_bytes_as_drf(self):
+        assert ORJSONRenderer().render(PAYLOAD) == JSONRenderer().render(PAYLOAD)
+    
+    def test_floats_render_the_same_values_as_drf(self):
+        # The bytes may differ in the exponent format (1e20 for 1e+20)
+        data = {'small': 1e-05, 'large': 1e20, 'price': 19.9, 'ratios': [0.1, 1e16, -2.5e-300]}
+        assert json.loads(ORJSONRenderer().render(data)) == json.loads(JSONRenderer().render(data))
+    
+    def test_indented_output_is_rendered_by_drf(self):
+        media_type = 'application/json; indent=4'
+        assert ORJSONRenderer().render(PAYLOAD, media_type) == JSONRenderer().render(PAYLOAD, media_type)
+    
+    def test_parses_like_drf(self):
+        body = b'{"cart_id": "0192a4f5-1c2b-7d3e-8f40-5a6b7c8d9e0f", "quantity": 3, "big": 123456789012345678901234567890}'
+        assert ORJSONParser().parse(io.BytesIO(body)) == JSONParser().parse(io.BytesIO(body))
+    
+    def test_invalid_json_raises_parse_error(self):
+        with pytest.raises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"quantity": NaN}'))
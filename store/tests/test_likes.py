@@ -0,0 +1,148 @@
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+import pytest
+from model_bakery import baker
+
+from likes import counters
+from likes.models import LikeCount, LikedItems
+from store.models import Product
+
+
+def clear_counters():
+    connection = counters.redis()
+    keys = list(connection.scan_iter('likes:*'))
+    if keys:
+        connection.delete(*keys)
+
+
+@pytest.fixture(autouse=True)
+def like_counters():
+    # Redis is not rolled back with the test database
+    clear_counters()
+    yield
+    clear_counters()
+
+
+@pytest.fixture
+def product():
+    return baker.make(Product)
+
+
+@pytest.fixture
+def like(api_client, django_capture_on_commit_callbacks):
+    def do_like(product, user=None, method='post'):
+        api_client.force_authenticate(user=user or baker.make(settings.AUTH_USER_MODEL))
+        with django_capture_on_commit_callbacks(execute=True):
+            return getattr(api_client, method)(f'/likes/store.product/{product.id}/')
+    return do_like
+
+
+@pytest.mark.django_db
+class TestLikes:
+
+    def test_like_is_idempotent(self, like, product):
+        user = baker.make(settings.AUTH_USER_MODEL)
+
+        first = like(product, user)
+        second = like(product, user)
+
+        assert first.status_code == status.HTTP_201_CREATED
+        assert second.status_code == status.HTTP_200_OK
+        assert second.data == {'object_id': product.id, 'count': 1, 'liked': True}
+        assert LikedItems.objects.count() == 1
+
+    def test_unlike_decrements_the_count(self, api_client, like, product):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        like(product)
+        like(product, user)
+
+        response = like(product, user, method='delete')
+
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert api_client.get(f'/likes/store.product/{product.id}/').data == \
+            {'object_id': product.id, 'count': 1, 'liked': False}
+
+    def test_anonymous_user_can_not_like(self, api_client, product):
+        response = api_client.post(f'/likes/store.product/{product.id}/')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_like_of_missing_object_returns_404(self, like, product):
+        product.delete()
+
+        assert like(product).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_counts_of_many_objects(self, api_client, like):
+        first, second = baker.make(Product, _quantity=2)
+        like(first)
+        like(first)
+
+        response = api_client.get(f'/likes/store.product/?ids={first.id},{second.id}')
+
+        assert response.data == [{'object_id': first.id, 'count': 2}, {'object_id': second.id, 'count': 0}]
+
+
+@pytest.mark.django_db
+class TestFlushLikeCounts:
+
+    def test_flush_moves_the_shards_into_like_count(self, like, product):
+        content_type = ContentType.objects.get_for_model(Product)
+        for _ in range(3):
+            like(product)
+
+        assert counters.flush() == 1
+
+        assert LikeCount.objects.get(content_type=content_type, object_id=product.id).count == 3
+        shards = counters.redis().mget(counters.shard_keys(content_type.id, product.id))
+        assert all(value in (None, b'0') for value in shards)
+        assert counters.get_counts(content_type.id, [product.id]) == {product.id: 3}
+
+    def test_flush_recounts_a_lost_increment(self, product):
+        content_type = ContentType.objects.get_for_model(Product)
+        # Like written, Redis increment lost
+        LikedItems.objects.like(baker.make(settings.AUTH_USER_MODEL).id, content_type, product.id)
+        counters.mark_dirty(content_type.id, [product.id])
+
+        counters.flush()
+
+        assert counters.get_counts(content_type.id, [product.id]) == {product.id: 1}
+
+
+@pytest.mark.django_db
+class TestLikedByMe:
+
+    def test_page_is_flagged_with_one_query(self, api_client, like):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        first, second, third = baker.make(Product, _quantity=3)
+        like(first, user)
+        like(third, user)
+        like(second)
+
+        api_client.force_authenticate(user=None)
+        # Both requests read the page from the response cache
+        api_client.get('/store/products/')
+        with CaptureQueriesContext(connection) as anonymous_queries:
+            anonymous = api_client.get('/store/products/')
+        api_client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as user_queries:
+            response = api_client.get('/store/products/')
+
+        assert all(product['liked_by_me'] is False for product in anonymous.data['results'])
+        liked = {product['id']: product['liked_by_me'] for product in response.data['results']}
+        assert liked == {first.id: True, second.id: False, third.id: True}
+        assert len(user_queries) == len(anonymous_queries) + 1
+
+    def test_like_changes_the_etag_of_the_user(self, api_client, like, product):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        api_client.force_authenticate(user=user)
+        etag = api_client.get(f'/store/products/{product.id}/')['ETag']
+
+        like(product, user)
+
+        response = api_client.get(f'/store/products/{product.id}/', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['liked_by_me'] is True
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core import mail
+
+import pytest
+from model_bakery import baker
+
+from demo import tasks
+from store.models import Customer
+
+
+class BrokenConnection:
+    def open(self):
+        raise ConnectionRefusedError('SMTP server is down')
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def run_id():
+    run_id = 'run-1'
+    for name in ('sent', 'failed', 'batches_done'):
+        tasks.cache.set(tasks.progress_key(run_id, name), 0)
+    return run_id
+
+
+class TestLock:
+
+    def test_only_the_holder_releases_the_lock(self):
+        assert tasks.acquire_lock('next-run')
+
+        assert not tasks.release_lock('expired-run')
+        assert tasks.lock_holder() == 'next-run'
+
+        assert tasks.release_lock('next-run')
+        assert tasks.lock_holder() is None
+
+    def test_second_run_is_skipped_while_the_lock_is_held(self):
+        tasks.acquire_lock('running')
+
+        assert tasks.notify_customers('Hello') is None
+
+    def test_failed_chord_releases_the_lock(self):
+        tasks.acquire_lock('run-1')
+
+        tasks.notification_failed(None, RuntimeError('batch failed'), None, 'run-1')
+
+        assert tasks.lock_holder() is None
+        assert tasks.get_progress('run-1')['status'] == 'failed'
+
+
+@pytest.mark.django_db
+class TestSendBatch:
+
+    def test_batch_is_sent_over_one_connection(self, run_id):
+        users = baker.make(settings.AUTH_USER_MODEL, email=iter(['a@example.com', 'b@example.com']), _quantity=2)
+        pks = list(Customer.objects.filter(user__in=users).values_list('pk', flat=True))
+
+        assert tasks.send_batch(run_id, 'News', 'Hello', min(pks) - 1, max(pks)) == 2
+        assert len(mail.outbox) == 2
+        assert tasks.get_progress(run_id)['sent'] == 2
+
+    def test_connection_failure_is_counted_and_does_not_raise(self, run_id, monkeypatch):
+        user = baker.make(settings.AUTH_USER_MODEL, email='a@example.com')
+        pk = Customer.objects.get(user=user).pk
+        monkeypatch.setattr(tasks, 'get_connection', BrokenConnection)
+
+        assert tasks.send_batch(run_id, 'News', 'Hello', pk - 1, pk) == 0
+
+        progress = tasks.get_progress(run_id)
+        assert (progress['sent'], progress['failed'], progress['batches_done']) == (0, 1, 1)
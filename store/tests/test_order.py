@@ -0,0 +1,98 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+
+import pytest
+from model_bakery import baker
+
+from store import outbox
+from store.inventory import release_expired_reservations
+from store.models import Cart, CartItem, InventoryReservation, Order, OutboxEvent, Product
+from store.signals import order_created
+
+
+@pytest.fixture
+def checkout(api_client):
+    def do_checkout(*lines):
+        cart = baker.make(Cart)
+        for product, quantity in lines:
+            baker.make(CartItem, cart=cart, product=product, quantity=quantity)
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL))
+        return api_client.post('/store/orders/', {'cart_id': str(cart.id)})
+    return do_checkout
+
+
+@pytest.mark.django_db
+class TestCreateOrder:
+
+    def test_stock_is_reserved_for_every_line(self, checkout):
+        first = baker.make(Product, inventory=5)
+        second = baker.make(Product, inventory=3)
+
+        response = checkout((first, 2), (second, 3))
+
+        assert response.status_code == status.HTTP_201_CREATED
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert (first.inventory, second.inventory) == (3, 0)
+        assert InventoryReservation.objects.filter(order_id=response.data['id']).count() == 2
+
+    def test_if_one_product_is_short_returns_400_and_changes_nothing(self, checkout):
+        enough = baker.make(Product, inventory=5)
+        short = baker.make(Product, inventory=1)
+
+        response = checkout((enough, 2), (short, 2))
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        enough.refresh_from_db()
+        short.refresh_from_db()
+        assert (enough.inventory, short.inventory) == (5, 1)
+        assert not Order.objects.exists()
+
+    def test_if_order_is_mixed_reports_only_the_short_product(self, checkout):
+        # After the update the filled line has 1 left, less than its quantity
+        enough = baker.make(Product, inventory=3)
+        short = baker.make(Product, inventory=1)
+
+        response = checkout((enough, 2), (short, 2))
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['cart_id'] == [f'Not enough stock for product {short.id}, 1 available.']
+        enough.refresh_from_db()
+        assert enough.inventory == 3
+
+    def test_expired_reservations_return_the_stock(self, checkout):
+        product = baker.make(Product, inventory=5)
+        response = checkout((product, 2))
+        InventoryReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        release_expired_reservations()
+
+        product.refresh_from_db()
+        assert product.inventory == 5
+        assert Order.objects.get(pk=response.data['id']).payment_status == Order.PAYMENT_STATUS_FAILED
+
+
+@pytest.mark.django_db
+class TestOrderCreatedEvent:
+
+    def test_listeners_run_only_when_the_event_is_delivered(self, checkout):
+        received = []
+        def listener(sender, **kwargs):
+            received.append(kwargs['order'].pk)
+        order_created.connect(listener)
+        try:
+            response = checkout((baker.make(Product, inventory=5), 1))
+            event = OutboxEvent.objects.get(topic=outbox.ORDER_CREATED)
+            assert received == []
+
+            assert outbox.deliver(event.pk) is True
+            assert outbox.deliver(event.pk) is False
+        finally:
+            order_created.disconnect(listener)
+
+        assert received == [response.data['id']]
+        event.refresh_from_db()
+        assert event.processed_at is not None
@@ -0,0 +1,107 @@
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+import pytest
+from model_bakery import baker
+
+from likes.models import LikeCount
+from store import popularity
+from store.models import Collection, Order, OrderItem, Product, ProductPopularity, Review
+
+
+def clear_rankings():
+    connection = popularity.redis()
+    keys = list(connection.scan_iter('store:popularity:*'))
+    if keys:
+        connection.delete(*keys)
+
+
+@pytest.fixture(autouse=True)
+def rankings():
+    # Redis is not rolled back with the test database
+    clear_rankings()
+    yield
+    clear_rankings()
+
+
+@pytest.fixture
+def products():
+    '''sold: 3 units, reviewed: 2 reviews (4 points), liked: 6 likes (3 points)'''
+    collection = baker.make(Collection)
+    sold, reviewed, liked = baker.make(Product, collection=collection, _quantity=3)
+    order = baker.make(Order)
+    baker.make(OrderItem, order=order, product=sold, quantity=3)
+    baker.make(Review, product=reviewed, _quantity=2)
+    LikeCount.objects.create(content_type=ContentType.objects.get_for_model(Product), object_id=liked.id, count=6)
+    return sold, reviewed, liked
+
+
+def top_ids(collection_id=None):
+    return [product_id for product_id, _ in popularity.top(10, collection_id)]
+
+
+@pytest.mark.django_db
+class TestRefreshPopularity:
+
+    def test_scores_combine_sales_likes_and_reviews(self, products):
+        sold, reviewed, liked = products
+
+        popularity.refresh()
+
+        scores = dict(ProductPopularity.objects.values_list('product_id', 'score'))
+        assert scores[sold.id] == pytest.approx(3, rel=1e-3)
+        assert (scores[reviewed.id], scores[liked.id]) == (4, 3)
+        assert Product.objects.get(pk=reviewed.id).popularity == 4
+        assert top_ids() == [reviewed.id, liked.id, sold.id]
+        assert top_ids(sold.collection_id) == [reviewed.id, liked.id, sold.id]
+
+    def test_sales_decay_and_failed_orders_do_not_count(self, products):
+        sold, reviewed, liked = products
+        Order.objects.update(placed_at=timezone.now() - timedelta(seconds=popularity.HALF_LIFE))
+        failed = baker.make(Order, payment_status=Order.PAYMENT_STATUS_FAILED)
+        baker.make(OrderItem, order=failed, product=sold, quantity=100)
+
+        popularity.refresh()
+
+        assert ProductPopularity.objects.get(pk=sold.id).score == pytest.approx(1.5, rel=1e-3)
+
+    def test_new_review_moves_the_product_up_before_the_next_refresh(self, products, django_capture_on_commit_callbacks):
+        sold, reviewed, liked = products
+        popularity.refresh()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            baker.make(Review, product=sold)
+
+        assert top_ids()[0] == sold.id
+
+
+@pytest.mark.django_db
+class TestPopularityEndpoints:
+
+    def test_ordering_by_popularity(self, api_client, products):
+        sold, reviewed, liked = products
+        popularity.refresh()
+
+        response = api_client.get('/store/products/?ordering=-popularity')
+
+        assert [product['id'] for product in response.data['results']] == [reviewed.id, liked.id, sold.id]
+
+    def test_top_returns_products_with_their_scores(self, api_client, products):
+        sold, reviewed, liked = products
+        popularity.refresh()
+
+        response = api_client.get('/store/products/top/?limit=2')
+
+        assert [product['id'] for product in response.data] == [reviewed.id, liked.id]
+        assert response.data[0]['popularity'] == pytest.approx(4)
+
+    def test_top_falls_back_to_the_database_without_rankings(self, api_client, products):
+        sold, reviewed, liked = products
+        popularity.refresh()
+        clear_rankings()
+
+        response = api_client.get(f'/store/products/top/?collection_id={sold.collection_id}')
+
+        assert [product['id'] for product in response.data] == [reviewed.id, liked.id, sold.id]
@@ -1,12 +1,18 @@
+import json
+from base64 import urlsafe_b64encode
 from copy import deepcopy
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.response import Response
 from rest_framework import status 
 
 import pytest 
 from model_bakery import baker
 
-from store.models import Collection, Product
+from store.models import Collection, Product, ProductImage
+from store.pagination import ProductPagination
+from tags.models import Tag, TaggedItem
 
 
 PRODUCT = {
@@ -126,4 +132,325 @@ class TestEndToEndProduct:
         
         
         
-                
\ No newline at end of file
+                
+
+
+@pytest.mark.django_db
+class TestKeysetPagination:
+    
+    def test_pages_do_not_overlap_when_sort_key_has_ties(self, api_client, collection):
+        # 25 products with only 3 distinct prices, so the page boundaries
+        # fall inside groups of equal unit_price
+        for i in range(25):
+            baker.make(Product, collection=collection, unit_price=[5, 10, 15][i % 3])
+        
+        seen = []
+        url = '/store/products/?pagination=keyset&ordering=unit_price'
+        while url:
+            response = api_client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            seen += [(item['unit_price'], item['id']) for item in response.data['results']]
+            url = response.data['next']
+        
+        assert len(seen) == 25
+        assert seen == sorted(seen)
+    
+    def test_previous_link_returns_the_same_page(self, api_client, collection):
+        baker.make(Product, collection=collection, _quantity=25)
+        
+        first = api_client.get('/store/products/?pagination=keyset')
+        second = api_client.get(first.data['next'])
+        back = api_client.get(second.data['previous'])
+        
+        assert first.data['previous'] is None
+        assert back.data['results'] == first.data['results']
+    
+    def test_count_is_optional(self, api_client, collection):
+        baker.make(Product, collection=collection, _quantity=3)
+        
+        response = api_client.get('/store/products/?pagination=keyset')
+        assert 'count' not in response.data
+        
+        response = api_client.get('/store/products/?pagination=keyset&count=true')
+        assert response.data['count'] == 3
+    
+    def test_if_cursor_is_invalid_returns_404(self, api_client):
+        response = api_client.get('/store/products/?cursor=not-a-cursor')
+        
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_if_cursor_values_are_not_numbers_returns_404(self, api_client, collection):
+        baker.make(Product, collection=collection, _quantity=3)
+        payload = json.dumps({'v': ['cheap', 'first'], 'r': 0}).encode()
+        cursor = urlsafe_b64encode(payload).decode('ascii')
+
+        response = api_client.get(f'/store/products/?ordering=unit_price&cursor={cursor}')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_search_results_are_paginated_by_rank(self, api_client, collection):
+        # The cursor carries the rank annotation, not a model field
+        baker.make(Product, collection=collection, title='Fresh bread', _quantity=15)
+
+        first = api_client.get('/store/products/?search=bread&pagination=keyset')
+        second = api_client.get(first.data['next'])
+
+        assert second.status_code == status.HTTP_200_OK
+        ids = [item['id'] for item in first.data['results'] + second.data['results']]
+        assert len(set(ids)) == 15
+
+
+@pytest.mark.django_db
+class TestProductCache:
+    
+    # The next two run in this order: the second one lists without writing
+    # a product, so no version moves and it must not see the first one's list
+    def test_list_is_cached(self, api_client, collection):
+        baker.make(Product, collection=collection)
+        
+        assert api_client.get('/store/products/').data['count'] == 1
+    
+    def test_list_of_an_earlier_test_is_not_served(self, api_client):
+        assert api_client.get('/store/products/').data['count'] == 0
+    
+    def test_product_update_invalidates_cached_detail(self, authenticate, api_client, collection):
+        product = baker.make(Product, collection=collection, title='Old')
+        
+        response = api_client.get(f'/store/products/{product.id}/') # type: ignore
+        assert response.data['title'] == 'Old'
+        
+        product.title = 'New'
+        product.save()
+        
+        response = api_client.get(f'/store/products/{product.id}/') # type: ignore
+        assert response.data['title'] == 'New'
+    
+    def test_new_product_invalidates_cached_collection_list(self, api_client, collection):
+        url = f'/store/products/?collection_id={collection.id}'
+        
+        assert api_client.get(url).data['count'] == 0
+        
+        baker.make(Product, collection=collection)
+        
+        assert api_client.get(url).data['count'] == 1
+
+
+@pytest.mark.django_db
+class TestSparseFieldsets:
+    
+    def test_fields_returns_only_requested_fields_without_prefetch(self, api_client, collection):
+        product = baker.make(Product, collection=collection)
+        baker.make(ProductImage, product=product, image='store/images/test.jpg')
+        
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get('/store/products/?fields=id,title,price_with_tax')
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.data['results'][0]) == {'id', 'title', 'price_with_tax'}
+        assert not any('store_productimage' in query['sql'] for query in context.captured_queries)
+    
+    def test_expand_adds_nested_images(self, api_client, collection):
+        product = baker.make(Product, collection=collection)
+        baker.make(ProductImage, product=product, image='store/images/test.jpg')
+        
+        response = api_client.get(f'/store/products/{product.id}/?fields=id&expand=images')
+        
+        assert set(response.data) == {'id', 'images'}
+        assert len(response.data['images']) == 1
+    
+    def test_exclude_drops_fields(self, api_client, collection):
+        product = baker.make(Product, collection=collection)
+        
+        response = api_client.get(f'/store/products/{product.id}/?exclude=description,images')
+        
+        assert 'description' not in response.data
+        assert 'images' not in response.data
+        assert response.data['title'] == product.title
+
+
+@pytest.mark.django_db
+class TestConditionalGet:
+    
+    def test_detail_returns_304_if_etag_matches(self, api_client, collection):
+        product = baker.make(Product, collection=collection)
+        url = f'/store/products/{product.id}/' # type: ignore
+        
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        
+        with CaptureQueriesContext(connection) as context:
+            not_modified = api_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        
+        assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+        assert not_modified.content == b''
+        assert not_modified['ETag'] == response['ETag']
+        # The ETag comes from the cache versions
+        assert len(context) == 0
+    
+    def test_cached_list_costs_no_query(self, api_client, collection):
+        baker.make(Product, collection=collection, _quantity=3)
+        first = api_client.get('/store/products/')
+        
+        with CaptureQueriesContext(connection) as context:
+            second = api_client.get('/store/products/')
+        
+        assert second.data == first.data
+        assert second['ETag'] == first['ETag']
+        assert len(context) == 0
+    
+    def test_product_update_changes_etag(self, api_client, collection):
+        product = baker.make(Product, collection=collection)
+        url = f'/store/products/{product.id}/' # type: ignore
+        etag = api_client.get(url)['ETag']
+        
+        product.title = 'New'
+        product.save()
+        
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+    
+    def test_list_etag_changes_when_a_product_is_deleted(self, api_client, collection):
+        first, second = baker.make(Product, collection=collection, _quantity=2)
+        etag = api_client.get('/store/products/')['ETag']
+        
+        assert api_client.get('/store/products/', HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+        
+        second.delete()
+        
+        assert api_client.get('/store/products/', HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestCountStrategy:
+    
+    def test_count_is_exact_then_cached_for_the_same_filters(self, api_client, collection):
+        baker.make(Product, collection=collection, _quantity=12)
+        url = f'/store/products/?collection_id={collection.id}'
+        
+        first = api_client.get(url)
+        second = api_client.get(f'{url}&page=2')
+        
+        assert (first.data['count'], first.data['count_strategy']) == (12, 'exact')
+        assert (second.data['count'], second.data['count_strategy']) == (12, 'cached')
+    
+    def test_count_is_estimated_above_the_threshold(self, api_client, collection, monkeypatch):
+        monkeypatch.setattr(ProductPagination, 'estimate_threshold', 2)
+        monkeypatch.setattr(ProductPagination, 'count_strategy', 'estimated')
+        baker.make(Product, collection=collection, _quantity=5)
+        
+        response = api_client.get(f'/store/products/?collection_id={collection.id}')
+        
+        assert response.data['count_strategy'] == 'estimated'
+        assert response.data['count'] > 2
+
+    def test_low_estimate_still_reaches_the_last_page(self, api_client, collection, monkeypatch):
+        monkeypatch.setattr(ProductPagination, 'estimate_threshold', 2)
+        monkeypatch.setattr(ProductPagination, 'count_strategy', 'estimated')
+        # Stale planner statistics, 3 rows for 15
+        monkeypatch.setattr('store.pagination.estimate_count', lambda queryset: 3)
+        baker.make(Product, collection=collection, _quantity=15)
+        url = f'/store/products/?collection_id={collection.id}'
+
+        first = api_client.get(url)
+        second = api_client.get(f'{url}&page=2')
+
+        assert (first.data['count'], len(first.data['results'])) == (3, 10)
+        assert first.data['next'] is not None
+        assert second.status_code == status.HTTP_200_OK
+        assert len(second.data['results']) == 5
+        assert (second.data['count'], second.data['count_strategy']) == (15, 'exact')
+        assert second.data['next'] is None
+
+    def test_exact_strategy(self, api_client, collection, monkeypatch):
+        monkeypatch.setattr(ProductPagination, 'count_strategy', 'exact')
+        baker.make(Product, collection=collection, _quantity=3)
+        
+        response = api_client.get(f'/store/products/?collection_id={collection.id}')
+        
+        assert (response.data['count'], response.data['count_strategy']) == (3, 'exact')
+
+
+
+@pytest.mark.django_db
+class TestIncludeTags:
+    
+    def test_tags_of_a_page_are_one_query(self, api_client, collection):
+        products = baker.make(Product, collection=collection, _quantity=3)
+        bread, fresh = baker.make(Tag, label='bread'), baker.make(Tag, label='fresh')
+        for tag in (fresh, bread):
+            TaggedItem.objects.create(content_object=products[0], tag=tag)
+        TaggedItem.objects.create(content_object=products[1], tag=fresh)
+        
+        with CaptureQueriesContext(connection) as without_tags:
+            api_client.get('/store/products/')
+        with CaptureQueriesContext(connection) as with_tags:
+            response = api_client.get('/store/products/?include=tags')
+        
+        tags = {product['id']: product['tags'] for product in response.data['results']}
+        assert tags == {products[0].id: ['bread', 'fresh'], products[1].id: ['fresh'], products[2].id: []}
+        assert len(with_tags) == len(without_tags) + 1
+    
+    def test_tags_are_not_included_by_default(self, api_client, collection):
+        product = baker.make(Product, collection=collection)
+        
+        assert 'tags' not in api_client.get(f'/store/products/{product.id}/').data
+    
+    def test_tagging_invalidates_cached_detail(self, api_client, collection):
+        product = baker.make(Product, collection=collection)
+        url = f'/store/products/{product.id}/?include=tags'
+        assert api_client.get(url).data['tags'] == []
+        
+        TaggedItem.objects.create(content_object=product, tag=baker.make(Tag, label='bread'))
+        
+        assert api_client.get(url).data['tags'] == ['bread']
+
+
+@pytest.mark.django_db
+class TestProductSearch:
+    
+    def search(self, api_client, terms):
+        response = api_client.get('/store/products/', {'search': terms})
+        assert response.status_code == status.HTTP_200_OK
+        return [item['id'] for item in response.data['results']]
+    
+    def test_matches_word_forms(self, api_client, collection):
+        bread = baker.make(Product, collection=collection, title='Fresh breads', description='Baked today')
+        baker.make(Product, collection=collection, title='Milk', description='Whole milk')
+        
+        assert self.search(api_client, 'bread') == [bread.id]
+    
+    def test_search_vector_follows_title_and_description(self, api_client, collection):
+        product = baker.make(Product, collection=collection, title='Milk', description='Whole milk')
+        
+        product.title = 'Cheese'
+        product.save()
+        assert self.search(api_client, 'cheese') == [product.id]
+        
+        # The trigger runs for queryset updates too
+        Product.objects.filter(pk=product.id).update(description='Aged cheddar')
+        assert self.search(api_client, 'cheddar') == [product.id]
+        assert self.search(api_client, 'whole') == []
+    
+    def test_title_matches_rank_first(self, api_client, collection):
+        in_description = baker.make(Product, collection=collection, title='Sandwich', description='With rye bread')
+        in_title = baker.make(Product, collection=collection, title='Rye bread', description='Sliced')
+        
+        assert self.search(api_client, 'rye bread') == [in_title.id, in_description.id]
+    
+    def test_ordering_parameter_overrides_rank(self, api_client, collection):
+        cheap = baker.make(Product, collection=collection, title='Bread roll', description='Bread', unit_price=1)
+        dear = baker.make(Product, collection=collection, title='Bread', description='Bread', unit_price=9)
+        
+        response = api_client.get('/store/products/', {'search': 'bread', 'ordering': 'unit_price'})
+        
+        assert [item['id'] for item in response.data['results']] == [cheap.id, dear.id]
+    
+    def test_websearch_syntax(self, api_client, collection):
+        rye = baker.make(Product, collection=collection, title='Rye bread', description='Dark')
+        white = baker.make(Product, collection=collection, title='White bread', description='Soft')
+        baker.make(Product, collection=collection, title='Bread rye', description='Reversed words')
+        
+        assert self.search(api_client, 'bread -rye') == [white.id]
+        assert self.search(api_client, '"rye bread"') == [rye.id]
+        assert set(self.search(api_client, 'dark or soft')) == {rye.id, white.id}
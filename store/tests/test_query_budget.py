@@ -0,0 +1,154 @@
+import json
+import os
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+import pytest
+from model_bakery import baker
+
+from store.models import Cart, CartItem, Collection, Customer, Order, OrderItem
+from store.models import Product, ProductImage, Review
+from tags.models import Tag, TaggedItem
+
+
+# Query budget for every route registered in store/urls.py ------------
+# Each endpoint is called twice: with a small and with a bigger data set.
+# The number of SQL queries must be the same for both (no N+1) and must not
+# exceed the budget below. Budgets are the current numbers, lower them when
+# you optimize an endpoint, never raise them to make a test pass. A feature
+# that needs more queries may raise a budget only with a comment next to
+# the entry naming each added query and why it can't be folded into an
+# existing one.
+#
+# Report mode, writes the numbers and timings to a JSON file:
+#   STORE_QUERY_REPORT=query_report.json pytest store/tests/test_query_budget.py
+
+SMALL, LARGE = 2, 12
+
+REPORT_PATH = os.environ.get('STORE_QUERY_REPORT')
+report = {}
+
+
+def seed(size):
+    '''Creates `size` objects on every level of nesting.'''
+    collection = baker.make(Collection)
+    products = baker.make(Product, collection=collection, inventory=100, _quantity=size)
+    tags = baker.make(Tag, _quantity=size)
+    for product in products:
+        baker.make(Review, product=product, _quantity=size)
+        for tag in tags:
+            TaggedItem.objects.create(content_object=product, tag=tag)
+        baker.make(ProductImage, product=product, image='store/images/test.jpg', _quantity=size)
+
+    user = baker.make(settings.AUTH_USER_MODEL)
+    staff = baker.make(settings.AUTH_USER_MODEL, is_staff=True, is_superuser=True)
+    customer = Customer.objects.get(user=user)
+
+    orders = baker.make(Order, customer=customer, _quantity=size)
+    for order in orders:
+        for product in products:
+            baker.make(OrderItem, order=order, product=product, quantity=1, unit_price=product.unit_price)
+
+    cart = baker.make(Cart)
+    for product in products:
+        baker.make(CartItem, cart=cart, product=product, quantity=1)
+    # Separate cart for checkout, so the other endpoints see the same data
+    checkout_cart = baker.make(Cart)
+    for product in products:
+        baker.make(CartItem, cart=checkout_cart, product=product, quantity=1)
+
+    return SimpleNamespace(
+        collection=collection, product=products[0], products=products, tags=tags,
+        review=Review.objects.filter(product=products[0]).first(),
+        image=ProductImage.objects.filter(product=products[0]).first(),
+        user=user, staff=staff, customer=customer, order=orders[0],
+        cart=cart, cart_item=CartItem.objects.filter(cart=cart).first(),
+        checkout_cart=checkout_cart
+    )
+
+
+# name, method, url, user ('user', 'staff' or None), payload, budget
+ENDPOINTS = [
+    ('product-list', 'get', lambda d: '/store/products/', None, None, 3),
+    ('product-list-user', 'get', lambda d: '/store/products/', 'user', None, 4),
+    ('product-list-tags', 'get', lambda d: '/store/products/?include=tags', None, None, 4),
+    ('product-list-by-tags', 'get', lambda d: f'/store/products/?tags={d.tags[0].label},{d.tags[1].label}', None, None, 3),
+    ('product-list-popular', 'get', lambda d: '/store/products/?ordering=-popularity', None, None, 3),
+    ('product-top', 'get', lambda d: '/store/products/top/', None, None, 2),
+    ('product-list-keyset', 'get', lambda d: '/store/products/?pagination=keyset', None, None, 2),
+    ('product-list-filtered', 'get', lambda d: f'/store/products/?collection_id={d.collection.id}&ordering=-unit_price', None, None, 4),
+    ('product-detail', 'get', lambda d: f'/store/products/{d.product.id}/', None, None, 2),
+    ('product-detail-tags', 'get', lambda d: f'/store/products/{d.product.id}/?include=tags', None, None, 3),
+    ('product-reviews', 'get', lambda d: f'/store/products/{d.product.id}/reviews/', None, None, 1),
+    ('product-review-detail', 'get', lambda d: f'/store/products/{d.product.id}/reviews/{d.review.id}/', None, None, 1),
+    ('product-images', 'get', lambda d: f'/store/products/{d.product.id}/images/', None, None, 1),
+    ('product-image-detail', 'get', lambda d: f'/store/products/{d.product.id}/images/{d.image.id}/', None, None, 1),
+    ('collection-list', 'get', lambda d: '/store/collections/', None, None, 1),
+    ('collection-detail', 'get', lambda d: f'/store/collections/{d.collection.id}/', None, None, 1),
+    ('cart-create', 'post', lambda d: '/store/carts/', None, {}, 3),
+    ('cart-detail', 'get', lambda d: f'/store/carts/{d.cart.id}/', None, None, 2),
+    ('cart-items', 'get', lambda d: f'/store/carts/{d.cart.id}/items/', None, None, 1),
+    ('cart-item-detail', 'get', lambda d: f'/store/carts/{d.cart.id}/items/{d.cart_item.id}/', None, None, 1),
+    ('cart-item-add', 'post', lambda d: f'/store/carts/{d.cart.id}/items/', None,
+        lambda d: {'product_id': d.product.id, 'quantity': 1}, 1),
+    ('cart-item-update', 'patch', lambda d: f'/store/carts/{d.cart.id}/items/{d.cart_item.id}/', None,
+        {'quantity': 3}, 2),
+    ('cart-item-delete', 'delete', lambda d: f'/store/carts/{d.cart.id}/items/{d.cart_item.id}/', None, None, 2),
+    ('cart-delete', 'delete', lambda d: f'/store/carts/{d.cart.id}/', None, None, 4),
+    ('customer-list', 'get', lambda d: '/store/customers/', 'staff', None, 1),
+    ('customer-detail', 'get', lambda d: f'/store/customers/{d.customer.id}/', 'staff', None, 1),
+    ('customer-history', 'get', lambda d: f'/store/customers/{d.customer.id}/history/', 'staff', None, 0),
+    ('customer-me', 'get', lambda d: '/store/customers/me/', 'user', None, 1),
+    ('order-list', 'get', lambda d: '/store/orders/', 'user', None, 3),
+    ('order-list-staff', 'get', lambda d: '/store/orders/', 'staff', None, 2),
+    ('order-detail', 'get', lambda d: f'/store/orders/{d.order.id}/', 'user', None, 3),
+    # 14 before stock reservations, raised for:
+    #   +1 UPDATE ... RETURNING taking the stock of all lines (store/inventory.py)
+    #   +1 INSERT of the InventoryReservation rows, one bulk_create
+    #   +1 INSERT of the order_created outbox event (store/outbox.py), it has to
+    #      commit with the order
+    #   -1 cart validation in one query (exists + count before)
+    ('order-create', 'post', lambda d: '/store/orders/', 'user',
+        lambda d: {'cart_id': str(d.checkout_cart.id)}, 16),
+]
+
+
+def call(data, method, url, user, payload):
+    client = APIClient()
+    if user:
+        client.force_authenticate(user=getattr(data, user))
+    if callable(payload):
+        payload = payload(data)
+
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        response = getattr(client, method)(url(data), payload, format='json')
+        elapsed = (time.perf_counter() - start) * 1000
+
+    assert response.status_code < 400, response.data
+    return len(context.captured_queries), elapsed
+
+
+@pytest.fixture(scope='session', autouse=True)
+def query_report():
+    yield report
+    if REPORT_PATH and report:
+        with open(REPORT_PATH, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name, method, url, user, payload, budget', ENDPOINTS, ids=[e[0] for e in ENDPOINTS])
+def test_query_count_is_within_budget_and_constant(name, method, url, user, payload, budget):
+    small_queries, _ = call(seed(SMALL), method, url, user, payload)
+    large_queries, elapsed = call(seed(LARGE), method, url, user, payload)
+
+    report[name] = {'queries': large_queries, 'budget': budget, 'ms': round(elapsed, 2)}
+
+    assert large_queries == small_queries, f'{name}: query count grows with data ({small_queries} -> {large_queries})'
+    assert large_queries <= budget, f'{name}: {large_queries} queries, budget is {budget}'
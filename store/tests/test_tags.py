@@ -0,0 +1,74 @@
+from rest_framework import status
+
+import pytest
+from model_bakery import baker
+
+from store.models import Collection, Product
+from tags.models import Tag, TaggedItem
+
+
+@pytest.fixture
+def tagged_products():
+    '''bread: first, second, fresh: second, third'''
+    first, second, third, _ = baker.make(Product, collection=baker.make(Collection), _quantity=4)
+    bread, fresh = baker.make(Tag, label='bread'), baker.make(Tag, label='fresh')
+    for product, tag in [(first, bread), (second, bread), (second, fresh), (third, fresh)]:
+        TaggedItem.objects.create(content_object=product, tag=tag)
+    return first, second, third
+
+
+def product_ids(response):
+    return {product['id'] for product in response.data['results']}
+
+
+@pytest.mark.django_db
+class TestFilterProductsByTags:
+
+    def test_all_mode_returns_the_intersection(self, api_client, tagged_products):
+        first, second, third = tagged_products
+
+        response = api_client.get('/store/products/?tags=bread,fresh')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert product_ids(response) == {second.id}
+
+    def test_any_mode_returns_the_union(self, api_client, tagged_products):
+        first, second, third = tagged_products
+
+        response = api_client.get('/store/products/?tags=bread,fresh&tag_mode=any')
+
+        assert product_ids(response) == {first.id, second.id, third.id}
+
+    def test_unknown_tag_matches_nothing(self, api_client, tagged_products):
+        assert api_client.get('/store/products/?tags=bread,nope').data['count'] == 0
+
+    def test_invalid_tag_mode_returns_400(self, api_client, tagged_products):
+        response = api_client.get('/store/products/?tags=bread&tag_mode=some')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestTagFrequencies:
+
+    def test_tags_are_ordered_by_frequency(self, api_client, tagged_products):
+        baker.make(Tag, label='unused')
+
+        response = api_client.get('/tags/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [(tag['label'], tag['count']) for tag in response.data['results']] == \
+            [('bread', 2), ('fresh', 2), ('unused', 0)]
+
+    def test_counts_can_be_limited_to_a_model(self, api_client, tagged_products):
+        collection = baker.make(Collection)
+        TaggedItem.objects.create(content_object=collection, tag=Tag.objects.get(label='fresh'))
+
+        everything = api_client.get('/tags/?search=fresh')
+        products = api_client.get('/tags/?search=fresh&model=store.product')
+
+        assert everything.data['results'][0]['count'] == 3
+        assert products.data['results'][0]['count'] == 2
+
+    def test_unknown_model_returns_400(self, api_client):
+        assert api_client.get('/tags/?model=store.nothing').status_code == status.HTTP_400_BAD_REQUEST
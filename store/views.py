@@ -1,6 +1,7 @@
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse, JsonResponse
-from django.db.models import Count, QuerySet
+from django.db.models import Count, QuerySet, Prefetch, Sum, F, DecimalField
+from django.db.models import prefetch_related_objects
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth.models import AbstractUser, BaseUserManager
@@ -22,38 +23,76 @@ from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser,Dj
 
 from .serializers import ProductSerializer, CollectionSerializer, ReviewSerializer 
 from .serializers import CartSerializer, CartItemSerializer, AddCartItemSerializer
-from .serializers import UpdateCartItemSerializer, CustomerSerializer
+from .serializers import UpdateCartItemSerializer, BulkUpdateCartItemSerializer, CustomerSerializer
 from .serializers import OrderSerializer, CreateOrderSerializer, UpdateOrderSerializer
 from .serializers import ProductImageSerializer
 
 from .models import Product, Collection, OrderItem, Review, Cart, CartItem, Order, Customer
 from .models import ProductImage
-
-from .filters import ProductFilter
-from .pagination import ProductPagination
+from .fieldsets import SparseFieldsetMixin
+from .compiled import CompiledListMixin
+from .export import ExportMixin
+from .bulk import BulkModelMixin
+from .conditional import ConditionalGetMixin
+from .tagging import IncludeTagsMixin
+from .personalization import LikedByMeMixin
+from . import popularity
+
+from .filters import ProductFilter, ProductSearchFilter
+from .cache import get_or_compute, get_versions, product_list_key, product_detail_key, product_list_scope, product_detail_scope
+from .pagination import ProductPagination, ProductKeysetPagination
 from .permissions import IsAdminOrReadOnly, FullDjangoModelPermissions, ViewCustomerHistoryPermission
+from .signals.handlers import invalidate_now_and_on_commit
 
 # Create your views here.
 
 
+# Totals are calculated by the database instead of looping over the items
+# in the serializers: one aggregate per cart/order and one multiplication
+# per item, returned as annotations named 'total_price'.
+def items_total_price(prefix=''):
+    return Sum(
+        F(f'{prefix}quantity') * F(f'{prefix}product__unit_price'),
+        output_field=DecimalField(max_digits=16, decimal_places=2)
+    )
+
+
+def item_total_price():
+    return F('quantity') * F('product__unit_price')
+
+
+def prefetch_items_with_total(model):
+    return Prefetch(
+        'items',
+        queryset=model.objects.select_related('product').annotate(total_price=item_total_price())
+    )
+
+
 # Use ViewSets instead of two next classes ---------
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(LikedByMeMixin, ConditionalGetMixin, IncludeTagsMixin, SparseFieldsetMixin, CompiledListMixin, ExportMixin, BulkModelMixin, ModelViewSet):
     queryset = Product.objects.prefetch_related('images').all()
     serializer_class = ProductSerializer
     # Generic filtering ---------
     # Generic filtering using third party django-filter library
     # Add 'django_filters' to installed app. The name of the app is different
     # from the name of the module - 'django-filter'
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # ProductSearchFilter - full text search on Product.search_vector,
+    # falls back to SearchFilter (LIKE on search_fields) outside of Postgres
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
     # filterset_fields = ['collection_id', 'inventory', 'unit_price']
     filterset_class = ProductFilter
     search_fields = ['title', 'description']
-    ordering_fields = ['unit_price', 'last_update']
+    # popularity: ProductPopularity.score at the last refresh (store/popularity.py)
+    ordering_fields = ['unit_price', 'last_update', 'popularity']
     # Pagination: PageNumberPagination - page number, 
     # LimitOffsetPagination - Limit Offset pagination
     pagination_class = ProductPagination
+    # Keyset pagination: ?pagination=keyset for the first page, the
+    # next/previous links carry an opaque ?cursor=... afterwards.
+    keyset_pagination_class = ProductKeysetPagination
     
     permission_classes = [IsAdminOrReadOnly]
+    liked_by_me_actions = ('list', 'retrieve', 'top')
     
       
     # Filtering logic for predefined fields ---------
@@ -66,13 +105,102 @@ class ProductViewSet(ModelViewSet):
     #     return queryset
     
     
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'keyset' or 'cursor' in params:
+                self._paginator = self.keyset_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+    
     def get_serializer_context(self):
         return {'request': self.request}
     
+    # Catalog reads are served from the versioned cache in store/cache.py.
+    # Signal handlers bump the versions on every product change.
+    def list(self, request, *args, **kwargs):
+        data = get_or_compute(
+            product_list_key(request),
+            lambda: super(ProductViewSet, self).list(request, *args, **kwargs).data
+        )
+        return Response(data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        data = get_or_compute(
+            product_detail_key(request, kwargs['pk']),
+            lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs).data
+        )
+        return Response(data)
+    
+    # ETag from the versions of the response cache (store/conditional.py)
+    def get_version_scopes(self, request):
+        if self.action == 'retrieve':
+            return [product_detail_scope(self.kwargs['pk'])]
+        return [product_list_scope(request)]
+    
+    def get_etag_extra(self, request):
+        extra = super().get_etag_extra(request)
+        if 'popularity' in request.query_params.get('ordering', ''):
+            # A refresh reorders the products without touching last_update
+            version, = get_versions(popularity.VERSION_SCOPE)
+            extra += f'|popularity:{version}'
+        return extra
+    
+    # Most popular products, from the Redis sorted sets (store/popularity.py)
+    # ?collection_id= ranks inside one collection, ?limit= up to popularity.MAX_TOP_LIMIT
+    @action(detail=False)
+    def top(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', popularity.TOP_LIMIT)), popularity.MAX_TOP_LIMIT)
+            collection_id = request.query_params.get('collection_id')
+            collection_id = int(collection_id) if collection_id else None
+        except ValueError:
+            return Response({'error': 'limit and collection_id must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(limit, 1)
+        
+        ranking = popularity.top(limit, collection_id)
+        queryset = self.get_queryset()
+        if ranking:
+            products = queryset.in_bulk([product_id for product_id, _ in ranking])
+            scores = [(products[product_id], score) for product_id, score in ranking if product_id in products]
+        else:
+            # Rankings not built yet, same order from the last refresh
+            if collection_id is not None:
+                queryset = queryset.filter(collection_id=collection_id)
+            scores = [(product, product.popularity) for product in queryset.order_by('-popularity', '-id')[:limit]]
+        
+        data = self.get_serializer([product for product, _ in scores], many=True).data
+        return Response([{**item, 'popularity': score} for item, (_, score) in zip(data, scores)])
+    
     def destroy(self, request, *args, **kwargs):
         if OrderItem.objects.filter(product__id=kwargs['pk']).count() > 0:
             return Response({"error": "Product can not be deleted because is is associated with an order item."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
         return super().destroy(request, *args, **kwargs)
+    
+    # Bulk endpoint (store/bulk.py) ---------
+    def perform_bulk_save(self, serializer):
+        previous_collection_ids = [product.collection_id for product in serializer.instance or []]
+        products = serializer.save()
+        # Images of the response in one query
+        prefetch_related_objects(products, 'images')
+        # bulk_create/bulk_update send no post_save, invalidate like
+        # the signal handlers do
+        invalidate_now_and_on_commit(
+            product_ids=[product.pk for product in products],
+            collection_ids=previous_collection_ids + [product.collection_id for product in products]
+        )
+    
+    def get_bulk_destroy_errors(self, instances):
+        ordered = OrderItem.objects \
+            .filter(product_id__in=[product.pk for product in instances]) \
+            .values_list('product_id', flat=True) \
+            .distinct()
+        return {
+            product_id: 'Product can not be deleted because is is associated with an order item.'
+            for product_id in ordered
+        }
 
 # class ProductList(ListCreateAPIView):
     
@@ -107,14 +235,20 @@ class ProductViewSet(ModelViewSet):
   
   
 # Use ViewSets instead of two next classes ---------
-class CollectionViewSet(ModelViewSet):
-    queryset = Collection.objects.annotate(products_count=Count('products'))
+class CollectionViewSet(ConditionalGetMixin, SparseFieldsetMixin, ModelViewSet):
+    # products_count is a column, no join with the product table
+    queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
     
     permission_classes = [IsAdminOrReadOnly]
     
+    # ETag from the 'global' cache version (store/conditional.py), bumped
+    # by every product and collection change, products_count included
+    def get_version_scopes(self, request):
+        return ['global']
+    
     def destroy(self, request, *args, **kwargs):
-        if Product.objects.filter(collection__id=kwargs['pk']).count() > 0:
+        if Product.objects.filter(collection__id=kwargs['pk']).exists():
             return Response({"error": "The collection can not be deleted because it contains one or more product"}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
         return super().destroy(request, *args, **kwargs)
     
@@ -138,7 +272,7 @@ class CollectionViewSet(ModelViewSet):
 #         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(SparseFieldsetMixin, CompiledListMixin, ModelViewSet):
     serializer_class = ReviewSerializer
     
     def get_queryset(self) -> QuerySet:
@@ -156,11 +290,13 @@ class CartViewSet(CreateModelMixin,
                   RetrieveModelMixin,
                   DestroyModelMixin,
                   GenericViewSet):
-    queryset = Cart.objects.prefetch_related('items__product').all()
+    queryset = Cart.objects \
+        .prefetch_related(prefetch_items_with_total(CartItem)) \
+        .annotate(total_price=items_total_price('items__'))
     serializer_class = CartSerializer 
     
 
-class CartItemViewSet(ModelViewSet):
+class CartItemViewSet(BulkModelMixin, ModelViewSet):
     http_method_names  = [
         'get',
         'post',
@@ -172,6 +308,8 @@ class CartItemViewSet(ModelViewSet):
         if self.request.method == 'POST':
             return AddCartItemSerializer
         elif self.request.method == 'PATCH':
+            if self.action == 'bulk':
+                return BulkUpdateCartItemSerializer
             return UpdateCartItemSerializer
         return CartItemSerializer
     
@@ -182,7 +320,8 @@ class CartItemViewSet(ModelViewSet):
         
         return CartItem.objects\
             .filter(cart_id=self.kwargs['cart_pk'])\
-            .select_related('product')
+            .select_related('product')\
+            .annotate(total_price=item_total_price())
     
     
     
@@ -216,7 +355,7 @@ class CartItemViewSet(ModelViewSet):
 # 
 # Installation process may be changed, check the latest docks every time.
 
-class CustomerViewSet(ModelViewSet):
+class CustomerViewSet(SparseFieldsetMixin, ExportMixin, ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [IsAdminUser]
@@ -255,7 +394,9 @@ class CustomerViewSet(ModelViewSet):
         # if not request.user.is_authenticated:
         #     return Response(status=status.HTTP_401_UNAUTHORIZED)
         
-        customer = Customer.objects.get(user_id=request.user.id)
+        # Reverse one to one of the user, attached by CachedJWTAuthentication
+        # without a query (core/authentication.py)
+        customer = request.user.customer_id
   
         if self.request.method == 'GET':
             serializer = CustomerSerializer(customer)
@@ -270,7 +411,7 @@ class CustomerViewSet(ModelViewSet):
 # ORDER --------------------------------------------------------------------------------
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(SparseFieldsetMixin, CompiledListMixin, ExportMixin, ModelViewSet):
     http_method_names = [
         'get',
         'post',
@@ -291,16 +432,19 @@ class OrderViewSet(ModelViewSet):
     def get_queryset(self):
         self.request: Request
         user = self.request.user
+        # Items, their products and all totals in a constant number of queries
+        queryset = Order.objects \
+            .prefetch_related(prefetch_items_with_total(OrderItem)) \
+            .annotate(total_price=items_total_price('items__'))
         if user.is_staff: 
-            return Order.objects.all()
+            return queryset
       
         # queryset =  Order.objects.filter(customer_id=user.customer_id) # type: ignore
         # or another way to retrive customer_id from User 
 
-        customer_id = Customer.objects.only('id').get(user_id=user.id) # type: ignore
-        if not customer_id:
-            return Response(status=status.HTTP_404_NOT_FOUND)
-        queryset = Order.objects.filter(customer_id=customer_id)
+        # Attached to the user by CachedJWTAuthentication (core/authentication.py)
+        customer = user.customer_id # type: ignore
+        queryset = queryset.filter(customer_id=customer.id)
    
         return queryset
 
@@ -315,6 +459,9 @@ class OrderViewSet(ModelViewSet):
         serializer = CreateOrderSerializer(data=request.data, context={'user_id': self.request.user.id})
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
+        # Reload with the annotated/prefetched queryset, otherwise the
+        # response serializer runs one query per order item
+        order = self.get_queryset().get(pk=order.pk)
         serializer = OrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
         
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('tags', '0002_rename_taggetitem_taggeditem'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='taggeditem',
+            index=models.Index(fields=['content_type', 'object_id'], name='idx_taggeditem_object'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('tags', '0003_taggeditem_idx_taggeditem_object'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['label'], name='idx_tag_label'),
+        ),
+        migrations.AddIndex(
+            model_name='taggeditem',
+            index=models.Index(fields=['tag', 'content_type', 'object_id'], name='idx_taggeditem_tag_object'),
+        ),
+        migrations.AlterField(
+            model_name='taggeditem',
+            name='tag',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='tags.tag'),
+        ),
+    ]
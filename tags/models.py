@@ -2,7 +2,7 @@ from django.db import models
 # Allowing Generic relationships
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
-from django.db.models import QuerySet
+from django.db.models import Exists, OuterRef, QuerySet
 
 # Create your models here.
 
@@ -17,6 +17,35 @@ class TaggedItemManager(models.Manager):
             object_id=obj_id
         )
         return queryset
+    
+    def get_tags_for_many(self, obj_type: models.Model, obj_ids) -> dict:
+        '''Tags of many objects with one query, {object id: [Tag, ...]}.
+        Objects without tags are in the dict with an empty list.'''
+        obj_ids = list(obj_ids)
+        tags = {obj_id: [] for obj_id in obj_ids}
+        if not obj_ids:
+            return tags
+        # get_for_model() is cached by ContentTypeManager after the first call
+        content_type = ContentType.objects.get_for_model(obj_type)
+        queryset = TaggedItem.objects \
+            .select_related('tag') \
+            .filter(content_type=content_type, object_id__in=obj_ids) \
+            .order_by('object_id', 'tag__label', 'tag_id')
+        for item in queryset:
+            tags[item.object_id].append(item.tag)
+        return tags
+    
+    def tagged_with(self, obj_type: models.Model, labels) -> Exists:
+        '''EXISTS condition, true for objects of obj_type tagged with any
+        of the labels: Product.objects.filter(TaggedItem.objects.tagged_with(Product, ['a']))'''
+        content_type = ContentType.objects.get_for_model(obj_type)
+        return Exists(
+            TaggedItem.objects.filter(
+                tag__label__in=labels,
+                content_type=content_type,
+                object_id=OuterRef('pk')
+            )
+        )
 
 
 class Tag(models.Model):
@@ -25,13 +54,20 @@ class Tag(models.Model):
     def __str__(self):
         return f'{self.label}'
     
+    class Meta:
+        indexes = [
+            # Tags are looked up by label (?tags= filter, admin search)
+            models.Index(fields=['label'], name='idx_tag_label'),
+        ]
+    
 
 class TaggedItem(models.Model):
     # Add manager
     # Overriding attribute 'objects' to get custom manager class on its call.
     objects = TaggedItemManager()
     #  What tag applied to what object
-    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    # Indexed by idx_taggeditem_tag_object, tag_id is its first column
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
     # To identify object without explicitly import it.
     # 1. Type (product, video, article) of the object
     # 2. ID
@@ -43,4 +79,13 @@ class TaggedItem(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
     
+    class Meta:
+        indexes = [
+            # get_tags_for() / get_tags_for_many(), tags of an object
+            models.Index(fields=['content_type', 'object_id'], name='idx_taggeditem_object'),
+            # tagged_with(), objects with a tag. Index only scans for the
+            # EXISTS subqueries and the tag frequencies
+            models.Index(fields=['tag', 'content_type', 'object_id'], name='idx_taggeditem_tag_object'),
+        ]
+    
     
\ No newline at end of file
@@ -0,0 +1,12 @@
+from rest_framework import serializers
+
+from .models import Tag
+
+
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ['id', 'label', 'count']
+    
+    # Annotated by TagViewSet.get_queryset()
+    count = serializers.IntegerField(read_only=True)
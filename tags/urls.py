@@ -1,3 +1,10 @@
 from django.urls import path, include
+from rest_framework.routers import SimpleRouter
 
-urlpatterns = []
+from . import views
+
+# SimpleRouter, the API root of DefaultRouter would shadow the list at ""
+router = SimpleRouter()
+router.register('', views.TagViewSet, basename='tag')
+
+urlpatterns = router.urls
@@ -1,3 +1,44 @@
-from django.shortcuts import render
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import SearchFilter
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.viewsets import ReadOnlyModelViewSet
 
-# Create your views here.
+from .models import Tag
+from .serializers import TagSerializer
+
+
+class TagPagination(PageNumberPagination):
+    page_size = 100
+
+
+# Tag frequencies -----------------------------------------------------
+#   /tags/                       tags by number of tagged objects
+#   /tags/?model=store.product   only objects of that model are counted
+#   /tags/?search=bre            labels containing "bre"
+#
+# The counts are one GROUP BY over the tagged items, answered from the
+# idx_taggeditem_tag_object index without reading the table.
+class TagViewSet(ReadOnlyModelViewSet):
+    serializer_class = TagSerializer
+    pagination_class = TagPagination
+    filter_backends = [SearchFilter]
+    search_fields = ['label']
+    
+    def get_queryset(self):
+        condition = None
+        model = self.request.query_params.get('model')
+        if model:
+            condition = Q(taggeditem__content_type=self.get_content_type(model))
+        return Tag.objects \
+            .annotate(count=Count('taggeditem', filter=condition)) \
+            .order_by('-count', 'label', 'id')
+    
+    @staticmethod
+    def get_content_type(model):
+        try:
+            app_label, model_name = model.lower().split('.')
+            return ContentType.objects.get_by_natural_key(app_label, model_name)
+        except (ValueError, ContentType.DoesNotExist):
+            raise ValidationError({'model': f'Unknown model "{model}", use <app_label>.<model>.'})